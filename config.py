@@ -0,0 +1,33 @@
+FILEPATH_REQUESTS_XML = "./data/requestconfigs.xml"
+FILEPATH_LOG_DEBUG = "./data/cpn-api.log"
+FILEPATH_REQUEST_CACHE = "./data/requests_cache"
+FILEPATH_METRICS = "./data/cpn-api-metrics" # .json and .prom
+METRICS_FLUSH_INTERVAL = 10.0
+FILEPATH_TRACE = "" # e.g. "./data/cpn-api-trace.txt.gz" to record all messages for replay.py
+
+API_KEY_CLIMATIQ = ""
+CLIMATIQ_POOL_SIZE = 4
+CLIMATIQ_TIMEOUT = 10.0
+CLIMATIQ_RETRIES = 3
+CLIMATIQ_BACKOFF = 0.5
+
+OFFLINE_MODE = False
+FILEPATH_FACTOR_SNAPSHOT = "" # e.g. "./data/factor-snapshot.json", written by python -m cpn_api.snapshot
+
+CONNECTOR_PORT = 9999
+CONNECTOR_MULTI_CLIENT = False # serve several CPN-Tools connections at once 
+
+SOCEL_TAIL_EXPORT = False # append new csv lines to data/socel/socel_hinge.sqlite while the simulation runs, not
+                          # with LOG_SINK = "sqlite" writing the same file
+SOCEL_TAIL_INTERVAL = 5.0 # seconds
+
+LOG_SINK = "csv" # "csv" or "sqlite", sink of the rows sent with LOG_VIA_API in cpn-api.sml
+LOG_SINK_PATH_CSV = "./data/socel-csv"
+LOG_SINK_PATH_SQLITE = "./data/socel/socel_hinge.sqlite"
+LOG_SINK_INTERVAL = 1.0 # max. seconds a row is buffered
+LOG_SINK_MAX_ROWS = 10000 # buffered rows that trigger a flush
+
+PROFILE = False # cProfile the mainloop and the export, also enabled by the environment variable CPN_API_PROFILE=1
+PROFILE_SAMPLE_EVERY = 100 # profile every n-th message of the mainloop or call of the server
+PROFILE_TRACEMALLOC = False # tracemalloc snapshots at the export stages, or CPN_API_TRACEMALLOC=1
+PROFILE_DIR = "./data/profile" # <run>-<stage>.prof, <run>-<stage>.collapsed and <run>-stages.txt
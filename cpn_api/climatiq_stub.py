@@ -0,0 +1,118 @@
+# Local stand-in for the climatiq api, used by tests and benchmarks instead of https://beta4.api.climatiq.io.
+#
+# POST /estimate answers with co2e = factor * quantity, where quantity is the numeric value in "parameters" and the
+# factor is looked up by the "id" or "activity_id" of the "emission_factor". POST /batch answers a list of such
+# estimates with {"results": [...]}.
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _ClimatiqStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.stub.lock:
+            self.server.stub.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        json_body = json.loads(self.rfile.read(length) or b"{}")
+        with stub.lock:
+            stub.requests += 1
+            fail = stub._failures > 0
+            if fail:
+                stub._failures -= 1
+        if stub.delay:
+            threading.Event().wait(stub.delay)
+
+        if fail:
+            self._send_json(stub._failure_status, {"error": "stub_failure", "message": "Injected failure"},
+                            {"Retry-After": "0"})
+        elif self.path.endswith("/estimate"):
+            self._send_json(200, stub.estimate(json_body))
+        elif self.path.endswith("/batch"):
+            self._send_json(200, {"results": [stub.estimate(body) for body in json_body]})
+        else:
+            self._send_json(404, {"error": "not_found", "message": f"Unknown endpoint {self.path}"})
+
+
+class ClimatiqStub:
+    """
+    Threaded local http server mimicking the climatiq estimate endpoint. Use as context manager or call start/stop.
+    """
+
+    def __init__(self, factors=None, default_factor=1.0, port=0, delay=0.0):
+        """
+        :param factors: dict of emission factor id or activity_id -> co2e factor
+        :param default_factor: factor for unknown emission factors
+        :param port: port to bind to on localhost, 0 picks a free port
+        :param delay: artificial latency per request in seconds
+        """
+        self.factors = factors or {}
+        self.default_factor = default_factor
+        self.delay = delay
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._failures = 0
+        self._failure_status = 429
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _ClimatiqStubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count, status=429):
+        """
+        Answer the next count requests with the given error status.
+        """
+        with self.lock:
+            self._failures = count
+            self._failure_status = status
+
+    def estimate(self, json_body):
+        emission_factor = json_body.get("emission_factor", {})
+        key = emission_factor.get("id", emission_factor.get("activity_id"))
+        factor = self.factors.get(key, self.default_factor)
+        quantities = [value for value in json_body.get("parameters", {}).values()
+                      if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        quantity = quantities[0] if quantities else 1
+        return {"co2e": factor * quantity, "co2e_unit": "kg", "emission_factor": emission_factor}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,33 +1,276 @@
 import logging
-from requests_cache import CachedSession, NEVER_EXPIRE
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from time import perf_counter
 
 from cpn_api.configurator import *
-from config import API_KEY_CLIMATIQ, FILEPATH_REQUEST_CACHE, OFFLINE_MODE
+from cpn_api.metrics import metrics
+from cpn_api.session import session_manager
+from cpn_api.snapshot import load_configured_snapshot
+from config import API_KEY_CLIMATIQ, OFFLINE_MODE
 
 
 logger = logging.getLogger(__name__)
 
+FACTOR_MEMO_MAXSIZE = 1024
+CLIMATIQ_BATCH_SIZE = 100 # max. number of estimates per call of the climatiq batch endpoint
+
 # Maby replace with https://stackoverflow.com/questions/28918086/does-requests-cache-automatically-update-cache-on-update-of-info
 
+
+class FactorMemo:
+    """
+    Bounded LRU memo of request_id -> emission factor for api requests. Each factor is stored together with the
+    registry entry it was resolved from, so that a changed entry in the config xml invalidates the factor.
+    """
+
+    def __init__(self, maxsize=FACTOR_MEMO_MAXSIZE):
+        self.maxsize = maxsize
+        self._factors = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, request_id, signature):
+        """
+        :param request_id:
+        :param signature: current registry entry of the request, see RequestRegistry.request_signature
+        :return: factor or None if not memoized or memoized for an outdated entry
+        """
+        with self._lock:
+            item = self._factors.get(request_id)
+            if item is not None:
+                if item[0] == signature:
+                    self._factors.move_to_end(request_id)
+                    self.hits += 1
+                    return item[1]
+                del self._factors[request_id]
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, request_id, signature, factor):
+        with self._lock:
+            self._factors[request_id] = (signature, factor)
+            self._factors.move_to_end(request_id)
+            while len(self._factors) > self.maxsize:
+                self._factors.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._factors.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._factors),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+factor_memo = FactorMemo()
+factor_snapshot = load_configured_snapshot() # FactorSnapshot or None, see snapshot.py
+
+
+def resolve_factor(request_id: str, pending: dict = None):
+    """
+    Get the CO2e factor (CO2e for a quantity of 1) of the given id from the first tier that knows it: a loaded factor
+    snapshot, a default value in the config-xml, 0.0 in OFFLINE_MODE and finally an api request in the config-xml.
+    Throws an error if no tier knows the id. Used by get_co2e, get_co2e_batch and prefetch_factors.
+    :param request_id:
+    :param pending: dict of request_id -> registry signature; api requests that are not memoized are added to it
+        instead of calling the climatiq api, e.g. to resolve them with one batch call
+    :return: CO2e factor, None if the request was added to pending
+    """
+    if factor_snapshot is not None:
+        factor = factor_snapshot.get(request_id)
+        metrics.count_tier("snapshot", factor is not None)
+        if factor is not None:
+            return factor
+    is_default = check_default_entry(request_id)
+    metrics.count_tier("default", is_default)
+    if is_default:
+        return read_default_entry(request_id)
+    if OFFLINE_MODE:
+        return 0.0
+    if check_request_entry(request_id):
+        if pending is None:
+            return get_request_factor(request_id)
+        signature = registry.request_signature(request_id)
+        factor = factor_memo.get(request_id, signature)
+        metrics.count_tier("memo", factor is not None)
+        if factor is None:
+            pending[request_id] = signature
+        return factor
+    raise ValueError(f"No CO2e value found for request_id {request_id}")
+
+
 def get_co2e(request_id: str, quantity: float):
     """
-    Get the CO2 value for the given quantity and id by first checking the config-xml for an api request with the
-    given id, then checking for a default value in the xml and finally throw an error.
+    Get the CO2 value for the given quantity and id with the tiers of resolve_factor.
     """
     logger.debug(f"get_co2e: {request_id} [x{quantity}]")
-    factor = None
-    if check_default_entry(request_id):
-        factor = read_default_entry(request_id)
-        return factor * quantity
-    elif OFFLINE_MODE:
-        return 0
-    elif check_request_entry(request_id):
+    start = perf_counter()
+    try:
+        return resolve_factor(request_id) * quantity
+    finally:
+        metrics.observe("resolve", request_id, perf_counter() - start)
+
+
+def get_request_factor(request_id: str):
+    """
+    Get the CO2e factor (CO2e for a quantity of 1) of the api request with the given id. Factors are memoized per
+    request id, so only the first call per id (or after the entry changed) calls the climatiq api.
+    :param request_id:
+    :return: CO2e factor
+    """
+    signature = registry.request_signature(request_id)
+    factor = factor_memo.get(request_id, signature)
+    metrics.count_tier("memo", factor is not None)
+    if factor is None:
         endpoint, json_body, quantity_name = get_request_entry(request_id)
         json_body["parameters"][quantity_name] = 1
         factor = get_co2e_by_climatiq_call(endpoint, json_body)
-        return factor * quantity
-    
-    raise ValueError(f"No CO2e value found for request_id {request_id}")
+        factor_memo.put(request_id, signature, factor)
+    return factor
+
+
+def get_request_factor_details(request_id: str):
+    """
+    Resolve the factor of the api request with the given id together with its unit and the data_version of the
+    emission factor, as stored in a factor snapshot. Not memoized.
+    :param request_id:
+    :return: dict with factor, unit and data_version
+    """
+    endpoint, json_body, quantity_name = get_request_entry(request_id)
+    json_body["parameters"][quantity_name] = 1
+    response = _climatiq_estimate(endpoint, json_body)
+    data_version = response.get("emission_factor", {}).get("data_version",
+                                                            json_body["emission_factor"].get("data_version"))
+    return {"factor": response["co2e"], "unit": response["co2e_unit"], "data_version": data_version}
+
+
+def prefetch_factors(request_ids=None, max_workers=None):
+    """
+    Resolve the factors of all configured request ids in parallel, so that the factor memo is warm before a
+    simulation connects. Errors are collected per id instead of being raised.
+    :param request_ids: ids to resolve, defaults to all ids in the config xml
+    :param max_workers: max. number of concurrent climatiq calls, defaults to the pool size of the http session
+    :return: dict of request_id -> exception for all ids that could not be resolved
+    """
+    if request_ids is None:
+        request_ids = get_list_of_request_ids()
+    if max_workers is None:
+        max_workers = session_manager.pool_size
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch") as executor:
+        futures = {executor.submit(resolve_factor, request_id): request_id
+                   for request_id in dict.fromkeys(request_ids)}
+        for future in as_completed(futures):
+            request_id = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failures[request_id] = e
+                logger.error(f"prefetch: {request_id} failed: {e}")
+
+    logger.info(f"prefetch: {len(futures) - len(failures)} of {len(futures)} request ids resolved")
+    return failures
+
+
+def get_co2e_batch(calls: list):
+    """
+    Get the CO2 values for a list of (request_id, quantity) pairs like get_co2e. Factors of api requests that are not
+    memoized yet are resolved together with calls to the climatiq batch endpoint instead of one call per id.
+    The resolve latency is observed once per distinct request id, for the ids resolved by the batch endpoint
+    including the time of the batch calls.
+    :param calls: list of (request_id, quantity)
+    :return: list of CO2e values in the order of calls
+    """
+    logger.debug(f"get_co2e_batch: {calls}")
+    factors = {}
+    pending = {}
+    seconds = {}
+    for request_id, _ in calls:
+        if request_id in seconds:
+            continue
+        start = perf_counter()
+        factor = resolve_factor(request_id, pending)
+        seconds[request_id] = perf_counter() - start
+        if factor is not None:
+            factors[request_id] = factor
+
+    if pending:
+        start = perf_counter()
+        factors.update(_resolve_request_factors(pending))
+        for request_id in pending:
+            seconds[request_id] += perf_counter() - start
+    for request_id, elapsed in seconds.items():
+        metrics.observe("resolve", request_id, elapsed)
+    return [factors[request_id] * quantity for request_id, quantity in calls]
+
+
+def get_co2e_factors(request_ids):
+    """
+    Get the CO2e factors (CO2e for a quantity of 1) of several request ids with the tiers of get_co2e, resolving each
+    distinct id once. Used to enrich the quantities of a deferred simulation run, see misc/enrich_co2e.py.
+    :param request_ids: iterable of request ids, duplicates are allowed
+    :return: dict of request_id -> CO2e factor
+    """
+    request_ids = list(dict.fromkeys(request_ids))
+    return dict(zip(request_ids, get_co2e_batch([(request_id, 1.0) for request_id in request_ids])))
+
+
+def _resolve_request_factors(pending: dict):
+    """
+    Resolve and memoize the factors of several api requests, grouped by endpoint.
+    :param pending: dict of request_id -> registry signature
+    :return: dict of request_id -> CO2e factor
+    """
+    by_endpoint = {}
+    for request_id in pending:
+        endpoint, json_body, quantity_name = get_request_entry(request_id)
+        json_body["parameters"][quantity_name] = 1
+        by_endpoint.setdefault(endpoint, []).append((request_id, json_body))
+
+    factors = {}
+    for endpoint, entries in by_endpoint.items():
+        if len(entries) == 1 or not endpoint.endswith("/estimate"):
+            for request_id, json_body in entries:
+                factors[request_id] = get_co2e_by_climatiq_call(endpoint, json_body)
+            continue
+        batch_url = endpoint[:-len("/estimate")] + "/batch"
+        for i in range(0, len(entries), CLIMATIQ_BATCH_SIZE):
+            chunk = entries[i:i + CLIMATIQ_BATCH_SIZE]
+            co2e_values = get_co2e_by_climatiq_batch_call(batch_url, [json_body for _, json_body in chunk],
+                                                          [request_id for request_id, _ in chunk])
+            for (request_id, _), co2e in zip(chunk, co2e_values):
+                factors[request_id] = co2e
+
+    for request_id, factor in factors.items():
+        factor_memo.put(request_id, pending[request_id], factor)
+    return factors
+
+
+def _post_counted(url, json_body, headers):
+    """
+    Post to the climatiq api and count the http cache and network tiers.
+    :return: json response
+    """
+    response = session_manager.post(url, json=json_body, headers=headers)
+    from_cache = getattr(response, "from_cache", False)
+    metrics.count_tier("http_cache", from_cache)
+    if not from_cache:
+        metrics.count_tier("network", response.ok)
+    return response.json()
 
 
 def get_co2e_by_climatiq_call(url: str, json_body: dict):
@@ -37,21 +280,16 @@ def get_co2e_by_climatiq_call(url: str, json_body: dict):
     :param json_body: For parameters, see https://www.climatiq.io/docs/api-reference/models/parameters and for emission_factor, see https://www.climatiq.io/docs/api-reference/models/selector
     :return: CO2e value
     """
-    session = CachedSession(
-        FILEPATH_REQUEST_CACHE,
-        backend='sqlite',
-        serializer='json',
-        allowable_codes=(200, 443, 304),
-        allowable_methods=('GET', 'POST', 'HEAD'),
-        cache_control=False,
-        ignored_parameters=('cache-control', 'expires', 'set-cookie', 'etag', 'last-modified'),
-        expire_after = NEVER_EXPIRE
-    )
-    
+    return _climatiq_estimate(url, json_body)["co2e"]
+
+
+def _climatiq_estimate(url: str, json_body: dict):
+    """
+    Call the climatiq estimate api.
+    :return: json response, raise a ValueError if it holds an error
+    """
     authorization_headers = {"Authorization": f"Bearer: {API_KEY_CLIMATIQ}"}
-    response = session.post(url, json=json_body, headers=authorization_headers).json()
-    
-    session.close()
+    response = _post_counted(url, json_body, authorization_headers)
     
     # Check if the response is valid
     if "error" in response:
@@ -63,4 +301,35 @@ def get_co2e_by_climatiq_call(url: str, json_body: dict):
         #TODO: Unit check
 
     logger.info(f"Climatiq: {co2e} [{co2e_unit}]: {json_body} --> {response}")
-    return co2e
+    return response
+
+
+
+def get_co2e_by_climatiq_batch_call(url: str, json_bodies: list, request_ids: list = None):
+    """
+    Get several CO2 values with one call of the climatiq batch api.
+    :param url: batch endpoint, e.g. https://beta4.api.climatiq.io/batch
+    :param json_bodies: list of json bodies as for get_co2e_by_climatiq_call
+    :param request_ids: request ids of the json bodies, named in the error if results are missing
+    :return: list of CO2e values in the order of json_bodies
+    """
+    authorization_headers = {"Authorization": f"Bearer: {API_KEY_CLIMATIQ}"}
+    response = _post_counted(url, json_bodies, authorization_headers)
+
+    if "error" in response:
+        logger.error(f"Climatiq: {response}")
+        raise ValueError(f"Error in response: {response['message']}")
+    if len(response["results"]) != len(json_bodies):
+        missing = (request_ids or [f"#{i}" for i in range(len(json_bodies))])[len(response["results"]):]
+        logger.error(f"Climatiq: {len(response['results'])} results for {len(json_bodies)} estimates")
+        raise ValueError(f"No results in response for request ids {', '.join(missing)}")
+
+    co2e_values = []
+    for json_body, result in zip(json_bodies, response["results"]):
+        if "error" in result:
+            logger.error(f"Climatiq: {result}")
+            raise ValueError(f"Error in response: {result['message']}")
+        #TODO: Unit check
+        logger.info(f"Climatiq: {result['co2e']} [{result['co2e_unit']}]: {json_body} --> {result}")
+        co2e_values.append(result["co2e"])
+    return co2e_values
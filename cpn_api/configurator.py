@@ -10,68 +10,250 @@
 #         ...
 #     </Requests>
 # </Configuration>
+#
+# Lookups are served by an in-memory RequestRegistry, which only parses the file again if it changed on disk.
+# Writes go to a temporary file that replaces the config xml file, so readers never see a partial file. Several
+# changes can be applied to one in-memory tree and written once with `with transaction():` or import_entries.
 
+import csv
+import json
 import os
+import threading
 import xml.etree.ElementTree as ET
+from contextlib import contextmanager
 import config
 import logging
 
 
 logger = logging.getLogger(__name__)
-   
+
+
 def _ceckfix_requests(root):
     requests = root.find('Requests')
     if requests is None:
         requests = ET.SubElement(root, "Requests")
     return requests
-        
+
+
+class RequestRegistry:
+    """
+    In-memory index of the config xml file. The file is parsed once into dicts keyed by request id and only parsed
+    again if its modification time or size changes.
+    """
+
+    def __init__(self, filepath=None):
+        """
+        :param filepath: path of the config xml file, defaults to config.FILEPATH_REQUESTS_XML
+        """
+        self.filepath = filepath
+        self._stamp = None
+        self._api_requests = {}
+        self._defaults = {}
+        self._lock = threading.Lock()
+
+    def _path(self):
+        return self.filepath if self.filepath is not None else config.FILEPATH_REQUESTS_XML
+
+    def invalidate(self):
+        """
+        Force a reload on the next lookup, e.g. after the file was written by this process.
+        """
+        with self._lock:
+            self._stamp = None
+
+    def refresh(self):
+        """
+        Reload the config xml file if it changed since the last load.
+        :return: True if the file was (re)loaded, False otherwise
+        """
+        path = self._path()
+        stat = os.stat(path)
+        stamp = (path, stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+
+        with self._lock:
+            if stamp == self._stamp:
+                return False
+            root = ET.parse(path).getroot()
+            requests = _ceckfix_requests(root)
+
+            api_requests = {}
+            for api_request in requests.findall('./APIRequest'):
+                request_id = api_request.attrib['id']
+                if request_id in api_requests:
+                    continue
+                endpoint = api_request.find('Endpoint').text
+                parameters = tuple((param.tag, param.text) for param in api_request.find('Parameters'))
+                factors = tuple((factor.tag, factor.text) for factor in api_request.find('Emission_factor'))
+                quantity_name = api_request.attrib['quantity_name']
+                api_requests[request_id] = (endpoint, parameters, factors, quantity_name)
+
+            defaults = {}
+            for default in requests.findall('./Default'):
+                defaults.setdefault(default.attrib['id'], default.text)
+
+            self._api_requests = api_requests
+            self._defaults = defaults
+            self._stamp = stamp
+
+        logger.debug(f"XML: registry loaded {len(api_requests)} requests and {len(defaults)} defaults from {path}")
+        return True
+
+    def has_request(self, request_id):
+        self.refresh()
+        return request_id in self._api_requests
+
+    def request_signature(self, request_id):
+        """
+        Get the immutable (endpoint, parameters, factors, quantity_name) tuple of an api request. The tuple compares
+        equal as long as the entry in the config xml file is unchanged.
+        :param request_id:
+        :return: tuple or None if no request is found
+        """
+        self.refresh()
+        return self._api_requests.get(request_id)
+
+    def get_request(self, request_id):
+        """
+        :param request_id:
+        :return: endpoint, json_body, quantity_name; json_body is a fresh dict on every call
+        """
+        entry = self.request_signature(request_id)
+        if entry is None:
+            raise ValueError(f'No APIRequest found with id: {request_id}')
+
+        endpoint, parameters, factors, quantity_name = entry
+        json_body = {
+            "emission_factor": dict(factors),
+            "parameters": dict(parameters)
+        }
+        json_body["parameters"][quantity_name] = float(json_body["parameters"][quantity_name])
+        return endpoint, json_body, quantity_name
+
+    def has_default(self, request_id):
+        self.refresh()
+        return request_id in self._defaults
+
+    def get_default(self, request_id):
+        self.refresh()
+        if request_id not in self._defaults:
+            raise ValueError(f'No Default found with id: {request_id}')
+        return float(self._defaults[request_id])
+
+    def request_ids(self):
+        """
+        :return: list of all api request ids followed by all default ids
+        """
+        self.refresh()
+        return list(self._api_requests) + list(self._defaults)
+
+
+registry = RequestRegistry()
+
+_write_lock = threading.RLock()
+_transaction = threading.local()
+
+
+def _write_tree(root):
+    """
+    Write the tree to a temporary file and replace the config xml file with it.
+    """
+    path = config.FILEPATH_REQUESTS_XML
+    path_tmp = path + ".tmp"
+    with open(path_tmp, "wb") as file:
+        ET.ElementTree(root).write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path_tmp, path)
+    registry.invalidate()
+
+
+def _changed_root():
+    """
+    :return: root of the tree of the running transaction, which will be written at its end
+    """
+    _transaction.changed = True
+    return _transaction.root
+
+
+@contextmanager
+def transaction():
+    """
+    Apply all adds and removals inside the with block to one in-memory tree and write the config xml file once at the
+    end. Nothing is written if the block raises. Nested transactions join the outer one. Lookups inside the block
+    still see the file of before the transaction.
+    """
+    if getattr(_transaction, "root", None) is not None:
+        yield
+        return
+    with _write_lock:
+        if os.path.exists(config.FILEPATH_REQUESTS_XML):
+            _transaction.root = ET.parse(config.FILEPATH_REQUESTS_XML).getroot()
+        else:
+            _transaction.root = ET.Element("Configuration")
+        _transaction.changed = False
+        try:
+            yield
+            if _transaction.changed:
+                _write_tree(_transaction.root)
+                logger.debug(f"XML: transaction written.")
+        finally:
+            _transaction.root = None
+
+
+def _remove_entries(requests, tag, request_id):
+    """
+    Remove all entries of a tag (APIRequest or Default) with the given id.
+    :return: number of removed entries
+    """
+    existing = requests.findall(f'./{tag}[@id="{request_id}"]')
+    for entry in existing:
+        requests.remove(entry)
+    return len(existing)
+
 
 def clear_requests():
     """
     Clear the requests.xml file.
     :return:
     """
-    root = ET.Element("Configuration")
-    requests = _ceckfix_requests(root)
-    tree = ET.ElementTree(root)
-    with open(config.FILEPATH_REQUESTS_XML, "wb") as file:
-        tree.write(file)
+    with transaction():
+        root = _changed_root()
+        for child in list(root):
+            root.remove(child)
+        _ceckfix_requests(root)
     logger.debug(f"XML: Requests cleared.")
         
         
-def add_request_climatiq(request_id, param_data, factor_data, quantity_name):
+def add_request_climatiq(request_id, param_data, factor_data, quantity_name,
+                         endpoint="https://beta4.api.climatiq.io/estimate"):
     """
     Add a new or override existing api request entry to the config xml file based on request id.
     :param param_data:
     :param factor_data:
     :param quantity_name:
+    :param endpoint: url of the climatiq estimate endpoint
     :return:
     """
-    root = ET.parse(config.FILEPATH_REQUESTS_XML).getroot()
-    requests = _ceckfix_requests(root)
-
-    exisiting_request = root.findall(f'./Requests/APIRequest[@id="{request_id}"]')
-    for request in exisiting_request if exisiting_request is not None else []:
-        requests.remove(request)
+    with transaction():
+        requests = _ceckfix_requests(_changed_root())
+        _remove_entries(requests, "APIRequest", request_id)
 
-    api_request = ET.SubElement(requests, "APIRequest", id=request_id, quantity_name=quantity_name)
+        api_request = ET.SubElement(requests, "APIRequest", id=request_id, quantity_name=quantity_name)
 
-    endpoint = ET.SubElement(api_request, "Endpoint")
-    endpoint.text = "https://beta4.api.climatiq.io/estimate"
+        endpoint_element = ET.SubElement(api_request, "Endpoint")
+        endpoint_element.text = endpoint
 
-    parameters = ET.SubElement(api_request, "Parameters")
-    for param_name, param_value in param_data.items():
-        param = ET.SubElement(parameters, param_name)
-        param.text = str(param_value)
+        parameters = ET.SubElement(api_request, "Parameters")
+        for param_name, param_value in param_data.items():
+            param = ET.SubElement(parameters, param_name)
+            param.text = str(param_value)
 
-    factors = ET.SubElement(api_request, "Emission_factor")
-    for factor_name, factor_value in factor_data.items():
-        factor = ET.SubElement(factors, factor_name)
-        factor.text = str(factor_value)
-
-    tree = ET.ElementTree(root)
-    with open(config.FILEPATH_REQUESTS_XML, "wb") as file:
-        tree.write(file)
+        factors = ET.SubElement(api_request, "Emission_factor")
+        for factor_name, factor_value in factor_data.items():
+            factor = ET.SubElement(factors, factor_name)
+            factor.text = str(factor_value)
         
     logger.debug(f"XML: Added Climatiq request {request_id}.")
 
@@ -82,12 +264,7 @@ def check_request_entry(request_id):
     :param request_id:
     :return: True if the request exists, False otherwise
     """
-    tree = ET.parse(config.FILEPATH_REQUESTS_XML)
-    root = tree.getroot() 
-    requests = _ceckfix_requests(root)
-
-    api_request = root.find(f'./Requests/APIRequest[@id="{request_id}"]')
-    is_found = api_request is not None
+    is_found = registry.has_request(request_id)
     
     logger.debug(f"XML: check_request_entry {request_id} -> {is_found}")
     return is_found
@@ -99,25 +276,7 @@ def get_request_entry(request_id):
     :param request_id:
     :return:
     """
-    tree = ET.parse(config.FILEPATH_REQUESTS_XML)
-    root = tree.getroot()
-    requests = _ceckfix_requests(root)
-
-    api_request = root.find(f'./Requests/APIRequest[@id="{request_id}"]')
-    if api_request is None:
-        raise ValueError(f'No APIRequest found with id: {request_id}')
-
-    endpoint = api_request.find('Endpoint').text
-    parameters = {param.tag: param.text for param in api_request.find('Parameters')}
-    factors = {factor.tag: factor.text for factor in api_request.find('Emission_factor')}
-    quantity_name = api_request.attrib['quantity_name']
-
-    json_body = {
-        "emission_factor": factors,
-        "parameters": parameters
-    }
-    
-    json_body["parameters"][quantity_name] = float(json_body["parameters"][quantity_name])
+    endpoint, json_body, quantity_name = registry.get_request(request_id)
     
     logger.debug(f"XML: get_request_entry {request_id} -> {json_body}")
     return endpoint, json_body, quantity_name
@@ -127,15 +286,7 @@ def get_list_of_request_ids():
     Get a list of all request ids in the config xml file.
     :return: list of request ids
     """
-    tree = ET.parse(config.FILEPATH_REQUESTS_XML)
-    root = tree.getroot()
-    requests = _ceckfix_requests(root)
-
-    api_requests = requests.findall('./APIRequest')
-    request_ids = [api_request.attrib['id'] for api_request in api_requests]
-    
-    default_requests = requests.findall('./Default')
-    request_ids += [default_request.attrib['id'] for default_request in default_requests]
+    request_ids = registry.request_ids()
 
     logger.debug(f"XML: get_list_of_request_ids -> {request_ids}")
     return request_ids
@@ -147,19 +298,12 @@ def add_default_entry(request_id, co2e_value_factor):
     :param co2e_value_factor: factor to multiply the quantity with to get the CO2e value 
     :return:
     """
-    root = ET.parse(config.FILEPATH_REQUESTS_XML).getroot()
-    requests = _ceckfix_requests(root)
+    with transaction():
+        requests = _ceckfix_requests(_changed_root())
+        _remove_entries(requests, "Default", request_id)
 
-    exisiting_request = root.findall(f'./Requests/Default[@id="{request_id}"]')
-    for request in exisiting_request if exisiting_request is not None else []:
-        requests.remove(request)
-
-    default = ET.SubElement(requests, "Default", id=request_id)
-    default.text = str(co2e_value_factor)
-
-    tree = ET.ElementTree(root)
-    with open(config.FILEPATH_REQUESTS_XML, "wb") as file:
-        tree.write(file)
+        default = ET.SubElement(requests, "Default", id=request_id)
+        default.text = str(co2e_value_factor)
         
     logger.debug(f"XML: Added default entry {request_id}.")
 
@@ -169,12 +313,7 @@ def check_default_entry(request_id):
     :param request_id:
     :return: True if the default entry exists, False otherwise
     """
-    tree = ET.parse(config.FILEPATH_REQUESTS_XML)
-    root = tree.getroot()
-    requests = _ceckfix_requests(root)
-
-    default = root.find(f'./Requests/Default[@id="{request_id}"]')
-    is_found = default is not None
+    is_found = registry.has_default(request_id)
     
     logger.debug(f"XML: check_default_entry {request_id} -> {is_found}")
     return is_found
@@ -186,15 +325,91 @@ def read_default_entry(request_id):
     :param request_id:
     :return: CO2e value
     """
-    tree = ET.parse(config.FILEPATH_REQUESTS_XML)
-    root = tree.getroot()
-    requests = _ceckfix_requests(root)
-
-    default = root.find(f'./Requests/Default[@id="{request_id}"]')
-    if default is None:
-        raise ValueError(f'No Default found with id: {request_id}')
-
-    co2e = float(default.text)
+    co2e = registry.get_default(request_id)
     
     logger.debug(f"XML: read_default_entry {request_id} -> {co2e}")
-    return co2e
\ No newline at end of file
+    return co2e
+
+
+def remove_request_entry(request_id):
+    """
+    Remove the api request with the given id from the config xml file.
+    :param request_id:
+    :return: True if a request was removed, False otherwise
+    """
+    with transaction():
+        is_removed = _remove_entries(_ceckfix_requests(_changed_root()), "APIRequest", request_id) > 0
+
+    logger.debug(f"XML: remove_request_entry {request_id} -> {is_removed}")
+    return is_removed
+
+
+def remove_default_entry(request_id):
+    """
+    Remove the default entry with the given id from the config xml file.
+    :param request_id:
+    :return: True if a default entry was removed, False otherwise
+    """
+    with transaction():
+        is_removed = _remove_entries(_ceckfix_requests(_changed_root()), "Default", request_id) > 0
+
+    logger.debug(f"XML: remove_default_entry {request_id} -> {is_removed}")
+    return is_removed
+
+
+def apply_entries(entries):
+    """
+    Apply several entries in one transaction. Each entry is a dict with an "id" and either
+    - "default": CO2e factor, to add a default entry,
+    - "parameters", "emission_factor", "quantity_name" and optionally "endpoint", to add a climatiq request, or
+    - "remove": true, to remove the request and the default entry with this id.
+    :param entries: iterable of dicts
+    :return: number of applied entries
+    """
+    count = 0
+    with transaction():
+        for entry in entries:
+            request_id = entry["id"]
+            if entry.get("remove"):
+                remove_request_entry(request_id)
+                remove_default_entry(request_id)
+            elif entry.get("default") not in (None, ""):
+                add_default_entry(request_id, float(entry["default"]))
+            else:
+                kwargs = {"endpoint": entry["endpoint"]} if entry.get("endpoint") else {}
+                add_request_climatiq(request_id, entry["parameters"], entry["emission_factor"],
+                                     entry["quantity_name"], **kwargs)
+            count += 1
+
+    logger.debug(f"XML: applied {count} entries.")
+    return count
+
+
+def _read_csv_entries(path):
+    """
+    Read entries from a csv file with the columns id, default, remove, quantity_name, endpoint, parameters and
+    emission_factor. parameters and emission_factor hold json objects, unused cells stay empty.
+    """
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            entry = {key: value for key, value in row.items() if value not in (None, "")}
+            entry["remove"] = entry.get("remove", "").lower() in ("1", "true", "yes")
+            for key in ("parameters", "emission_factor"):
+                if key in entry:
+                    entry[key] = json.loads(entry[key])
+            yield entry
+
+
+def import_entries(path):
+    """
+    Import entries (see apply_entries) from a json file holding a list of entries or from a csv file (see
+    _read_csv_entries) and write the config xml file once.
+    :param path: path of a .json or .csv file
+    :return: number of applied entries
+    """
+    if path.endswith(".csv"):
+        entries = list(_read_csv_entries(path))
+    else:
+        with open(path) as file:
+            entries = json.load(file)
+    return apply_entries(entries)
@@ -11,59 +11,187 @@
 
 import atexit
 import logging
+from time import perf_counter
 
 from cpn_api.pycpn.pyCPN import PyCPN
 from cpn_api.pycpn.pyCPNEncodeDecode import stringEncode, stringDecode
-from cpn_api.collector import get_co2e
+from cpn_api.collector import get_co2e, get_co2e_batch, prefetch_factors
+from cpn_api.log_sink import create_log_sink
+from cpn_api.metrics import metrics
+from cpn_api import profiling
+from cpn_api.session import session_manager
+from cpn_api.trace import TraceRecorder
+import config
 
 
 logger = logging.getLogger(__name__)
 
-def mainloop():
+
+def handle_call(msg):
+    """
+    Handle a message of the form: {"call_v1"}%{request_id}%{quantity}
+    or simplified: call(request_id, quantity)
+    :return: response string, empty if the quantity is not a number
+    """
+    _, request_id, quantity = msg.split('%')
+    try:
+        quantity = float(quantity) #TODO: convert to float
+    except:
+        return ""
+    return str(get_co2e(str(request_id), quantity))
+
+
+def handle_call_batch(msg):
+    """
+    Handle a message of the form: {"call_batch_v1"}%{request_id_1}%{quantity_1}%{request_id_2}%{quantity_2}...
+    or simplified: call_batch([(request_id_1, quantity_1), (request_id_2, quantity_2), ...])
+    :return: responses of all calls joined by %, a response is empty if its quantity is not a number or missing
+    """
+    fields = msg.split('%')[1:]
+    if len(fields) % 2:
+        logger.warning(f"call_batch_v1: no quantity for the last request id {fields[-1]}")
+        fields.append("")
+    calls = []
+    valid = []
+    for request_id, quantity in zip(fields[0::2], fields[1::2]):
+        try:
+            calls.append((request_id, float(quantity)))
+            valid.append(True)
+        except ValueError:
+            valid.append(False)
+    co2e_values = iter(get_co2e_batch(calls))
+    return '%'.join(str(next(co2e_values)) if is_valid else "" for is_valid in valid)
+
+
+log_sink = None # created with the first log_v1 message, see log_sink.py
+logged_rows = 0
+
+
+def handle_log(msg):
+    """
+    Handle a message of the form: {"log_v1"}%{table}%{row}, where row holds the values joined by ;
+    The row is buffered by the log sink, no response is sent.
+    """
+    global log_sink, logged_rows
+    _, table, row = msg.split('%', 2)
+    if log_sink is None:
+        log_sink = create_log_sink()
+    log_sink.add(table, row)
+    logged_rows += 1
+
+
+def flush_log_sink():
+    """
+    Write all buffered log rows, e.g. when one of several clients sends close.
+    """
+    if log_sink is not None:
+        log_sink.flush()
+
+
+def close_log_sink():
+    """
+    Flush and close the log sink, if any.
+    """
+    global log_sink
+    if log_sink is not None:
+        log_sink.close()
+        log_sink = None
+
+
+def message_label(msg):
+    """
+    :return: request id of a call_v1 message, else the message type, used as label of metrics
+    """
+    if msg.startswith('call_v1%'):
+        return msg.split('%')[1]
+    return msg.split('%')[0]
+
+
+def warm_up():
+    """
+    Resolve the factors of all configured request ids and report the ids that failed, before CPN connects.
+    :return: dict of request_id -> exception for all ids that could not be resolved
+    """
+    print("Resolving factors of configured request ids ...")
+    failures = prefetch_factors()
+    for request_id, e in failures.items():
+        print(f"  Failed: {request_id}: {e}")
+    if failures:
+        print(f"{len(failures)} request ids failed. Calls with these ids will fail during simulation.")
+    return failures
+
+
+def mainloop(port=9999, prefetch=True, trace_path=None):
+    """
+    Serve a single CPN connection until it sends close.
+    :param port:
+    :param prefetch: resolve the factors of all configured request ids before accepting the connection
+    :param trace_path: record all received messages to this trace file, defaults to config.FILEPATH_TRACE
+    """
+    if trace_path is None:
+        trace_path = getattr(config, "FILEPATH_TRACE", "")
+    recorder = TraceRecorder(trace_path) if trace_path else None
+    if prefetch:
+        warm_up()
     print("Started. Awaiting CPN connection.")
     logger.info("mainloop: awaiting connection")
-    port = 9999
     conn = PyCPN()
     conn.accept(port) # wait for connection - can block
     logger.debug("mainloop: connection established")
 
     def exit_handler():
         conn.disconnect()
+        close_log_sink()
+        session_manager.close()
+        metrics.flush()
+        if recorder:
+            recorder.close()
         logger.info("mainloop: exit by exit_handler")
 
     atexit.register(exit_handler)
 
+    def send(label, response):
+        start = perf_counter()
+        conn.send(stringEncode(response))
+        metrics.observe("send", label, perf_counter() - start)
+
     try:
         while True:
+            start = perf_counter()
             msg = stringDecode(conn.receive())
-            if msg == 'init':
-                logger.info("mainloop: init")
-                conn.send(stringEncode("confirmed"))
-                print("Connected.")
-            elif msg == 'close':
-                logger.info("mainloop: close")
-                break
-            elif 'call_v1%' in msg:
-                # assumes a msg of the form: {"call_v1"}%{request_id}%{quantity}
-                # or simplified: call(request_id, quantity)
-                _, request_id, quantity = msg.split('%')
-                logger.debug("mainloop: received string: " + msg)
-                
-                try:         
-                    quantity = float(quantity) #TODO: convert to float
-                except:
-                    response = ""
+            if recorder:
+                recorder.record(msg)
+            label = message_label(msg)
+            metrics.observe("receive", label, perf_counter() - start)
+            metrics.count_message()
+            with profiling.message():
+                if msg == 'init':
+                    logger.info("mainloop: init")
+                    send(label, "confirmed")
+                    print("Connected.")
+                elif msg == 'close':
+                    logger.info("mainloop: close")
+                    close_log_sink()
+                    break
+                elif msg.startswith('log_v1%'):
+                    handle_log(msg)
+                elif 'call_batch_v1%' in msg:
+                    logger.debug("mainloop: received string: " + msg)
+                    response = handle_call_batch(msg)
                     logger.debug("mainloop: send string: " + response)
-                    conn.send(stringEncode(response))
-                else:
-                    request_id = str(request_id)
-                    response = str(get_co2e(request_id, quantity))
-                    
+                    send(label, response)
+                elif 'call_v1%' in msg:
+                    logger.debug("mainloop: received string: " + msg)
+                    response = handle_call(msg)
                     logger.debug("mainloop: send string: " + response)
-                    conn.send(stringEncode(response))
-            else:
-                pass
+                    send(label, response)
+                else:
+                    pass
+            metrics.maybe_flush()
     except Exception as e:
         logger.error("mainloop: exception: " + str(e))
         conn.disconnect()
         raise e
+    # closed by the client: clean up now instead of at interpreter exit, e.g. when the mainloop ran in a thread
+    atexit.unregister(exit_handler)
+    exit_handler()
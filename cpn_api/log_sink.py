@@ -0,0 +1,249 @@
+# Buffered sink for the sOCEL rows of a simulation that logs through the connector (LOG_VIA_API in cpn-api.sml).
+#
+# CPN sends one log_v1%{table}%{row} message per row instead of opening, appending to and closing the csv file of the
+# table itself. Rows are buffered per table and written in one batch per table when LOG_SINK_MAX_ROWS rows are
+# buffered, at the latest LOG_SINK_INTERVAL seconds after they were received and on close. A started sink writes in its
+# background thread only, add() just wakes it, so the asyncio server does not block on disk I/O.
+# CsvLogSink appends to the csv tables created by create_logs, SqliteLogSink inserts into an indexed OCEL 2.0 SQLite
+# database with the columns of these csv headers.
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from misc.socel_sqlite_writer import INDEXES, NULL_VALUES, create_index, declared_type, quote_identifier
+from misc.socel_xml_writer import SEP
+import config
+
+
+logger = logging.getLogger(__name__)
+
+TABLE_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+$")
+MAP_TABLES = ("event_map_type", "object_map_type")
+
+
+class LogSink:
+    """
+    Buffer of rows per table, flushed by size, by age and on close. Subclasses implement _write.
+    """
+
+    def __init__(self, interval=None, max_rows=None):
+        """
+        :param interval: max. seconds a row stays in the buffer, defaults to config.LOG_SINK_INTERVAL
+        :param max_rows: buffered rows that trigger a flush, defaults to config.LOG_SINK_MAX_ROWS
+        """
+        self.interval = interval if interval is not None else getattr(config, "LOG_SINK_INTERVAL", 1.0)
+        self.max_rows = max_rows if max_rows is not None else getattr(config, "LOG_SINK_MAX_ROWS", 10000)
+        self.rows = 0
+        self.flushes = 0
+        self._buffers = {}
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, table, row):
+        """
+        :param table: table name, e.g. event, event_CoatPart or object_object
+        :param row: values of the row joined by ;
+        """
+        if not TABLE_PATTERN.match(table):
+            raise ValueError(f"Invalid log table {table!r}")
+        with self._lock:
+            self._buffers.setdefault(table, []).append(row)
+            self._buffered += 1
+            full = self._buffered >= self.max_rows
+        if full:
+            if self._thread is not None:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        """
+        Write all buffered rows. If the write fails, the rows are buffered again in front of newer rows.
+        :return: number of written rows
+        """
+        with self._write_lock:
+            with self._lock:
+                buffers, self._buffers = self._buffers, {}
+                count, self._buffered = self._buffered, 0
+            if count:
+                try:
+                    self._write(buffers)
+                except Exception:
+                    with self._lock:
+                        for table, rows in self._buffers.items():
+                            buffers.setdefault(table, []).extend(rows)
+                        self._buffers = buffers
+                        self._buffered = sum(len(rows) for rows in buffers.values())
+                    raise
+                self.rows += count
+                self.flushes += 1
+                logger.debug(f"log-sink: flushed {count} rows of {len(buffers)} tables")
+        return count
+
+    def _write(self, buffers):
+        raise NotImplementedError
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"log-sink: flush failed: {e}")
+
+    def start(self):
+        """
+        Flush in a background thread every interval seconds and whenever max_rows rows are buffered.
+        :return: self
+        """
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """
+        Stop the background thread and flush the remaining rows.
+        :return: total number of written rows
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        logger.info(f"log-sink: closed after {self.rows} rows in {self.flushes} flushes")
+        return self.rows
+
+
+class CsvLogSink(LogSink):
+    """
+    Appends the rows to the csv tables {table}.csv in path_csv, one open and write per table and flush.
+    """
+
+    def __init__(self, path_csv, interval=None, max_rows=None):
+        super().__init__(interval, max_rows)
+        self.path_csv = path_csv
+
+    def _write(self, buffers):
+        # written tables are removed from buffers, so a failed flush only buffers the remaining tables again
+        for table in list(buffers):
+            with open(os.path.join(self.path_csv, table + ".csv"), "a", newline="") as file:
+                file.write("\n".join(buffers[table]) + "\n")
+            del buffers[table]
+
+
+class SqliteLogSink(LogSink):
+    """
+    Inserts the rows into the tables of an OCEL 2.0 SQLite database, one transaction per flush. A table is created
+    with the columns of the header of {table}.csv in path_csv when its first row arrives.
+    """
+
+    def __init__(self, path_csv, path_sqlite, interval=None, max_rows=None):
+        super().__init__(interval, max_rows)
+        self.path_csv = path_csv
+        self.path_sqlite = path_sqlite
+        self._columns = {}
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path_sqlite + suffix):
+                os.remove(path_sqlite + suffix)
+        self._conn = sqlite3.connect(path_sqlite, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+
+    def _header(self, table):
+        with open(os.path.join(self.path_csv, table + ".csv")) as file:
+            return file.readline().rstrip("\n").split(SEP)
+
+    def _create_table(self, table, columns):
+        names = ", ".join(f"{quote_identifier(column)} {declared_type(column)}" for column in columns)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {quote_identifier(table)} ({names})")
+        indexes = [index_columns for index_table, index_columns in INDEXES if index_table == table]
+        if not indexes and "ocel_id" in columns:
+            indexes = [["ocel_id"]]
+        for index_columns in indexes:
+            create_index(self._conn, table, index_columns)
+
+    def _insert(self, table, rows, created):
+        """
+        Insert rows into table, creating it with the columns of the csv header if it is new. Rows with another number
+        of values than the header are logged and skipped, they would fail the whole flush again and again.
+        :param created: dict of the tables created in this transaction, table -> columns
+        """
+        columns = self._columns.get(table) or created.get(table)
+        if columns is None:
+            columns = self._header(table)
+            self._create_table(table, columns)
+            created[table] = columns
+        values = []
+        for row in rows:
+            row_values = row.split(SEP)
+            if len(row_values) != len(columns):
+                logger.error(f"log-sink: skipped row of {table} with {len(row_values)} instead of {len(columns)} "
+                             f"values: {row!r}")
+                continue
+            values.append([None if value in NULL_VALUES else value for value in row_values])
+        placeholders = ", ".join("?" * len(columns))
+        self._conn.executemany(f"INSERT INTO {quote_identifier(table)} VALUES ({placeholders})", values)
+
+    def _write(self, buffers):
+        # tables are only known to exist after the commit, a rollback also drops the tables created by the flush
+        created = {}
+        self._conn.execute("BEGIN")
+        try:
+            for table, rows in buffers.items():
+                self._insert(table, rows, created)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._columns.update(created)
+
+    def close(self):
+        """
+        Flush the remaining rows, create the tables of path_csv without rows, copy the type map tables of path_csv and
+        close the database.
+        :return: total number of written rows
+        """
+        rows = super().close()
+        maps = {}
+        with self._write_lock:
+            for fn in sorted(os.listdir(self.path_csv)):
+                table = fn[:-4]
+                if not fn.endswith(".csv") or table in self._columns or not TABLE_PATTERN.match(table):
+                    continue
+                if table in MAP_TABLES:
+                    with open(os.path.join(self.path_csv, fn)) as file:
+                        maps[table] = [line.rstrip("\n") for line in file.readlines()[1:] if line.strip()]
+                else:
+                    self._write({table: []})
+            self._write(maps)
+            self._conn.close()
+        return rows
+
+
+def create_log_sink():
+    """
+    :return: started sink configured by config.LOG_SINK ("csv" or "sqlite")
+    """
+    path_csv = getattr(config, "LOG_SINK_PATH_CSV", "./data/socel-csv")
+    kind = getattr(config, "LOG_SINK", "csv")
+    if kind == "sqlite":
+        path_sqlite = getattr(config, "LOG_SINK_PATH_SQLITE", "./data/socel/socel_hinge.sqlite")
+        os.makedirs(os.path.dirname(path_sqlite) or ".", exist_ok=True)
+        sink = SqliteLogSink(path_csv, path_sqlite)
+    elif kind == "csv":
+        sink = CsvLogSink(path_csv)
+    else:
+        raise ValueError(f"Unknown LOG_SINK {kind!r}")
+    logger.info(f"log-sink: {kind} sink started")
+    return sink.start()
@@ -0,0 +1,189 @@
+# Hot-path metrics of the connector: latency histograms per stage and request id, hit/miss counters per factor tier
+# and message throughput.
+#
+# Stages: "receive" (waiting for and reading a message from CPN), "resolve" (getting the CO2e value) and "send".
+# Tiers: "default" (default entry in the config xml), "memo" (factor memo of the collector), "http_cache"
+# (requests_cache) and "network" (climatiq api call, a miss is an error response).
+#
+# The metrics are flushed periodically to <FILEPATH_METRICS>.json as snapshot and to <FILEPATH_METRICS>.prom in the
+# Prometheus text format.
+
+import bisect
+import json
+import logging
+import os
+import time
+from threading import Lock
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency buckets in seconds
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, float("inf")
+)
+TIERS = ("snapshot", "default", "memo", "http_cache", "network")
+
+
+class Histogram:
+    """
+    Cumulative latency histogram with fixed buckets.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        :return: upper bound of the bucket holding the q-quantile, or max for the last bucket
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+def _escape(label):
+    return str(label).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    Collects latencies and counters and writes them to disk every flush_interval seconds.
+    """
+
+    def __init__(self, filepath=None, flush_interval=None):
+        """
+        :param filepath: path without extension of the output files, defaults to config.FILEPATH_METRICS
+        :param flush_interval: seconds between two flushes by maybe_flush
+        """
+        self.filepath = filepath if filepath is not None else getattr(config, "FILEPATH_METRICS", "./data/cpn-api-metrics")
+        self.flush_interval = flush_interval if flush_interval is not None else getattr(config, "METRICS_FLUSH_INTERVAL", 10.0)
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.histograms = {}
+            self.tiers = {tier: {"hit": 0, "miss": 0} for tier in TIERS}
+            self.messages = 0
+            self._last_flush = time.monotonic()
+
+    def observe(self, stage, request_id, seconds):
+        with self._lock:
+            histogram = self.histograms.get((stage, request_id))
+            if histogram is None:
+                histogram = self.histograms[(stage, request_id)] = Histogram()
+            histogram.observe(seconds)
+
+    def count_tier(self, tier, hit):
+        with self._lock:
+            self.tiers[tier]["hit" if hit else "miss"] += 1
+
+    def count_message(self):
+        with self._lock:
+            self.messages += 1
+
+    def snapshot(self):
+        with self._lock:
+            uptime = time.time() - self.started
+            latency = {}
+            for (stage, request_id), histogram in sorted(self.histograms.items()):
+                latency.setdefault(stage, {})[request_id] = histogram.snapshot()
+            return {
+                "timestamp": time.time(),
+                "uptime_s": uptime,
+                "messages": self.messages,
+                "messages_per_s": self.messages / uptime if uptime > 0 else 0.0,
+                "tiers": {tier: dict(counts) for tier, counts in self.tiers.items()},
+                "latency": latency,
+            }
+
+    def prometheus(self):
+        """
+        :return: metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP cpn_api_latency_seconds Latency per stage and request id.",
+            "# TYPE cpn_api_latency_seconds histogram",
+        ]
+        with self._lock:
+            for (stage, request_id), histogram in sorted(self.histograms.items()):
+                labels = f'stage="{_escape(stage)}",request_id="{_escape(request_id)}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'cpn_api_latency_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'cpn_api_latency_seconds_sum{{{labels}}} {histogram.sum!r}')
+                lines.append(f'cpn_api_latency_seconds_count{{{labels}}} {histogram.count}')
+        lines += [
+            "# HELP cpn_api_tier_total Factor lookups per tier and result.",
+            "# TYPE cpn_api_tier_total counter",
+        ]
+        for tier, counts in snapshot["tiers"].items():
+            for result, count in counts.items():
+                lines.append(f'cpn_api_tier_total{{tier="{tier}",result="{result}"}} {count}')
+        lines += [
+            "# HELP cpn_api_messages_total Messages received from CPN.",
+            "# TYPE cpn_api_messages_total counter",
+            f"cpn_api_messages_total {snapshot['messages']}",
+            "# HELP cpn_api_messages_per_second Mean message throughput since start.",
+            "# TYPE cpn_api_messages_per_second gauge",
+            f"cpn_api_messages_per_second {snapshot['messages_per_s']!r}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """
+        Write the json snapshot and the Prometheus file, each replaced atomically.
+        """
+        self._last_flush = time.monotonic()
+        try:
+            for extension, content in ((".json", json.dumps(self.snapshot(), indent=2)), (".prom", self.prometheus())):
+                path = self.filepath + extension
+                with open(path + ".tmp", "w") as file:
+                    file.write(content)
+                os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"metrics: flush to {self.filepath} failed: {e}")
+            return
+        logger.debug(f"metrics: flushed to {self.filepath}")
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+
+metrics = Metrics()
@@ -0,0 +1,290 @@
+# Opt-in profiling of a run of cpn_api_start: the connector mainloop or server and the export of the sOCEL.
+#
+# Enabled by config.PROFILE or the environment variable CPN_API_PROFILE=1. Every PROFILE_SAMPLE_EVERY-th message of
+# the mainloop is handled under cProfile, so the overhead stays bounded for long simulations. With
+# CONNECTOR_MULTI_CLIENT every PROFILE_SAMPLE_EVERY-th call of the server is sampled instead, in the executor thread
+# that resolves it. cProfile profiles one thread at a time, a sample that is due while another one runs is skipped.
+# The export steps (enrichment, csv load, sqlite write, pm4py read, xml write, lxml cleanup) are stages that are
+# profiled as a whole.
+# With PROFILE_TRACEMALLOC (or CPN_API_TRACEMALLOC=1) tracemalloc is started with the first export stage and a
+# snapshot is taken at every stage boundary.
+#
+# Output in PROFILE_DIR, named by the start time of the run:
+#   <run>-<stage>.prof        pstats file, e.g. for snakeviz or python -m pstats
+#   <run>-<stage>.collapsed   collapsed stacks (frame;frame;... microseconds) for flamegraph.pl or speedscope
+#   <run>-stages.txt          timing summary of every stage with its top functions and memory
+#
+# misc modules call stage() and message() unconditionally, they are no-ops while profiling is disabled.
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+TOP_FUNCTIONS = 15
+TOP_ALLOCATIONS = 5
+COLLAPSED_MIN_SHARE = 1e-4 # call paths below this share of the stage time are left out of the collapsed stacks
+COLLAPSED_MAX_DEPTH = 128
+
+
+def _env_flag(name):
+    value = os.environ.get(name)
+    return None if value is None else value.strip().lower() not in ("", "0", "false", "no")
+
+
+def _frame_label(func):
+    file_name, line, name = func
+    label = name if file_name == "~" else f"{name} ({os.path.basename(file_name)}:{line})"
+    return label.replace(";", ",")
+
+
+def collapsed_stacks(stats):
+    """
+    Approximate call stacks of a profile. cProfile only records caller -> callee edges, so the time of a function is
+    split between the paths to it in proportion to the cumulative time of its callers.
+    :param stats: pstats.Stats
+    :return: dict of "frame;frame;..." -> microseconds of self time
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    # roots: functions called from outside the profile, e.g. the first function of a profiled block
+    roots = {}
+    for func, (_, _, _, cum_time, callers) in entries.items():
+        outside = cum_time - sum(edge[3] for caller, edge in callers.items() if caller in entries and caller != func)
+        if not callers or outside > cum_time * COLLAPSED_MIN_SHARE:
+            roots[func] = cum_time if not callers else outside
+    total = sum(roots.values()) or 1.0
+    stacks = {}
+
+    def walk(func, path, labels, path_time):
+        _, _, self_time, cum_time, _ = entries[func]
+        share = path_time / cum_time if cum_time else 0.0
+        key = ";".join(labels)
+        stacks[key] = stacks.get(key, 0.0) + self_time * share
+        if len(path) >= COLLAPSED_MAX_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            callee_time = edge_time * share
+            if callee in path or callee_time < total * COLLAPSED_MIN_SHARE:
+                continue
+            walk(callee, path | {callee}, labels + [_frame_label(callee)], callee_time)
+
+    for root, root_time in roots.items():
+        walk(root, {root}, [_frame_label(root)], root_time)
+    return {key: int(seconds * 1e6) for key, seconds in stacks.items() if seconds * 1e6 >= 1}
+
+
+class _Stage:
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.profile = None
+        self.messages = 0
+        self.sampled = 0
+        self.memory = None # (allocated bytes, peak bytes, top allocations) of the last call
+
+
+class RunProfiler:
+    """
+    Profiles and timings of the stages of one run, see the module comment.
+    """
+
+    def __init__(self, path_dir, sample_every=100, trace_memory=False, run_id=None):
+        """
+        :param path_dir: output directory
+        :param sample_every: profile every n-th message of the mainloop
+        :param trace_memory: take tracemalloc snapshots at the boundaries of stages with memory=True
+        :param run_id: prefix of the output files, defaults to the start time
+        """
+        self.path_dir = path_dir
+        self.sample_every = max(1, int(sample_every))
+        self.trace_memory = trace_memory
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+        self.stages = {}
+        self._profiling = False
+        self._lock = threading.Lock()
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, _Stage(name))
+
+    @contextmanager
+    def _profiled(self, stage, claimed=False):
+        # cProfile can not nest and profiles one thread at a time, an inner or concurrent stage is only timed
+        if not claimed:
+            with self._lock:
+                busy, self._profiling = self._profiling, True
+            if busy:
+                yield
+                return
+        if stage.profile is None:
+            stage.profile = cProfile.Profile()
+        stage.profile.enable()
+        try:
+            yield
+        finally:
+            stage.profile.disable()
+            self._profiling = False
+
+    @contextmanager
+    def stage(self, name, profile=True, memory=False):
+        """
+        Time (and profile) a block as stage name. Repeated stages add up.
+        :param profile: run the block under cProfile
+        :param memory: take tracemalloc snapshots before and after the block, if trace_memory
+        """
+        stage = self._stage(name)
+        before = None
+        if memory and self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        try:
+            with self._profiled(stage) if profile else nullcontext():
+                yield
+        finally:
+            stage.seconds += time.perf_counter() - start
+            stage.calls += 1
+            if before is not None:
+                after = tracemalloc.take_snapshot()
+                diff = after.compare_to(before, "lineno")
+                allocated = sum(stat.size_diff for stat in diff)
+                stage.memory = (allocated, tracemalloc.get_traced_memory()[1], diff[:TOP_ALLOCATIONS])
+
+    def message(self, name="mainloop"):
+        """
+        :return: context of the handling of one message, profiled for every sample_every-th message unless another
+            message is profiled at the same time, can be used from several threads
+        """
+        with self._lock:
+            stage = self._stage(name)
+            stage.messages += 1
+            if stage.messages % self.sample_every or self._profiling:
+                return nullcontext()
+            stage.sampled += 1
+            self._profiling = True
+        return self._profiled(stage, claimed=True)
+
+    def _path(self, suffix):
+        return os.path.join(self.path_dir, f"{self.run_id}-{suffix}")
+
+    def summary(self):
+        """
+        :return: text with one line per stage, the top functions of the profiled stages and the memory of the stages
+        """
+        out = io.StringIO()
+        out.write(f"{'stage':<16}{'seconds':>10}{'calls':>8}{'profiled':>12}{'alloc [MB]':>12}{'peak [MB]':>11}\n")
+        for stage in self.stages.values():
+            profiled = f"{stage.sampled}/{stage.messages}" if stage.messages else ("yes" if stage.profile else "no")
+            memory = (f"{stage.memory[0] / 1e6:>12.1f}{stage.memory[1] / 1e6:>11.1f}" if stage.memory
+                      else f"{'':>12}{'':>11}")
+            out.write(f"{stage.name:<16}{stage.seconds:>10.3f}{stage.calls:>8}{profiled:>12}{memory}\n")
+        for stage in self.stages.values():
+            if stage.profile is None and stage.memory is None:
+                continue
+            out.write(f"\n== {stage.name}\n")
+            if stage.memory is not None:
+                for stat in stage.memory[2]:
+                    out.write(f"  {stat}\n")
+            if stage.profile is not None:
+                stats = pstats.Stats(stage.profile, stream=out)
+                stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        return out.getvalue()
+
+    def write(self):
+        """
+        Write the .prof and .collapsed file of every profiled stage and the summary.
+        :return: list of written paths
+        """
+        os.makedirs(self.path_dir, exist_ok=True)
+        paths = []
+        for stage in self.stages.values():
+            if stage.profile is None:
+                continue
+            stats = pstats.Stats(stage.profile)
+            if not stats.stats:
+                continue
+            path_prof = self._path(f"{stage.name}.prof")
+            stats.dump_stats(path_prof)
+            path_collapsed = self._path(f"{stage.name}.collapsed")
+            with open(path_collapsed, "w") as file:
+                for stack, microseconds in sorted(collapsed_stacks(stats).items()):
+                    file.write(f"{stack} {microseconds}\n")
+            paths += [path_prof, path_collapsed]
+        path_summary = self._path("stages.txt")
+        with open(path_summary, "w") as file:
+            file.write(self.summary())
+        paths.append(path_summary)
+        logger.info(f"profiling: wrote {len(paths)} files to {self.path_dir}")
+        return paths
+
+
+profiler = None # active RunProfiler, see start_profiling
+
+
+def profiling_enabled():
+    """
+    :return: True if CPN_API_PROFILE or else config.PROFILE is set
+    """
+    enabled = _env_flag("CPN_API_PROFILE")
+    return getattr(config, "PROFILE", False) if enabled is None else enabled
+
+
+def start_profiling():
+    """
+    Start profiling with the settings of config.py and the environment.
+    :return: RunProfiler
+    """
+    global profiler
+    trace_memory = _env_flag("CPN_API_TRACEMALLOC")
+    profiler = RunProfiler(getattr(config, "PROFILE_DIR", "./data/profile"),
+                           getattr(config, "PROFILE_SAMPLE_EVERY", 100),
+                           getattr(config, "PROFILE_TRACEMALLOC", False) if trace_memory is None else trace_memory)
+    logger.info(f"profiling: run {profiler.run_id}, every {profiler.sample_every}th message")
+    return profiler
+
+
+def stop_profiling():
+    """
+    Write the output of the active profiler and stop it.
+    :return: list of written paths
+    """
+    global profiler
+    if profiler is None:
+        return []
+    paths = profiler.write()
+    profiler = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return paths
+
+
+def stage(name, profile=True, memory=True):
+    """
+    :return: context of a stage of the active profiler (see RunProfiler.stage), a no-op if profiling is disabled
+    """
+    return profiler.stage(name, profile, memory) if profiler is not None else nullcontext()
+
+
+def message(name="mainloop"):
+    """
+    :param name: stage of the message, "mainloop" or "server"
+    :return: context of the handling of a message, a no-op if profiling is disabled
+    """
+    return profiler.message(name) if profiler is not None else nullcontext()
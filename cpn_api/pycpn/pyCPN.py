@@ -9,13 +9,20 @@
 import socket
 import sys
 
+try:
+    from .pyCPNFraming import encode_frames, FrameReader
+except ImportError: # used as script from this directory, see pyCPNClient.py
+    from pyCPNFraming import encode_frames, FrameReader
+
 class PyCPN:
 
     def __init__(self):
         self.socket = None
+        self.reader = None
 
     def connect(self, hostName, port):
         self.socket = socket.create_connection((hostName, port))
+        self.reader = FrameReader(self.socket)
 
     def accept(self,port):
         serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -23,6 +30,7 @@ class PyCPN:
         serverSocket.listen()
         self.socket, client_addr = serverSocket.accept()
         serverSocket.close()
+        self.reader = FrameReader(self.socket)
 
 
     # Method used to send a byte array via an established
@@ -35,32 +43,10 @@ class PyCPN:
     # transmitted to the external process through methods acting on the
     # output stream of the socket.
  
+    # All packets are built in one buffer by encode_frames and sent with a
+    # single call, see pyCPNFraming.py.
     def send(self,sendBytes):
-        # convert bytes to list for conveneience
-        bytes_to_send = list(sendBytes)
-        # While there are more than 127 bytes still to send ...
-        while len(bytes_to_send) > 127:
-            # ... create a byte packet, ...
-            packet = []
-            # ... set the header to 255, ...
-            packet.append(255)
-            # ... read 127 bytes from the sequence of bytes to send, ...
-            for i in range(127):
-                packet.append(bytes_to_send[i])
-            # Update bytes to send
-            bytes_to_send = bytes_to_send[127:]
-            # Send the packet to the external process
-            self.socket.sendall(bytes(packet))
-
-        # Create a packet for any remaining data
-        packet = []
-        # Set the header appropriately
-        packet.append(len(bytes_to_send))
-        # Read the remaining bytes into the packet
-        for i in range(len(bytes_to_send)):
-            packet.append(bytes_to_send[i])
-        # Send the packet to the external process
-        self.socket.sendall(bytes(packet))
+        self.socket.sendall(encode_frames(sendBytes))
  
 
     # Method used to receive a byte array stream from an established
@@ -71,42 +57,9 @@ class PyCPN:
     # byte array object as each segment of payload data is
     # received. This process is repeated until all data has been received for
     # the current transmission.
+    # The socket is read through a buffered FrameReader, see pyCPNFraming.py.
     def receive(self):
-        # The complete sequence of bytes received from the external process
-        receivedBytes = []
-        # The header received from the external process
-        header = None
-        # The total number of payload bytes received from the external process for
-        # a packet, if not all are received immediately.
-        totalNumberRead = None
-
-        while True:
-            # Read a header byte from the input stream
-            header = self.socket.recv(1)
-            iheader = int.from_bytes(header, byteorder='big')
-            if iheader >= 127:
-                payload_len = 127
-            else:
-                payload_len = iheader
-            # Read the payload_len bytes from the input stream
-            # Reset the total bytes received to 0 for this iteration
-            totalNumberRead = 0
-            # Payload bytes received from the external process for a packet
-            chunks = []
-            # Loop until all data has been read for this packet.
-            while totalNumberRead < payload_len:
-                # Try to read all bytes in this packet
-                chunk = self.socket.recv(payload_len - totalNumberRead)
-                if chunk == b'':
-                    raise RuntimeError("socket connection broken")
-                chunks.append(chunk)
-                totalNumberRead += len(chunk)
-            receivedBytes.extend(chunks)
-            # If no more bytes to follow, break from the loop.
-            if iheader <= 127:
-                break
-        # Return the received bytes
-        return b''.join(receivedBytes)
+        return self.reader.read_message()
 
     # Method to disconnect the established connection.
     def disconnect(self):
@@ -0,0 +1,83 @@
+# Framing codec for PyCPN, wire compatible with the segmentation of JavaCPN/CPN Tools.
+#
+# A message is sent as packets of at most 127 payload bytes. Each packet starts with a single header byte holding
+# the number of payload bytes (0 to 127) of the last packet or 255 if another packet follows.
+#
+# encode_frames builds all packets of a message in one preallocated bytearray using memoryview slices, so a message
+# is sent with a single sendall. FrameReader reads from the socket with recv_into into a reusable buffer instead of
+# one recv call per header byte.
+
+MAX_PAYLOAD = 127
+HEADER_MORE = 255
+
+
+def encode_frames(data):
+    """
+    Segment a message into packets with header bytes.
+    :param data: bytes-like message
+    :return: bytearray with all packets
+    """
+    view = memoryview(data)
+    length = len(view)
+    full, rest = divmod(length, MAX_PAYLOAD)
+    if rest == 0 and full > 0:
+        # a last packet of exactly 127 bytes is marked by header 127
+        full -= 1
+        rest = MAX_PAYLOAD
+
+    frames = bytearray(length + full + 1)
+    pos = 0
+    src = 0
+    for _ in range(full):
+        frames[pos] = HEADER_MORE
+        frames[pos + 1:pos + 1 + MAX_PAYLOAD] = view[src:src + MAX_PAYLOAD]
+        pos += MAX_PAYLOAD + 1
+        src += MAX_PAYLOAD
+    frames[pos] = rest
+    frames[pos + 1:] = view[src:]
+    return frames
+
+
+class FrameReader:
+    """
+    Buffered reader of framed messages from a socket.
+    """
+
+    def __init__(self, sock, buffer_size=65536):
+        self.sock = sock
+        self._buffer = bytearray(max(buffer_size, MAX_PAYLOAD + 1))
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def _fill(self):
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end == len(self._buffer):
+            # move the unread rest to the front to make room
+            remaining = self._end - self._start
+            self._buffer[:remaining] = self._view[self._start:self._end]
+            self._start, self._end = 0, remaining
+        received = self.sock.recv_into(self._view[self._end:])
+        if received == 0:
+            raise RuntimeError("socket connection broken")
+        self._end += received
+
+    def read_message(self):
+        """
+        Read the packets of one message.
+        :return: payload bytes
+        """
+        message = bytearray()
+        while True:
+            if self._start == self._end:
+                self._fill()
+            header = self._buffer[self._start]
+            self._start += 1
+            payload_len = MAX_PAYLOAD if header >= MAX_PAYLOAD else header
+            while self._end - self._start < payload_len:
+                self._fill()
+            message += self._view[self._start:self._start + payload_len]
+            self._start += payload_len
+            if header <= MAX_PAYLOAD:
+                return bytes(message)
@@ -0,0 +1,201 @@
+# Replay of recorded traces (see trace.py) against the connector, as reproducible benchmark without CPN-Tools.
+#
+# The replay client connects with PyCPN like CPN-Tools does, sends the recorded messages at full speed or with the
+# original timing and measures the round trip of every message that is answered. By default the connector is
+# started in this process against a local climatiq stand-in.
+#
+# Usage: python -m cpn_api.replay <trace> [--original-timing] [--server mainloop|async|none] [--port 9999]
+
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+
+import config
+import cpn_api.collector as collector
+import cpn_api.connector as connector
+from cpn_api.climatiq_stub import ClimatiqStub
+from cpn_api.configurator import registry
+from cpn_api.pycpn.pyCPN import PyCPN
+from cpn_api.pycpn.pyCPNEncodeDecode import stringEncode, stringDecode
+from cpn_api.server import ConnectorServer
+from cpn_api.session import SessionManager
+from cpn_api.trace import read_trace
+
+
+def expects_response(msg):
+    return msg == 'init' or 'call_batch_v1%' in msg or 'call_v1%' in msg
+
+
+def _connect(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        conn = PyCPN()
+        try:
+            conn.connect(host, port)
+            return conn
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def replay(trace_path, host='127.0.0.1', port=9999, original_timing=False, connect_timeout=10.0):
+    """
+    Replay a trace, one connection per recorded client.
+    :param trace_path:
+    :param host:
+    :param port:
+    :param original_timing: keep the recorded time offsets between messages instead of sending at full speed
+    :param connect_timeout: seconds to wait for the server to accept connections
+    :return: dict with message count, throughput and round trip latencies in ms
+    """
+    clients = {}
+    for offset, client_id, msg in read_trace(trace_path):
+        clients.setdefault(client_id, []).append((offset, msg))
+
+    latencies = []
+    lock = threading.Lock()
+    errors = []
+
+    def run_client(messages):
+        try:
+            conn = _connect(host, port, connect_timeout)
+            client_latencies = []
+            for offset, msg in messages:
+                if original_timing:
+                    delay = start + offset - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                sent = time.perf_counter()
+                conn.send(stringEncode(msg))
+                if expects_response(msg):
+                    stringDecode(conn.receive())
+                    client_latencies.append(time.perf_counter() - sent)
+            conn.disconnect()
+            with lock:
+                latencies.extend(client_latencies)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run_client, args=(messages,)) for messages in clients.values()]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+
+    latencies.sort()
+    messages = sum(len(messages) for messages in clients.values())
+    return {
+        "clients": len(clients),
+        "messages": messages,
+        "responses": len(latencies),
+        "elapsed_s": elapsed,
+        "messages_per_s": messages / elapsed if elapsed > 0 else 0.0,
+        "latency_p50_ms": _percentile(latencies, 0.5) * 1e3,
+        "latency_p99_ms": _percentile(latencies, 0.99) * 1e3,
+        "latency_max_ms": (latencies[-1] if latencies else 0.0) * 1e3,
+    }
+
+
+@contextmanager
+def local_backend(requests_xml=None, **stub_kwargs):
+    """
+    Point the collector at a local ClimatiqStub: all endpoints of a copy of the config xml are redirected to the stub
+    and responses are cached in memory only.
+    :param requests_xml: config xml to copy, defaults to config.FILEPATH_REQUESTS_XML
+    :param stub_kwargs: see ClimatiqStub
+    :return: the running stub
+    """
+    requests_xml = requests_xml or config.FILEPATH_REQUESTS_XML
+    original_requests_xml = config.FILEPATH_REQUESTS_XML
+    original_session_manager = collector.session_manager
+    with ClimatiqStub(**stub_kwargs) as stub, tempfile.TemporaryDirectory() as tmpdir:
+        tree = ET.parse(requests_xml)
+        for endpoint in tree.iter('Endpoint'):
+            endpoint.text = stub.url + "/" + endpoint.text.rsplit("/", 1)[-1]
+        path = os.path.join(tmpdir, "requestconfigs.xml")
+        tree.write(path)
+
+        config.FILEPATH_REQUESTS_XML = path
+        collector.session_manager = SessionManager(backend='memory')
+        collector.factor_memo.clear()
+        registry.invalidate()
+        try:
+            yield stub
+        finally:
+            collector.session_manager.close()
+            collector.session_manager = original_session_manager
+            config.FILEPATH_REQUESTS_XML = original_requests_xml
+            collector.factor_memo.clear()
+            registry.invalidate()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def spawn_server(kind='mainloop', prefetch=False):
+    """
+    Run the connector in a background thread.
+    :param kind: 'mainloop' for connector.mainloop or 'async' for the ConnectorServer
+    :return: port of the server
+    """
+    if kind == 'mainloop':
+        port = _free_port()
+        thread = threading.Thread(target=connector.mainloop, args=(port, prefetch, ""), daemon=True)
+        thread.start()
+    elif kind == 'async':
+        server = ConnectorServer(port=0, prefetch=prefetch, trace_path="")
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        server.started.wait()
+        port = server.port
+    else:
+        raise ValueError(f"Unknown server kind: {kind}")
+    try:
+        yield port
+    finally:
+        if kind == 'async':
+            server.stop()
+        thread.join(5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded cpn-api trace.")
+    parser.add_argument("trace")
+    parser.add_argument("--original-timing", action="store_true", help="keep the recorded timing")
+    parser.add_argument("--server", choices=["mainloop", "async", "none"], default="mainloop",
+                        help="connector to start against a local climatiq stand-in, none to use a running one")
+    parser.add_argument("--port", type=int, default=9999, help="port of a running connector (--server none)")
+    args = parser.parse_args()
+
+    if args.server == "none":
+        result = replay(args.trace, port=args.port, original_timing=args.original_timing)
+    else:
+        with local_backend() as stub, spawn_server(args.server) as port:
+            result = replay(args.trace, port=port, original_timing=args.original_timing)
+        result["climatiq_requests"] = stub.requests
+    for key, value in result.items():
+        print(f"{key:<20}{value:>14.3f}" if isinstance(value, float) else f"{key:<20}{value:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# Asyncio server for several concurrent CPN-Tools connections, e.g. several simulation replicas sharing one backend.
+#
+# Uses the same framing as PyCPN.send/receive: packets of up to 127 payload bytes with a 1-byte header holding the
+# payload length, or 255 if another packet of the same message follows. Calls are resolved in a thread pool, so a
+# slow climatiq call of one client does not block the others. All clients share the factor memo of the collector.
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from cpn_api.connector import (close_log_sink, flush_log_sink, handle_call, handle_call_batch, handle_log,
+                               message_label, warm_up)
+from cpn_api.metrics import metrics
+from cpn_api import profiling
+from cpn_api.pycpn.pyCPNEncodeDecode import stringEncode, stringDecode
+from cpn_api.pycpn.pyCPNFraming import encode_frames
+from cpn_api.session import session_manager
+from cpn_api.trace import TraceRecorder
+import config
+
+
+logger = logging.getLogger(__name__)
+
+
+async def receive_message(reader):
+    """
+    Read one message from the stream, see PyCPN.receive.
+    :return: payload bytes
+    """
+    chunks = []
+    while True:
+        header = (await reader.readexactly(1))[0]
+        payload_len = 127 if header >= 127 else header
+        chunks.append(await reader.readexactly(payload_len))
+        if header <= 127:
+            return b''.join(chunks)
+
+
+def handle_sampled(handler, msg):
+    """
+    Run a call handler in an executor thread as a message of the profiling stage "server", so that the sampled
+    cProfile runs in the thread resolving the call.
+    """
+    with profiling.message("server"):
+        return handler(msg)
+
+
+class ClientState:
+    """
+    Per-connection state of a CPN client.
+    """
+
+    def __init__(self, client_id, address, writer):
+        self.client_id = client_id
+        self.address = address
+        self.writer = writer
+        self.initialized = False
+        self.messages = 0
+
+
+class ConnectorServer:
+    """
+    Serves any number of CPN clients until stopped or, with exit_on_close, until all clients sent close.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9999, max_workers=8, exit_on_close=True, prefetch=True,
+                 trace_path=None):
+        """
+        :param host:
+        :param port: port to listen on, 0 picks a free port
+        :param max_workers: threads resolving calls concurrently
+        :param exit_on_close: stop the server once the last connected client sent close
+        :param prefetch: resolve the factors of all configured request ids before listening
+        :param trace_path: record all received messages to this trace file, defaults to config.FILEPATH_TRACE
+        """
+        self.host = host
+        self.port = port
+        self.exit_on_close = exit_on_close
+        self.prefetch = prefetch
+        self.trace_path = trace_path if trace_path is not None else getattr(config, "FILEPATH_TRACE", "")
+        self._recorder = None
+        self.clients = {}
+        self._tasks = set()
+        self.started = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cpn-call")
+        self._next_client_id = 0
+        self._loop = None
+        self._server = None
+        self._stopping = None
+
+    def run(self):
+        """
+        Serve in the current thread until the server stops.
+        """
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        if self.trace_path:
+            self._recorder = TraceRecorder(self.trace_path)
+        if self.prefetch:
+            await self._loop.run_in_executor(self._executor, warm_up)
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"server: listening on {self.host}:{self.port}")
+        print(f"Started. Awaiting CPN connections on port {self.port}.")
+        self.started.set()
+        try:
+            await self._stopping.wait()
+        finally:
+            await self._shutdown()
+
+    def stop(self):
+        """
+        Stop the server, can be called from any thread.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def _shutdown(self):
+        self._server.close()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._server.wait_closed()
+        # waits for calls still running in the executor, off the loop
+        await asyncio.to_thread(self._executor.shutdown)
+        close_log_sink()
+        session_manager.close()
+        metrics.flush()
+        if self._recorder:
+            self._recorder.close()
+        logger.info("server: stopped")
+
+    async def _handle_client(self, reader, writer):
+        self._next_client_id += 1
+        state = ClientState(self._next_client_id, writer.get_extra_info('peername'), writer)
+        self.clients[state.client_id] = state
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        logger.info(f"server: client {state.client_id} connected from {state.address}")
+        closed = False
+        try:
+            closed = await self._serve_client(state, reader, writer)
+        except asyncio.IncompleteReadError:
+            logger.warning(f"server: client {state.client_id} disconnected without close")
+        except asyncio.CancelledError:
+            # cancelled by _shutdown, not re-raised: the stream server logs cancelled handler tasks as errors
+            logger.info(f"server: client {state.client_id} cancelled by stop")
+        except Exception as e:
+            logger.error(f"server: client {state.client_id} exception: " + str(e))
+        finally:
+            del self.clients[state.client_id]
+            self._tasks.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            logger.info(f"server: client {state.client_id} closed after {state.messages} messages")
+            if closed and self.exit_on_close and not self.clients:
+                self._stopping.set()
+
+    async def _serve_client(self, state, reader, writer):
+        """
+        :return: True if the client sent close, False if the connection ended otherwise
+        """
+        while not self._stopping.is_set():
+            start = perf_counter()
+            msg = stringDecode(await receive_message(reader))
+            if self._recorder:
+                self._recorder.record(msg, state.client_id)
+            label = message_label(msg)
+            metrics.observe("receive", label, perf_counter() - start)
+            metrics.count_message()
+            state.messages += 1
+            if msg == 'init':
+                logger.info(f"server: client {state.client_id} init")
+                state.initialized = True
+                response = "confirmed"
+            elif msg == 'close':
+                logger.info(f"server: client {state.client_id} close")
+                # not in self._executor, a stop of the server may shut it down while the rows are written
+                await asyncio.to_thread(flush_log_sink)
+                return True
+            elif msg.startswith('log_v1%'):
+                handle_log(msg)
+                continue
+            elif 'call_batch_v1%' in msg:
+                response = await self._loop.run_in_executor(self._executor, handle_sampled, handle_call_batch, msg)
+            elif 'call_v1%' in msg:
+                response = await self._loop.run_in_executor(self._executor, handle_sampled, handle_call, msg)
+            else:
+                continue
+            start = perf_counter()
+            writer.write(encode_frames(stringEncode(response)))
+            await writer.drain()
+            metrics.observe("send", label, perf_counter() - start)
+            metrics.maybe_flush()
+        return False
@@ -0,0 +1,91 @@
+# Long-lived http session for calls to the climatiq api.
+#
+# The session keeps TCP/TLS connections alive in a connection pool, retries on 429/5xx with exponential backoff and
+# caches responses on disk using requests_cache. It is created on first use and closed by the connector on exit.
+# requests, requests_cache and urllib3 are only imported with the first session, so runs that answer all calls from
+# defaults or a factor snapshot (see snapshot.py) never load the http stack.
+
+import logging
+from threading import Lock
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class SessionManager:
+    """
+    Owns a single pooled CachedSession which is reused for all calls until close() is called.
+    """
+
+    def __init__(self, cache_name=None, backend='sqlite', pool_size=None, timeout=None, retries=None,
+                 backoff_factor=None):
+        """
+        :param cache_name: path of the response cache, defaults to config.FILEPATH_REQUEST_CACHE
+        :param backend: requests_cache backend, e.g. 'sqlite' or 'memory'
+        :param pool_size: number of keep-alive connections per host
+        :param timeout: timeout in seconds for connecting and for reading a response
+        :param retries: number of retries on connection errors and 429/5xx responses
+        :param backoff_factor: exponential backoff between retries, see urllib3.util.Retry
+        """
+        self.cache_name = cache_name if cache_name is not None else config.FILEPATH_REQUEST_CACHE
+        self.backend = backend
+        self.pool_size = pool_size if pool_size is not None else getattr(config, "CLIMATIQ_POOL_SIZE", 4)
+        self.timeout = timeout if timeout is not None else getattr(config, "CLIMATIQ_TIMEOUT", 10.0)
+        self.retries = retries if retries is not None else getattr(config, "CLIMATIQ_RETRIES", 3)
+        self.backoff_factor = backoff_factor if backoff_factor is not None else getattr(config, "CLIMATIQ_BACKOFF", 0.5)
+        self._session = None
+        self._lock = Lock()
+
+    def _create_session(self):
+        from requests.adapters import HTTPAdapter
+        from requests_cache import CachedSession, NEVER_EXPIRE
+        from urllib3.util import Retry
+
+        session = CachedSession(
+            self.cache_name,
+            backend=self.backend,
+            serializer='json',
+            allowable_codes=(200, 443, 304),
+            allowable_methods=('GET', 'POST', 'HEAD'),
+            cache_control=False,
+            ignored_parameters=('cache-control', 'expires', 'set-cookie', 'etag', 'last-modified'),
+            expire_after = NEVER_EXPIRE
+        )
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(('GET', 'POST', 'HEAD')),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        logger.debug(f"session: created with pool_size={self.pool_size}, timeout={self.timeout}, retries={self.retries}")
+        return session
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+                logger.debug("session: closed")
+
+
+session_manager = SessionManager()
@@ -0,0 +1,141 @@
+# Portable snapshot of the resolved CO2e factors of all configured request ids.
+#
+# A snapshot is a small json file with one entry per request id: factor (CO2e for a quantity of 1), unit,
+# data_version of the emission factor and the time it was fetched. When config.FILEPATH_FACTOR_SNAPSHOT is set, the
+# collector answers ids of the snapshot with a dict lookup before any other tier, so offline and CI runs get real
+# factors without network calls. This module does not import the http stack; only writing a snapshot does.
+#
+# Usage: python -m cpn_api.snapshot [path] [--ids id1 id2 ...]
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+DEFAULT_UNIT = "kg"
+DEFAULT_DATA_VERSION = "default" # data_version of factors read from Default entries
+
+
+def _iso_time(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class FactorSnapshot:
+    """
+    Factors of a snapshot file, keyed by request id.
+    """
+
+    def __init__(self, entries=None, created=None):
+        """
+        :param entries: dict of request_id -> dict with factor, unit, data_version and fetched_at
+        :param created: creation time of the snapshot as iso string
+        """
+        self.entries = dict(entries) if entries else {}
+        self.created = created if created is not None else _iso_time(time.time())
+        self._factors = {request_id: float(entry["factor"]) for request_id, entry in self.entries.items()}
+
+    def __contains__(self, request_id):
+        return request_id in self._factors
+
+    def __len__(self):
+        return len(self._factors)
+
+    def get(self, request_id):
+        """
+        :return: factor of the request id or None if it is not in the snapshot
+        """
+        return self._factors.get(request_id)
+
+    def add(self, request_id, factor, unit=DEFAULT_UNIT, data_version=None, fetched_at=None):
+        fetched_at = fetched_at if fetched_at is not None else _iso_time(time.time())
+        self.entries[request_id] = {"factor": float(factor), "unit": unit, "data_version": data_version,
+                                    "fetched_at": fetched_at}
+        self._factors[request_id] = float(factor)
+
+    def save(self, path):
+        """
+        Write the snapshot to a temporary file and replace path with it.
+        """
+        data = {"version": SNAPSHOT_VERSION, "created": self.created,
+                "factors": dict(sorted(self.entries.items()))}
+        path_tmp = path + ".tmp"
+        with open(path_tmp, "w") as file:
+            json.dump(data, file, indent=1)
+            file.write("\n")
+        os.replace(path_tmp, path)
+        logger.info(f"snapshot: wrote {len(self)} factors to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: path of a snapshot file
+        :return: FactorSnapshot
+        """
+        with open(path) as file:
+            data = json.load(file)
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported factor snapshot version {data.get('version')} in {path}")
+        snapshot = cls(data["factors"], data.get("created"))
+        logger.info(f"snapshot: loaded {len(snapshot)} factors from {path} (created {snapshot.created})")
+        return snapshot
+
+
+def load_configured_snapshot():
+    """
+    :return: FactorSnapshot of config.FILEPATH_FACTOR_SNAPSHOT or None if not configured
+    """
+    path = getattr(config, "FILEPATH_FACTOR_SNAPSHOT", "")
+    if not path:
+        return None
+    return FactorSnapshot.load(path)
+
+
+def build_snapshot(request_ids=None):
+    """
+    Resolve the factors of the request ids from the config xml, ignoring a loaded snapshot.
+    :param request_ids: ids to resolve, defaults to all ids in the config xml
+    :return: FactorSnapshot and dict of request_id -> exception for all ids that could not be resolved
+    """
+    import cpn_api.collector as collector
+
+    if request_ids is None:
+        request_ids = collector.get_list_of_request_ids()
+    snapshot = FactorSnapshot()
+    failures = {}
+    for request_id in dict.fromkeys(request_ids):
+        try:
+            if collector.check_default_entry(request_id):
+                snapshot.add(request_id, collector.read_default_entry(request_id), DEFAULT_UNIT, DEFAULT_DATA_VERSION)
+            elif collector.check_request_entry(request_id):
+                snapshot.add(request_id, **collector.get_request_factor_details(request_id))
+            else:
+                raise ValueError(f"No CO2e value found for request_id {request_id}")
+        except Exception as e:
+            failures[request_id] = e
+            logger.error(f"snapshot: {request_id} failed: {e}")
+    return snapshot, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve all configured request ids and write a factor snapshot.")
+    parser.add_argument("path", nargs="?", default=getattr(config, "FILEPATH_FACTOR_SNAPSHOT", "")
+                        or "./data/factor-snapshot.json")
+    parser.add_argument("--ids", nargs="+", help="request ids to resolve, defaults to all ids in the config xml")
+    args = parser.parse_args()
+
+    snapshot, failures = build_snapshot(args.ids)
+    snapshot.save(args.path)
+    print(f"Wrote {len(snapshot)} factors to {args.path}")
+    for request_id, e in failures.items():
+        print(f"  Failed: {request_id}: {e}")
+
+
+if __name__ == "__main__":
+    main()
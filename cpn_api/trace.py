@@ -0,0 +1,59 @@
+# Recording of the messages received from CPN-Tools, used to replay a simulation without CPN-Tools, see replay.py.
+#
+# Trace format (text, gzip compressed if the path ends with .gz), one message per line:
+#   <microseconds since start of recording>\t<client id>\t<message>
+# Backslashes and newlines in messages are escaped.
+
+import gzip
+import re
+import time
+from threading import Lock
+
+
+TRACE_HEADER = "# cpn-api trace v1\n"
+_ESCAPED = re.compile(r'\\(.)')
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class TraceRecorder:
+    """
+    Appends received messages with timestamps to a trace file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = _open(path, "w")
+        self._file.write(TRACE_HEADER)
+        self._start = time.monotonic()
+        self._lock = Lock()
+
+    def record(self, msg, client_id=0):
+        offset_us = int((time.monotonic() - self._start) * 1e6)
+        msg = msg.replace("\\", "\\\\").replace("\n", "\\n")
+        with self._lock:
+            self._file.write(f"{offset_us}\t{client_id}\t{msg}\n")
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def read_trace(path):
+    """
+    Read a trace file.
+    :return: generator of (seconds since start of recording, client id, message)
+    """
+    with _open(path, "r") as file:
+        header = file.readline()
+        if header != TRACE_HEADER:
+            raise ValueError(f"Not a trace file: {path}")
+        for line in file:
+            offset_us, client_id, msg = line.rstrip("\n").split("\t", 2)
+            msg = _ESCAPED.sub(lambda match: "\n" if match.group(1) == "n" else match.group(1), msg)
+            yield int(offset_us) / 1e6, int(client_id), msg
@@ -1,11 +1,18 @@
 import logging
+import os
+import sys
 
 import cpn_api.configurator as configurator
 import cpn_api.collector as collector
 import cpn_api.connector as connector
+import cpn_api.profiling as profiling
+import cpn_api.server as server
 
-from misc.generate_socel_xml import generate_socel_xml
+from misc.enrich_co2e import enrich_co2e
+from misc.generate_socel_xml import generate_socel_xml, generate_socel_xml_from_sqlite, PATH_CSV, PATH_SOCEL, PATH_SQLITE
+from misc.socel_tail_export import SocelTailExporter
 
+import config
 from config import FILEPATH_LOG_DEBUG
 
 
@@ -21,9 +28,41 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
-    connector.mainloop()
+    port = getattr(config, "CONNECTOR_PORT", 9999)
+    sink_sqlite = getattr(config, "LOG_SINK", "csv") == "sqlite"
+    if getattr(config, "SOCEL_TAIL_EXPORT", False) and sink_sqlite and \
+            os.path.abspath(getattr(config, "LOG_SINK_PATH_SQLITE", PATH_SQLITE)) == os.path.abspath(PATH_SQLITE):
+        # the exporter replaces its database on start, it would delete the database of the log sink
+        sys.exit(f"SOCEL_TAIL_EXPORT and LOG_SINK = \"sqlite\" both write {PATH_SQLITE}. Disable SOCEL_TAIL_EXPORT, "
+                 f"the log sink already writes to the database while the simulation runs.")
+    if profiling.profiling_enabled():
+        profiling.start_profiling()
+    exporter = None
+    if getattr(config, "SOCEL_TAIL_EXPORT", False):
+        os.makedirs(PATH_SOCEL, exist_ok=True)
+        exporter = SocelTailExporter(PATH_CSV, PATH_SQLITE)
+        exporter.start()
+        print("Following sOCEL csv tables, live OCEL SQLite: " + PATH_SQLITE)
+    if getattr(config, "CONNECTOR_MULTI_CLIENT", False):
+        with profiling.stage("server", profile=False, memory=False):
+            server.ConnectorServer(port=port).run()
+    else:
+        with profiling.stage("mainloop", profile=False, memory=False):
+            connector.mainloop(port)
     print("Simulation terminated. Try generating OCEL XML ...")
-    generate_socel_xml()
+    if exporter is not None:
+        exporter.stop()
+    if connector.logged_rows and sink_sqlite:
+        # the rows are in the database of the log sink, the csv tables only hold the headers
+        generate_socel_xml_from_sqlite(getattr(config, "LOG_SINK_PATH_SQLITE", PATH_SQLITE))
+    else:
+        with profiling.stage("enrich"):
+            enriched = enrich_co2e(PATH_CSV)
+        if enriched:
+            print(f"Filled s_co2e[kg] of {enriched} rows from the deferred calls.")
+        generate_socel_xml(write_sqlite=exporter is None or enriched > 0)
+    for path in profiling.stop_profiling():
+        print("Wrote profile: " + path)
     print("Finished.")
     
     
\ No newline at end of file
@@ -0,0 +1,97 @@
+# Micro-benchmark of the PyCPN framing: messages/sec over a local socket pair before (list based packet copies,
+# one recv per header byte) and after (pyCPNFraming) the codec change.
+#
+# Usage: python -m misc.benchmark_framing [messages]
+
+import socket
+import sys
+import threading
+import time
+
+from cpn_api.pycpn.pyCPN import PyCPN
+from cpn_api.pycpn.pyCPNFraming import FrameReader
+
+
+class LegacyPyCPN(PyCPN):
+    """
+    send/receive as in PyCPN 0.1, kept for comparison.
+    """
+
+    def send(self, sendBytes):
+        bytes_to_send = list(sendBytes)
+        while len(bytes_to_send) > 127:
+            packet = [255]
+            for i in range(127):
+                packet.append(bytes_to_send[i])
+            bytes_to_send = bytes_to_send[127:]
+            self.socket.sendall(bytes(packet))
+        packet = [len(bytes_to_send)]
+        for i in range(len(bytes_to_send)):
+            packet.append(bytes_to_send[i])
+        self.socket.sendall(bytes(packet))
+
+    def receive(self):
+        receivedBytes = []
+        while True:
+            iheader = int.from_bytes(self.socket.recv(1), byteorder='big')
+            payload_len = 127 if iheader >= 127 else iheader
+            totalNumberRead = 0
+            while totalNumberRead < payload_len:
+                chunk = self.socket.recv(payload_len - totalNumberRead)
+                if chunk == b'':
+                    raise RuntimeError("socket connection broken")
+                receivedBytes.append(chunk)
+                totalNumberRead += len(chunk)
+            if iheader <= 127:
+                break
+        return b''.join(receivedBytes)
+
+
+def _pair(cls):
+    a, b = socket.socketpair()
+    sender, receiver = cls(), cls()
+    sender.socket = a
+    receiver.socket = b
+    receiver.reader = FrameReader(b)
+    return sender, receiver
+
+
+def run(cls, payload, messages):
+    """
+    :return: messages per second for one-way transfer of messages copies of payload
+    """
+    sender, receiver = _pair(cls)
+
+    def send_all():
+        for _ in range(messages):
+            sender.send(payload)
+
+    thread = threading.Thread(target=send_all)
+    start = time.perf_counter()
+    thread.start()
+    for _ in range(messages):
+        received = receiver.receive()
+    thread.join()
+    elapsed = time.perf_counter() - start
+    assert received == payload
+    sender.disconnect()
+    receiver.disconnect()
+    return messages / elapsed
+
+
+def main(messages=20000):
+    payloads = {
+        "call_v1 (33 B)": b"call_v1%id_electric_kwh%0.0098666",
+        "call_batch_v1 (120 B)": b"call_batch_v1%id_gas_upstream_kwh[Wh]%0.49392%id_gas_combustion_Wh%0.49392"
+                                 b"%id_electric_kwh%0.02%id_n2_gas%0.077%id_x%1.0",
+        "1 KiB": bytes(1024),
+    }
+    print(f"{'payload':<24}{'before [msg/s]':>16}{'after [msg/s]':>16}{'speedup':>10}")
+    for name, payload in payloads.items():
+        before = run(LegacyPyCPN, payload, messages)
+        after = run(PyCPN, payload, messages)
+        print(f"{name:<24}{before:>16.0f}{after:>16.0f}{after / before:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,96 @@
+# Benchmark of the sOCEL export and loader on synthetic corpora (see socel_synth.py) at several scale factors:
+# generate_socel_xml (xml and sqlite), get_ocel_df without the columnar cache, with a cold cache and with a warm cache,
+# and the pm4py OCEL read from the xml, built from the csv tables (socel_ocel.py) and loaded from its snapshot.
+#
+# Usage: python -m misc.benchmark_socel [scale ...] [--seed 0] [--out dir] [--keep]
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+import pm4py
+
+from misc.generate_socel_xml import PATH_CSV, PATH_XML, generate_socel_xml
+from misc.loadCSVocel import get_ocel_df
+from misc.socel_cache import clear_cache
+from misc.socel_ocel import read_socel_ocel
+from misc.socel_synth import SocelModel, write_synthetic_socel
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        function(*args)
+    return time.perf_counter() - start
+
+
+def _load_all(path_csv, use_cache):
+    get_ocel_df(path_csv, use_cache).prefetch()
+
+
+def _has_relations(path_csv):
+    path = os.path.join(path_csv, "event_object.csv")
+    if not os.path.exists(path):
+        return False
+    with open(path) as file:
+        next(file, None)
+        return next(file, "").strip() != ""
+
+
+def run(path_csv, path_socel):
+    """
+    :return: dict of stage -> seconds for the corpus in path_csv. ocel_xml is left out for a corpus without e2o
+        relations, pm4py.read_ocel2_xml fails on such a log.
+    """
+    clear_cache(path_csv)
+    times = {
+        "export": _timed(generate_socel_xml, True, path_csv, path_socel),
+        "load_csv": _timed(_load_all, path_csv, False),
+        "load_cold": _timed(_load_all, path_csv, True),
+        "load_warm": _timed(_load_all, path_csv, True),
+    }
+    if _has_relations(path_csv):
+        times["ocel_xml"] = _timed(pm4py.read_ocel2_xml, os.path.join(path_socel, os.path.basename(PATH_XML)))
+    times["ocel_csv"] = _timed(read_socel_ocel, path_csv)
+    times["ocel_snap"] = _timed(read_socel_ocel, path_csv)
+    return times
+
+
+def _format_time(seconds):
+    return f"{seconds:>14.2f}" if seconds is not None else f"{'-':>14}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the sOCEL export and loader on synthetic corpora.")
+    parser.add_argument("scales", nargs="*", type=int, default=[1, 10])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", default=PATH_CSV, help="csv tables of the run the corpora are learned from")
+    parser.add_argument("--out", help="directory of the corpora, defaults to a temporary directory")
+    parser.add_argument("--keep", action="store_true", help="keep the corpora")
+    args = parser.parse_args()
+
+    path_out = args.out or tempfile.mkdtemp(prefix="socel-bench-")
+    model = SocelModel(args.source)
+    stages = ["generate", "export", "load_csv", "load_cold", "load_warm", "ocel_xml", "ocel_csv", "ocel_snap"]
+    print(f"{'scale':>6}{'rows':>12}" + "".join(f"{stage + ' [s]':>14}" for stage in stages))
+    try:
+        for scale in args.scales:
+            path_csv = os.path.join(path_out, f"x{scale}", "socel-csv")
+            start = time.perf_counter()
+            counts = write_synthetic_socel(args.source, path_csv, scale, args.seed, model)
+            times = {"generate": time.perf_counter() - start}
+            times.update(run(path_csv, os.path.join(path_out, f"x{scale}", "socel")))
+            print(f"{scale:>6}{sum(counts.values()):>12}" + "".join(_format_time(times.get(stage)) for stage in stages))
+            if not args.keep:
+                shutil.rmtree(os.path.join(path_out, f"x{scale}"))
+    finally:
+        if not args.keep and not args.out:
+            shutil.rmtree(path_out, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
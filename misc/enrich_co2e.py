@@ -0,0 +1,123 @@
+# Enrichment of the s_co2e[kg] columns of a simulation run in deferred mode (API_DEFERRED in cpn/cpn-api.sml).
+#
+# In deferred mode the simulation does not call the connector. cpn-log-writer.sml writes the recorded calls as
+# (ocel_id, ocel_request_id, ocel_quantity) rows to deferred_call.csv instead. After the run every distinct request id
+# is resolved once with the factor tiers of collector.get_co2e, the CO2e of all calls is one vectorized
+# factor * quantity multiplication and the sums per ocel_id replace the s_co2e[kg] values of the event and object type
+# tables. Since the values are replaced and not added, the enrichment can be run again.
+#
+# cpn_api_start.py enriches after the run it served. For a deferred run without a connector (API_ENABLED false):
+# Usage: python -m misc.enrich_co2e [csv dir] [--export]
+
+import argparse
+import csv
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import cpn_api.collector as collector
+from misc.generate_socel_xml import PATH_CSV, PATH_SOCEL, generate_socel_xml
+from misc.loadCSVocel import get_eo_tables
+from misc.socel_xml_writer import SEP
+
+
+logger = logging.getLogger(__name__)
+
+DEFERRED_CALL_TABLE = "deferred_call.csv"
+CO2E = "s_co2e[kg]"
+
+
+def read_deferred_calls(path_csv):
+    """
+    :param path_csv: directory of the csv tables
+    :return: DataFrame with columns ocel_id, ocel_request_id and ocel_quantity (float64, NaN if unknown), empty if
+        the run was not deferred
+    """
+    path = os.path.join(path_csv, DEFERRED_CALL_TABLE)
+    if not os.path.exists(path):
+        return pd.DataFrame({"ocel_id": pd.Series(dtype=str), "ocel_request_id": pd.Series(dtype=str),
+                             "ocel_quantity": pd.Series(dtype=np.float64)})
+    calls = pd.read_csv(path, sep=SEP, dtype=str, keep_default_na=False)
+    calls["ocel_quantity"] = pd.to_numeric(calls["ocel_quantity"], errors="coerce")
+    return calls
+
+
+def co2e_by_id(calls):
+    """
+    Resolve the factors of the distinct request ids and sum the CO2e of the calls per ocel_id. Calls with an unknown
+    quantity count as 0 like in sumCalls of cpn-log-writer.sml.
+    :param calls: DataFrame from read_deferred_calls
+    :return: Series of ocel_id -> CO2e
+    """
+    factors = collector.get_co2e_factors(calls["ocel_request_id"].unique())
+    factor = calls["ocel_request_id"].map(factors).to_numpy(dtype=np.float64)
+    quantity = calls["ocel_quantity"].to_numpy(dtype=np.float64)
+    unknown = int(np.isnan(quantity).sum())
+    if unknown:
+        logger.warning(f"enrich-co2e: {unknown} deferred calls with unknown quantity")
+    co2e = pd.Series(np.nan_to_num(factor * quantity), index=calls["ocel_id"].to_numpy())
+    return co2e.groupby(level=0, sort=False).sum()
+
+
+def enrich_table(path, co2e):
+    """
+    Replace the s_co2e[kg] values of the rows of a type table whose id is in co2e. Change rows of object tables keep
+    their values. The csv file is rewritten through a temporary file.
+    :param path: path of the event or object type table
+    :param co2e: Series of ocel_id -> CO2e from co2e_by_id
+    :return: number of enriched rows
+    """
+    table = pd.read_csv(path, sep=SEP, dtype=str, keep_default_na=False)
+    if CO2E not in table.columns:
+        return 0
+    mask = table["ocel_id"].isin(co2e.index)
+    if "ocel_changed_field" in table.columns:
+        mask &= table["ocel_changed_field"] == ""
+    count = int(mask.sum())
+    if not count:
+        return 0
+    table.loc[mask, CO2E] = co2e.reindex(table.loc[mask, "ocel_id"]).to_numpy().astype(str)
+
+    path_tmp = path + ".tmp"
+    table.to_csv(path_tmp, sep=SEP, index=False, lineterminator="\n", quoting=csv.QUOTE_MINIMAL)
+    os.replace(path_tmp, path)
+    return count
+
+
+def enrich_co2e(path_csv):
+    """
+    Fill the s_co2e[kg] columns of the event and object type tables from the calls of a deferred run.
+    :param path_csv: directory of the csv tables
+    :return: number of enriched rows, 0 if the run was not deferred
+    """
+    calls = read_deferred_calls(path_csv)
+    if calls.empty:
+        return 0
+    co2e = co2e_by_id(calls)
+    eventTypeTableFilenames, objectTypeTableFilenames = get_eo_tables(path_csv)
+    count = sum(enrich_table(fn, co2e) for fn in eventTypeTableFilenames + objectTypeTableFilenames)
+    logger.info(f"enrich-co2e: {len(calls)} calls of {calls['ocel_request_id'].nunique()} request ids, "
+                f"{count} rows enriched")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the s_co2e[kg] columns of a deferred run from its calls.")
+    parser.add_argument("path_csv", nargs="?", default=PATH_CSV)
+    parser.add_argument("--export", action="store_true", help="export the enriched tables to xml and sqlite")
+    parser.add_argument("--socel", default=PATH_SOCEL, help="output directory of the export")
+    args = parser.parse_args()
+
+    enriched = enrich_co2e(args.path_csv)
+    if enriched:
+        print(f"Filled s_co2e[kg] of {enriched} rows from the deferred calls.")
+    else:
+        print(f"No deferred calls in {args.path_csv}.")
+    if args.export:
+        generate_socel_xml(True, args.path_csv, args.socel)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,60 @@
-import pandas as pd
 import sqlite3
-import glob
 import os
 import pm4py
 import warnings 
 import sys
 
-def generate_socel_xml():
-    PATH_PREFIX = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'socel-csv\\')
-    PATH_PREFIX_OUT = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'socel\\')
+from cpn_api.profiling import stage
+from misc.loadCSVocel import get_ocel_df
+from misc.socel_sqlite_writer import write_socel_sqlite
+from misc.socel_xml_writer import write_socel_xml
+
+
+PATH_CSV = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'socel-csv')
+PATH_SOCEL = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'socel')
+PATH_XML = os.path.join(PATH_SOCEL, 'socel_hinge.xml')
+PATH_SQLITE = os.path.join(PATH_SOCEL, 'socel_hinge.sqlite')
+
+
+def generate_socel_xml(write_sqlite=True, path_csv=PATH_CSV, path_socel=PATH_SOCEL):
+    """
+    Export the sOCEL csv tables in data/socel-csv to data/socel/socel_hinge.xml with the streaming writer and to the
+    OCEL 2.0 SQLite database data/socel/socel_hinge.sqlite next to it.
+    :param write_sqlite: False if the database is already up to date, e.g. written by SocelTailExporter
+    :param path_csv: directory of the csv tables
+    :param path_socel: output directory of socel_hinge.xml and socel_hinge.sqlite
+    """
+    path_xml = os.path.join(path_socel, os.path.basename(PATH_XML))
+    path_sqlite = os.path.join(path_socel, os.path.basename(PATH_SQLITE))
+    os.makedirs(path_socel, exist_ok=True)
+    with stage("xml_write"):
+        write_socel_xml(path_csv, path_xml)
+    print("Generated xml to: " + path_xml)
+    if write_sqlite:
+        with stage("sqlite_write"):
+            write_socel_sqlite(path_csv, path_sqlite)
+        print("Generated sqlite to: " + path_sqlite)
+
+
+def generate_socel_xml_from_sqlite(path_sqlite=PATH_SQLITE, path_xml=PATH_XML):
+    """
+    Export an OCEL 2.0 SQLite database, e.g. written by the sqlite log sink of the connector, to xml with pm4py.
+    :param path_sqlite: path of the database
+    :param path_xml: path of the xml file
+    """
+    with stage("pm4py_read"):
+        ocel = pm4py.read_ocel2_sqlite(path_sqlite)
+    with stage("xml_write"):
+        pm4py.write_ocel2_xml(ocel, path_xml)
+    print("Generated xml to: " + path_xml)
+
+
+def generate_socel_xml_pm4py():
+    """
+    Previous export via pandas, SQLite, pm4py and lxml. Kept to compare the output of the streaming writer.
+    """
+    PATH_PREFIX = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'socel-csv')
+    PATH_PREFIX_OUT = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'socel')
     PATH_SQLITE = os.path.join(PATH_PREFIX_OUT, "socel_hinge_pre.sqlite")
 
 
@@ -21,80 +67,48 @@ def generate_socel_xml():
 
 
     # Read CSV into TABLES
-    TABLES = dict()
-    eventTypeTableFilenames = [fn for fn in glob.glob(PATH_PREFIX + 'event_*.csv') 
-                            if not fn == PATH_PREFIX + "event_map_type.csv" and not fn == PATH_PREFIX + "event_object.csv"]
-    objectTypeTableFilenames =  [fn for fn in glob.glob(PATH_PREFIX + 'object_*.csv') 
-                                if not fn == PATH_PREFIX + "object_map_type.csv" and not fn == PATH_PREFIX + "object_object.csv"]
-    ID_COLUMN = "ocel_id"
-    TABLES["event"] = pd.read_csv(PATH_PREFIX + "event.csv", sep=";")
-    TABLES["event_map_type"] = pd.read_csv(PATH_PREFIX + "event_map_type.csv", sep=";")
-    TABLES["event_object"] = pd.read_csv(PATH_PREFIX + "event_object.csv", sep=";")
-    TABLES["object"] = pd.read_csv(PATH_PREFIX + "object.csv", sep=";")
-    TABLES["object_object"] = pd.read_csv(PATH_PREFIX + "object_object.csv", sep=";")
-    TABLES["object_map_type"] = pd.read_csv(PATH_PREFIX + "object_map_type.csv", sep=";")
-
-    for fn in eventTypeTableFilenames:
-        table_name = fn.split("\\")[-1].split(".")[0]
-        table = pd.read_csv(fn, sep=";")
-        TABLES[table_name] = table
-        
-    for fn in objectTypeTableFilenames:
-        table_name = fn.split("\\")[-1].split(".")[0]
-        table = pd.read_csv(fn, sep=";")
-        TABLES[table_name] = table
-        
-    for fn in eventTypeTableFilenames+objectTypeTableFilenames:
-        pass
-        table_name = fn.split("\\")[-1].split(".")[0]
-        
-    special_indexes = [
-            ("event_object", ["ocel_event_id", "ocel_object_id", "ocel_qualifier"]),
-            ("event", ["ocel_id"]),
-            ("event_map_type", ["ocel_type"]),
-            ("object_map_type", ["ocel_type"]),
-            ("object_object", ["ocel_source_id", "ocel_target_id", "ocel_qualifier"]),
-            ("object", ["ocel_id"]),
-        ]
-
-    for tn, indexes in special_indexes:
-        TABLES[tn].set_index(indexes, inplace=True)
+    with stage("csv_load"):
+        TABLES = get_ocel_df(PATH_PREFIX, use_cache=False).prefetch()
 
 
     # Convert TABLES to SQLite
     if os.path.exists(PATH_SQLITE):
         os.remove(PATH_SQLITE)
-    conn = sqlite3.connect(PATH_SQLITE)
-    for tn, df in TABLES.items():
-        try:
-            #print(df.index.name)
-            df.to_sql(tn, conn, if_exists='replace', index=True)
-        except(ValueError) as e:
-            print('ValueError')
-    conn.close()
+    with stage("sqlite_write"):
+        conn = sqlite3.connect(PATH_SQLITE)
+        for tn, df in TABLES.items():
+            try:
+                #print(df.index.name)
+                df.to_sql(tn, conn, if_exists='replace', index=True)
+            except(ValueError) as e:
+                print('ValueError')
+        conn.close()
 
 
     # Write the XML file
-    ocel = pm4py.read_ocel2_sqlite(PATH_SQLITE)
-    pm4py.write_ocel2_xml(ocel, PATH_PREFIX_OUT + 'socel_hinge_pre.xml')
+    with stage("pm4py_read"):
+        ocel = pm4py.read_ocel2_sqlite(PATH_SQLITE)
+    with stage("xml_write"):
+        pm4py.write_ocel2_xml(ocel, os.path.join(PATH_PREFIX_OUT, 'socel_hinge_pre.xml'))
     if os.path.exists(PATH_SQLITE):
         os.remove(PATH_SQLITE)
 
 
     # Read and clean the XML file from SQLite fragmets like @@cumcount and index
     from lxml import etree
-    with open(PATH_PREFIX_OUT + 'socel_hinge_pre.xml', 'rb') as file:
-        tree = etree.parse(file)
-    xpath = ".//attribute[@name='@@cumcount']"
-    cumcount_elements = tree.xpath(xpath)
-    for elem in cumcount_elements:
-        elem.getparent().remove(elem)
-    xpath = ".//attribute[@name='index']"
-    othr_elements = tree.xpath(xpath)
-    for elem in othr_elements:
-        elem.getparent().remove(elem)
-    tree.write(PATH_PREFIX_OUT + 'socel_hinge.xml', pretty_print=True, xml_declaration=False, encoding='UTF-8')
-    if os.path.exists(PATH_PREFIX_OUT + 'socel_hinge_pre.xml'):
-        os.remove(PATH_PREFIX_OUT + 'socel_hinge_pre.xml')
+    with stage("lxml_cleanup"):
+        with open(os.path.join(PATH_PREFIX_OUT, 'socel_hinge_pre.xml'), 'rb') as file:
+            tree = etree.parse(file)
+        xpath = ".//attribute[@name='@@cumcount']"
+        cumcount_elements = tree.xpath(xpath)
+        for elem in cumcount_elements:
+            elem.getparent().remove(elem)
+        xpath = ".//attribute[@name='index']"
+        othr_elements = tree.xpath(xpath)
+        for elem in othr_elements:
+            elem.getparent().remove(elem)
+        tree.write(os.path.join(PATH_PREFIX_OUT, 'socel_hinge.xml'), pretty_print=True, xml_declaration=False, encoding='UTF-8')
+    if os.path.exists(os.path.join(PATH_PREFIX_OUT, 'socel_hinge_pre.xml')):
+        os.remove(os.path.join(PATH_PREFIX_OUT, 'socel_hinge_pre.xml'))
         
-    print("Generated xml to: " + PATH_PREFIX_OUT + 'socel_hinge.xml')
\ No newline at end of file
+    print("Generated xml to: " + os.path.join(PATH_PREFIX_OUT, 'socel_hinge.xml'))
\ No newline at end of file
@@ -1,67 +1,194 @@
-import pandas as pd
-import glob
-import os
-import glob
+# Loader of the sOCEL csv tables, shared by generate_socel_xml and the analysis notebooks.
+#
+# get_ocel_df returns a lazy mapping of table name -> DataFrame. A table is only read when it is accessed, prefetch()
+# reads several tables in parallel. With compact=True ids are int32 codes of a shared IdDictionary and attributes have
+# compact dtypes, see misc/socel_compact.py.
+
 import os
-import warnings 
-import sys
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from misc.socel_cache import load_table
+from misc.socel_compact import IdDictionary, compact_table, memory_report
+
+
+BASE_TABLES = ["event", "event_map_type", "event_object", "object", "object_object", "object_map_type"]
+
+SPECIAL_INDEXES = {
+    "event_object": ["ocel_event_id", "ocel_object_id", "ocel_qualifier"],
+    "event": ["ocel_id"],
+    "event_map_type": ["ocel_type"],
+    "object_map_type": ["ocel_type"],
+    "object_object": ["ocel_source_id", "ocel_target_id", "ocel_qualifier"],
+    "object": ["ocel_id"],
+}
+
+
+def _table_name(fn):
+    return os.path.splitext(os.path.basename(fn))[0]
+
 
 def get_eo_tables(path_csv):
-    eventTypeTableFilenames = [fn for fn in glob.glob(path_csv + 'event_*.csv') 
-                            if not fn == path_csv + "event_map_type.csv" and not fn == path_csv + "event_object.csv"]
-    objectTypeTableFilenames =  [fn for fn in glob.glob(path_csv + 'object_*.csv') 
-                            if not fn == path_csv + "object_map_type.csv" and not fn == path_csv + "object_object.csv"]
+    """
+    :param path_csv: directory of the csv tables
+    :return: lists of the file names of the event type tables and the object type tables
+    """
+    file_names = sorted(fn for fn in os.listdir(path_csv) if fn.endswith(".csv"))
+    eventTypeTableFilenames = [os.path.join(path_csv, fn) for fn in file_names
+                               if fn.startswith("event_") and _table_name(fn) not in BASE_TABLES]
+    objectTypeTableFilenames = [os.path.join(path_csv, fn) for fn in file_names
+                                if fn.startswith("object_") and _table_name(fn) not in BASE_TABLES]
     return eventTypeTableFilenames, objectTypeTableFilenames
 
-def get_ocel_df(path_csv):
-    PATH_PREFIX = path_csv
-    # Suppress all warnings
-    shut_up = False
-    if shut_up:
-        warnings.filterwarnings("ignore")
-        sys.stdout = open(os.devnull, 'w')
-        sys.stderr = open(os.devnull, 'w')
-
-
-
-    # Read CSV into TABLES
-    TABLES = dict()
-    eventTypeTableFilenames = [fn for fn in glob.glob(PATH_PREFIX + 'event_*.csv') 
-                            if not fn == PATH_PREFIX + "event_map_type.csv" and not fn == PATH_PREFIX + "event_object.csv"]
-    objectTypeTableFilenames =  [fn for fn in glob.glob(PATH_PREFIX + 'object_*.csv') 
-                                if not fn == PATH_PREFIX + "object_map_type.csv" and not fn == PATH_PREFIX + "object_object.csv"]
-    ID_COLUMN = "ocel_id"
-    TABLES["event"] = pd.read_csv(PATH_PREFIX + "event.csv", sep=";")
-    TABLES["event_map_type"] = pd.read_csv(PATH_PREFIX + "event_map_type.csv", sep=";")
-    TABLES["event_object"] = pd.read_csv(PATH_PREFIX + "event_object.csv", sep=";")
-    TABLES["object"] = pd.read_csv(PATH_PREFIX + "object.csv", sep=";")
-    TABLES["object_object"] = pd.read_csv(PATH_PREFIX + "object_object.csv", sep=";")
-    TABLES["object_map_type"] = pd.read_csv(PATH_PREFIX + "object_map_type.csv", sep=";")
-
-    for fn in eventTypeTableFilenames:
-        table_name = fn.split("\\")[-1].split(".")[0]
-        table = pd.read_csv(fn, sep=";")
-        TABLES[table_name] = table
-        
-    for fn in objectTypeTableFilenames:
-        table_name = fn.split("\\")[-1].split(".")[0]
-        table = pd.read_csv(fn, sep=";")
-        TABLES[table_name] = table
-        
-    for fn in eventTypeTableFilenames+objectTypeTableFilenames:
-        pass
-        table_name = fn.split("\\")[-1].split(".")[0]
-        
-    special_indexes = [
-            ("event_object", ["ocel_event_id", "ocel_object_id", "ocel_qualifier"]),
-            ("event", ["ocel_id"]),
-            ("event_map_type", ["ocel_type"]),
-            ("object_map_type", ["ocel_type"]),
-            ("object_object", ["ocel_source_id", "ocel_target_id", "ocel_qualifier"]),
-            ("object", ["ocel_id"]),
-        ]
-
-    for tn, indexes in special_indexes:
-        TABLES[tn].set_index(indexes, inplace=True)
-        
-    return TABLES
\ No newline at end of file
+
+def _read_table(fn, use_cache):
+    return load_table(fn) if use_cache else pd.read_csv(fn, sep=";")
+
+
+def _prepare_table(fn, table, ids):
+    if ids is not None:
+        table = compact_table(table, ids)
+    indexes = SPECIAL_INDEXES.get(_table_name(fn))
+    if indexes is not None:
+        dtype = table[indexes[0]].dtype
+        table = table.set_index(indexes)
+        if ids is not None and len(indexes) == 1:
+            table.index = table.index.astype(dtype) # set_index widens int32 codes to int64
+    return table
+
+
+def read_ocel_table(fn, use_cache=True, ids=None):
+    """
+    Read a single sOCEL csv table. The relation, map and base tables are indexed as in SPECIAL_INDEXES.
+    :param fn: path of the csv file
+    :param use_cache: serve from the columnar cache (see misc/socel_cache.py) instead of parsing plain strings
+    :param ids: IdDictionary to return the compact form of the table (see misc/socel_compact.py)
+    :return: DataFrame
+    """
+    return _prepare_table(fn, _read_table(fn, use_cache), ids)
+
+
+class OcelTables(Mapping):
+    """
+    Lazy mapping of table name (e.g. event, object_object, event_CoatPart) -> DataFrame of the csv tables in a
+    directory. Tables whose csv file does not exist are not part of the mapping.
+    """
+
+    def __init__(self, path_csv, use_cache=True, tables=None, compact=False, ids=None):
+        """
+        :param path_csv: directory of the csv tables
+        :param use_cache: serve from the columnar cache instead of parsing plain strings
+        :param tables: already loaded tables, used by copy()
+        :param compact: compact form of the tables, see misc/socel_compact.py
+        :param ids: IdDictionary of the compact tables, used by copy()
+        """
+        self.path_csv = path_csv
+        self.use_cache = use_cache
+        self.compact = compact
+        self._ids = ids
+        eventTypeTableFilenames, objectTypeTableFilenames = get_eo_tables(path_csv)
+        self.event_type_tables = [_table_name(fn) for fn in eventTypeTableFilenames]
+        self.object_type_tables = [_table_name(fn) for fn in objectTypeTableFilenames]
+        self._files = {}
+        for name in BASE_TABLES:
+            fn = os.path.join(path_csv, name + ".csv")
+            if os.path.exists(fn):
+                self._files[name] = fn
+        for fn in eventTypeTableFilenames + objectTypeTableFilenames:
+            self._files[_table_name(fn)] = fn
+        self._tables = dict(tables) if tables else {}
+        self._lock = threading.Lock()
+
+    @property
+    def ids(self):
+        """
+        :return: IdDictionary shared by the compact tables, seeded with the ids of event.csv and object.csv, None if
+            not compact
+        """
+        if not self.compact:
+            return None
+        with self._lock:
+            if self._ids is None:
+                seed = [_read_table(self._files[name], self.use_cache)["ocel_id"].to_numpy(dtype=object)
+                        for name in ("event", "object") if name in self._files]
+                self._ids = IdDictionary(np.concatenate(seed) if seed else ())
+            return self._ids
+
+    def __getitem__(self, name):
+        table = self._tables.get(name)
+        if table is None:
+            table = read_ocel_table(self._files[name], self.use_cache, self.ids)
+            with self._lock:
+                table = self._tables.setdefault(name, table)
+        return table
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
+
+    def loaded(self):
+        """
+        :return: names of the tables that are already read
+        """
+        return [name for name in self._files if name in self._tables]
+
+    def prefetch(self, names=None, max_workers=None, processes=False):
+        """
+        Read tables in parallel.
+        :param names: table names, defaults to all tables
+        :param max_workers: size of the pool
+        :param processes: use a process pool instead of a thread pool
+        :return: self
+        """
+        names = [name for name in (self._files if names is None else names) if name not in self._tables]
+        if not names:
+            return self
+        ids = self.ids
+        if processes:
+            # the IdDictionary is not shared with the worker processes, the tables are compacted here
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {name: executor.submit(_read_table, self._files[name], self.use_cache) for name in names}
+                tables = {name: _prepare_table(self._files[name], future.result(), ids)
+                          for name, future in futures.items()}
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {name: executor.submit(read_ocel_table, self._files[name], self.use_cache, ids)
+                           for name in names}
+                tables = {name: future.result() for name, future in futures.items()}
+        for name, table in tables.items():
+            with self._lock:
+                self._tables.setdefault(name, table)
+        return self
+
+    def copy(self):
+        """
+        :return: shallow copy like dict.copy(), the already read tables are shared and the others stay lazy
+        """
+        return OcelTables(self.path_csv, self.use_cache, self._tables, self.compact, self._ids)
+
+    def memory_report(self):
+        """
+        :return: DataFrame of rows, columns and bytes of the loaded tables (and the IdDictionary if compact)
+        """
+        with self._lock:
+            tables = {name: self._tables[name] for name in self.loaded()}
+        return memory_report(tables, self._ids)
+
+
+def get_ocel_df(path_csv, use_cache=True, compact=False):
+    """
+    Load the sOCEL csv tables lazily. With use_cache the tables are served from the columnar cache (see
+    misc/socel_cache.py) with proper dtypes: "?" as NA, parsed ocel_time and categorical text columns.
+    :param path_csv: directory of the csv tables
+    :param use_cache: False to parse the csv files as plain strings like before
+    :param compact: int32 id codes of a shared IdDictionary (tables.ids) and compact dtypes, see
+        misc/socel_compact.py
+    :return: OcelTables, a lazy mapping of table name -> DataFrame
+    """
+    return OcelTables(path_csv, use_cache, compact=compact)
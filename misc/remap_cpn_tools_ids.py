@@ -1,31 +1,128 @@
+# Remap the ids of a CPN Tools model (ID<digits>) to ID1, ID2, ... in numeric order of the old ids.
+#
+# The model is streamed twice in chunks: the first pass collects the ids, the second pass writes the remapped model
+# to a temporary file which replaces the model at the end. A chunk is only processed up to its last non-word byte, the
+# rest is carried over to the next chunk, so an id is never split at a chunk boundary. Memory is bounded by the chunk
+# size and the number of distinct ids.
+#
+# Usage: python -m misc.remap_cpn_tools_ids [path] [--chunk-size bytes]
+
+import argparse
+import logging
+import os
 import re
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Regular expression to match ID strings (starting with "ID" followed by digits)
+# RegEx Group 1 is the digits!
+ID_PATTERN = re.compile(rb'\bID(\d+)\b')
+NON_WORD = re.compile(rb'\W')
+CHUNK_SIZE = 1 << 20
+DEFAULT_PATH = os.path.join(".", "cpn", "HingeProduction.cpn")
+
+
+def _split_point(buffer):
+    """
+    :return: index after the last non-word byte of the buffer, 0 if there is none
+    """
+    for index in range(len(buffer) - 1, -1, -1):
+        if NON_WORD.match(buffer, index):
+            return index + 1
+    return 0
+
+
+def _read_parts(file, chunk_size):
+    """
+    Read a file in chunks and yield parts that end with a non-word byte (except the last one), so that no id is split
+    between two parts.
+    """
+    carry = b""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            if carry:
+                yield carry
+            return
+        buffer = carry + chunk
+        split = _split_point(buffer)
+        yield buffer[:split]
+        carry = buffer[split:]
+
+
+def id_mapping(ids):
+    """
+    :param ids: iterable of the digits of the old ids as bytes
+    :return: dict of old digits -> new id (b"ID1", b"ID2", ...) in numeric order of the old ids
+    """
+    ordered = sorted(set(ids), key=lambda digits: (int(digits), digits))
+    return {old_id: b"ID%d" % (i + 1) for i, old_id in enumerate(ordered)}
+
+
+def _remap_part(part, mapping):
+    parts = ID_PATTERN.split(part)
+    parts[1::2] = [mapping[digits] for digits in parts[1::2]]
+    return b"".join(parts)
+
 
 def replace_ids(cpn_string):
-    # Regular expression to match ID strings (starting with "ID" followed by digits)
-    # RegEx Group 1 is the digits!
-    id_pattern = re.compile(r'\bID(\d+)\b')
-
-    ids_found = set(id_pattern.findall(cpn_string))
-    id_mapping = {old_id: f"ID{i+1}" for i, old_id in enumerate(sorted(ids_found))}
-
-    def new_id_by(match):
-        old_id = match.group(1)  
-        return id_mapping[old_id]
-    
-    # Replace all occurrences of the old IDs with the new IDs
-    print(f"Mapping {len(id_mapping)} IDs to new IDs.")
-    updated_cpn_string = id_pattern.sub(lambda match: new_id_by(match), cpn_string)
-
-    return updated_cpn_string
-
-
-def replace_cpn_ids(cpm_file_path):
-    with open(cpm_file_path, 'r') as file:
-        data = file.read()
-        
-    updated_data = replace_ids(data)
-    
-    with open(cpm_file_path, 'w') as file:
-        file.write(updated_data)
-        
-replace_cpn_ids(cpm_file_path='.//cpn//HingeProduction.cpn')
\ No newline at end of file
+    """
+    Remap the ids of a model held in memory.
+    :param cpn_string: content of a .cpn file
+    :return: remapped content
+    """
+    data = cpn_string.encode("utf-8")
+    mapping = id_mapping(ID_PATTERN.findall(data))
+    print(f"Mapping {len(mapping)} IDs to new IDs.")
+    return _remap_part(data, mapping).decode("utf-8")
+
+
+def replace_cpn_ids(cpm_file_path, chunk_size=CHUNK_SIZE):
+    """
+    Remap the ids of a .cpn file in place with two streaming passes.
+    :param cpm_file_path: path of the .cpn file
+    :param chunk_size: bytes read per chunk
+    :return: dict with the number of ids, bytes and seconds and the throughput in MB/s
+    """
+    start = time.perf_counter()
+    ids = set()
+    with open(cpm_file_path, "rb") as file:
+        for part in _read_parts(file, chunk_size):
+            ids.update(ID_PATTERN.findall(part))
+    mapping = id_mapping(ids)
+
+    path_tmp = cpm_file_path + ".tmp"
+    size = 0
+    try:
+        with open(cpm_file_path, "rb") as file, open(path_tmp, "wb") as out:
+            for part in _read_parts(file, chunk_size):
+                size += len(part)
+                out.write(_remap_part(part, mapping))
+    except BaseException:
+        if os.path.exists(path_tmp):
+            os.remove(path_tmp)
+        raise
+    os.replace(path_tmp, cpm_file_path)
+
+    seconds = time.perf_counter() - start
+    stats = {"ids": len(mapping), "bytes": size, "seconds": seconds,
+             "mb_per_s": 2 * size / 1e6 / seconds if seconds else float("inf")}
+    logger.info(f"remap: {stats['ids']} ids in {size} bytes, {seconds:.3f}s, {stats['mb_per_s']:.1f} MB/s")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remap the ids of a CPN Tools model to ID1, ID2, ...")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="bytes read per chunk")
+    args = parser.parse_args()
+
+    stats = replace_cpn_ids(args.path, args.chunk_size)
+    print(f"Mapped {stats['ids']} IDs in {args.path}: {stats['bytes']} bytes read twice in {stats['seconds']:.3f}s "
+          f"({stats['mb_per_s']:.1f} MB/s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Time-window aggregation of the sustainability indicators of the sOCEL event tables.
+#
+# All s_co2e[kg] and i_* columns of the event type tables are collected into one long frame of
+# (time, event_type, indicator, value). The frame is sorted by (indicator, event_type, time) and a cumulative sum is
+# kept per (indicator, event type), so the total of any indicator and event type in [t0, t1) is the difference of two
+# prefix sums found by binary search. The sums restart with every group, so the total of a small group is not the
+# difference of two large running totals of the groups before it. A query at resolution R costs O(buckets * log n)
+# instead of a rescan of the tables.
+
+import numpy as np
+import pandas as pd
+
+from misc.loadCSVocel import BASE_TABLES, get_ocel_df
+
+
+INDICATOR_PREFIXES = ("s_co2e", "i_")
+
+
+def is_indicator(column):
+    return column.startswith(INDICATOR_PREFIXES)
+
+
+def build_indicator_frame(tables):
+    """
+    Collect the indicator columns of all event type tables into one long frame.
+    :param tables: mapping of table name -> DataFrame, e.g. from get_ocel_df
+    :return: DataFrame with columns time (datetime64), event_type, indicator (categorical) and value (float64)
+    """
+    frames = []
+    for name in tables:
+        if not name.startswith("event_") or name in BASE_TABLES:
+            continue
+        table = tables[name]
+        indicators = [column for column in table.columns if is_indicator(column)]
+        if not indicators or table.empty:
+            continue
+        times = pd.to_datetime(table["ocel_time"]).to_numpy(dtype="datetime64[ns]")
+        values = table[indicators].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        mask = ~np.isnan(values)
+        rows, cols = np.nonzero(mask)
+        frames.append(pd.DataFrame({
+            "time": times[rows],
+            "event_type": name[len("event_"):],
+            "indicator": np.asarray(indicators, dtype=object)[cols],
+            "value": values[rows, cols],
+        }))
+    if not frames:
+        return pd.DataFrame({"time": pd.Series(dtype="datetime64[ns]"), "event_type": pd.Categorical([]),
+                             "indicator": pd.Categorical([]), "value": pd.Series(dtype=np.float64)})
+    frame = pd.concat(frames, ignore_index=True)
+    frame["event_type"] = frame["event_type"].astype("category")
+    frame["indicator"] = frame["indicator"].astype("category")
+    return frame
+
+
+class IndicatorTimeline:
+    """
+    Prefix sums of the indicator values per (indicator, event type), answering window queries without rescans.
+    """
+
+    def __init__(self, frame):
+        """
+        :param frame: long frame from build_indicator_frame
+        """
+        frame = frame.sort_values(["indicator", "event_type", "time"], kind="stable")
+        self.frame = frame.reset_index(drop=True)
+        self._times = self.frame["time"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        values = self.frame["value"].to_numpy(dtype=np.float64)
+
+        # (indicator, event type) -> (start, end, prefix sums of the values of the group starting with 0)
+        keys = self.frame[["indicator", "event_type"]].astype(str)
+        starts = np.flatnonzero(keys.ne(keys.shift()).any(axis=1).to_numpy())
+        ends = np.append(starts[1:], len(self.frame))
+        self._groups = {(keys.iat[s, 0], keys.iat[s, 1]): (s, e, np.concatenate(([0.0], np.cumsum(values[s:e]))))
+                        for s, e in zip(starts, ends)}
+
+    @classmethod
+    def from_csv(cls, path_csv, use_cache=True):
+        """
+        :param path_csv: directory of the sOCEL csv tables
+        :param use_cache: serve the tables from the columnar cache
+        :return: IndicatorTimeline over all event type tables
+        """
+        tables = get_ocel_df(path_csv, use_cache)
+        tables.prefetch(tables.event_type_tables)
+        return cls(build_indicator_frame(tables))
+
+    @property
+    def indicators(self):
+        return sorted({indicator for indicator, _ in self._groups})
+
+    @property
+    def event_types(self):
+        return sorted({event_type for _, event_type in self._groups})
+
+    @property
+    def start(self):
+        return pd.Timestamp(self._times.min()) if len(self._times) else None
+
+    @property
+    def end(self):
+        return pd.Timestamp(self._times.max()) if len(self._times) else None
+
+    def _window_sums(self, group, edges):
+        start, end, cumsum = group
+        return np.diff(cumsum[np.searchsorted(self._times[start:end], edges, side="left")])
+
+    def totals(self, indicator, t0=None, t1=None, resolution=None, event_types=None):
+        """
+        Total of an indicator per event type in [t0, t1), optionally bucketed at a time resolution.
+        :param indicator: e.g. "s_co2e[kg]" or "i_electric-from-grid-de[kWh]"
+        :param t0: start of the window, defaults to the first event
+        :param t1: end of the window (exclusive), defaults to just after the last event
+        :param resolution: bucket size, e.g. "1h" or a Timedelta; None for a single bucket
+        :param event_types: event types to include, defaults to all
+        :return: DataFrame indexed by bucket start with one column per event type, without rows if neither the window
+            nor the timeline has a start or an end. Raises a ValueError if t1 is before t0.
+        """
+        event_types = self.event_types if event_types is None else event_types
+        if (t0 is None or t1 is None) and not len(self._times):
+            return pd.DataFrame(columns=list(event_types), index=pd.DatetimeIndex([], name="time"), dtype=np.float64)
+        t0 = pd.Timestamp(t0) if t0 is not None else self.start
+        t1 = pd.Timestamp(t1) if t1 is not None else self.end + pd.Timedelta(1, "ns")
+        if t1 < t0:
+            raise ValueError(f"End of the window {t1} is before its start {t0}")
+        if resolution is None:
+            starts = pd.DatetimeIndex([t0])
+        else:
+            starts = pd.date_range(t0, t1, freq=pd.Timedelta(resolution), inclusive="left")
+        edges = np.append(starts.as_unit("ns").asi8, pd.Timestamp(t1).as_unit("ns").value)
+
+        columns = {}
+        for event_type in event_types:
+            group = self._groups.get((indicator, event_type))
+            columns[event_type] = self._window_sums(group, edges) if group else np.zeros(len(starts))
+        result = pd.DataFrame(columns, index=starts)
+        result.index.name = "time"
+        return result
+
+    def total(self, indicator, t0=None, t1=None, event_types=None):
+        """
+        :return: total of an indicator over the given event types in [t0, t1)
+        """
+        return float(self.totals(indicator, t0, t1, None, event_types).to_numpy().sum())
+
+    def summary(self, t0=None, t1=None):
+        """
+        :return: DataFrame of the totals in [t0, t1) with event types as rows and indicators as columns
+        """
+        return pd.DataFrame({indicator: self.totals(indicator, t0, t1).iloc[0] for indicator in self.indicators})
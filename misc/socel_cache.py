@@ -0,0 +1,119 @@
+# Columnar cache of the sOCEL csv tables.
+#
+# Each csv table is parsed once with proper dtypes ("?" as NA, ocel_time as datetime, text columns as categorical)
+# and stored in <csv dir>/.cache as parquet, or as pickle if no parquet engine (pyarrow, fastparquet) is installed.
+# A small json file next to each cache entry holds the mtime and size of its source csv. The entry is rebuilt if
+# they change.
+
+import importlib.util
+import json
+import logging
+import os
+
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIRNAME = ".cache"
+CACHE_VERSION = 1
+CACHE_FORMAT = "parquet" if importlib.util.find_spec("pyarrow") or importlib.util.find_spec("fastparquet") \
+    else "pickle"
+
+SEP = ";"
+NA_VALUES = ["?", ""] # unknown and empty values
+TIME_COLUMNS = ["ocel_time"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+ID_COLUMNS = ["ocel_id", "ocel_event_id", "ocel_object_id", "ocel_source_id", "ocel_target_id"] # kept as str
+CATEGORY_COLUMNS = ["ocel_type", "ocel_type_map", "ocel_changed_field", "ocel_qualifier"] # categorical even if empty
+
+
+def read_socel_csv(path):
+    """
+    Parse a sOCEL csv table with proper dtypes, bypassing the cache.
+    :param path: path of the csv file
+    :return: DataFrame
+    """
+    dtype = {c: str for c in ID_COLUMNS + CATEGORY_COLUMNS}
+    df = pd.read_csv(path, sep=SEP, na_values=NA_VALUES, keep_default_na=False, dtype=dtype)
+    for column in df.columns:
+        if column in TIME_COLUMNS:
+            df[column] = pd.to_datetime(df[column], format=TIME_FORMAT)
+        elif column not in ID_COLUMNS and not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = df[column].astype("category")
+    return df
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {"version": CACHE_VERSION, "format": CACHE_FORMAT, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _cache_paths(path, cache_dir):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIRNAME)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return cache_dir, os.path.join(cache_dir, f"{name}.{CACHE_FORMAT}"), os.path.join(cache_dir, f"{name}.json")
+
+
+def _read_stamp(path_meta):
+    try:
+        with open(path_meta) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _replace_atomic(path, write):
+    path_tmp = path + ".tmp"
+    write(path_tmp)
+    os.replace(path_tmp, path)
+
+
+def load_table(path, cache_dir=None):
+    """
+    Load a sOCEL csv table from the cache, rebuilding the cache entry if the csv changed.
+    :param path: path of the csv file
+    :param cache_dir: directory of the cache, defaults to .cache next to the csv file
+    :return: DataFrame
+    """
+    cache_dir, path_data, path_meta = _cache_paths(path, cache_dir)
+    stamp = _source_stamp(path)
+    if _read_stamp(path_meta) == stamp and os.path.exists(path_data):
+        try:
+            if CACHE_FORMAT == "parquet":
+                return pd.read_parquet(path_data)
+            return pd.read_pickle(path_data)
+        except Exception as e:
+            logger.warning(f"socel-cache: failed to read {path_data}, rebuilding: {e}")
+
+    df = read_socel_csv(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    if CACHE_FORMAT == "parquet":
+        _replace_atomic(path_data, lambda p: df.to_parquet(p, index=False))
+    else:
+        _replace_atomic(path_data, lambda p: df.to_pickle(p, compression=None))
+
+    def write_stamp(p):
+        with open(p, "w") as file:
+            json.dump(stamp, file)
+
+    _replace_atomic(path_meta, write_stamp)
+    logger.debug(f"socel-cache: rebuilt {path_data}")
+    return df
+
+
+def clear_cache(path_csv, cache_dir=None):
+    """
+    Remove all cache entries of the csv tables in path_csv.
+    :return: number of removed files
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(path_csv, CACHE_DIRNAME)
+    if not os.path.isdir(cache_dir):
+        return 0
+    removed = 0
+    for fn in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, fn))
+        removed += 1
+    return removed
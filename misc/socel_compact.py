@@ -0,0 +1,178 @@
+# Compact in-memory form of the sOCEL tables, used by get_ocel_df(..., compact=True).
+#
+# All id columns (ocel_id, ocel_event_id, ocel_object_id, ocel_source_id, ocel_target_id) of all tables are coded as
+# int32 with one IdDictionary shared by the tables of a log, so the same id has the same code in event, the type
+# tables, event_object and object_object, and joins between them are integer merges. The dictionary starts with the
+# ids of event.csv and object.csv in file order, ids that only occur in other tables (dangling references) are
+# appended. Type, qualifier and changed field columns are categorical, float64 attributes are float32 if no value
+# changes by more than FLOAT32_RTOL, and integer attributes get the smallest integer dtype.
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from misc.socel_cache import CATEGORY_COLUMNS, ID_COLUMNS
+
+
+FLOAT32_RTOL = 1e-6 # max. relative error of a float32 attribute, the csv values have at most 7 significant digits
+MISSING_CODE = -1
+
+
+def _to_bytes(values):
+    try:
+        return values.astype(np.bytes_)
+    except UnicodeEncodeError:
+        return np.char.encode(values.astype(str), "utf-8")
+
+
+class IdDictionary:
+    """
+    Shared dictionary of ids (str) -> int32 codes. Thread safe, codes are never reassigned.
+
+    The ids are stored once as a sorted array of utf-8 bytes (fixed width) and looked up with a binary search, which
+    takes a fraction of the memory of a hash table of Python strings.
+    """
+
+    def __init__(self, ids=()):
+        """
+        :param ids: initial ids, coded 0, 1, ... in order of their first occurrence
+        """
+        self._lock = threading.Lock()
+        self._sorted = np.empty(0, dtype="S1")
+        self._codes = np.empty(0, dtype=np.int32) # code of each sorted id
+        self._positions = np.empty(0, dtype=np.int32) # position in _sorted of each code
+        values = np.asarray(ids, dtype=object)
+        if len(values):
+            self._add(_to_bytes(values))
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _add(self, values):
+        """
+        Add the ids in values (bytes) that are not in the dictionary, in order of their first occurrence.
+        """
+        unique, first = np.unique(values, return_index=True)
+        if len(self._sorted):
+            positions = np.minimum(np.searchsorted(self._sorted, unique), len(self._sorted) - 1)
+            new = self._sorted[positions] != unique
+            unique, first = unique[new], first[new]
+        if not len(unique):
+            return
+        if len(self) + len(unique) > np.iinfo(np.int32).max:
+            raise OverflowError("More ids than int32 codes")
+        codes = np.empty(len(unique), dtype=np.int32)
+        codes[np.argsort(first, kind="stable")] = np.arange(len(self), len(self) + len(unique), dtype=np.int32)
+        merged = np.concatenate([self._sorted, unique])
+        order = np.argsort(merged, kind="stable")
+        self._sorted = merged[order]
+        self._codes = np.concatenate([self._codes, codes])[order]
+        positions = np.empty(len(self._codes), dtype=np.int32)
+        positions[self._codes] = np.arange(len(self._codes), dtype=np.int32)
+        self._positions = positions
+
+    def _lookup(self, values):
+        sorted_ids, codes = self._sorted, self._codes
+        if not len(sorted_ids):
+            return np.full(len(values), MISSING_CODE, dtype=np.int32)
+        positions = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+        return np.where(sorted_ids[positions] == values, codes[positions], MISSING_CODE).astype(np.int32)
+
+    @property
+    def ids(self):
+        """
+        :return: Index of the ids, the position of an id is its code
+        """
+        return pd.Index(self.decode(np.arange(len(self), dtype=np.int32)), dtype=object)
+
+    def encode(self, values, add=True):
+        """
+        :param values: array-like of ids, NA is coded as MISSING_CODE
+        :param add: add unknown ids to the dictionary, else they are coded as MISSING_CODE
+        :return: int32 array of codes
+        """
+        values = np.asarray(values, dtype=object)
+        missing = pd.isna(values)
+        values = _to_bytes(np.where(missing, "", values))
+        with self._lock:
+            codes = self._lookup(values)
+            unknown = (codes < 0) & ~missing
+            if add and unknown.any():
+                self._add(values[unknown])
+                codes = self._lookup(values)
+        codes[missing] = MISSING_CODE
+        return codes
+
+    def decode(self, codes):
+        """
+        :param codes: array-like of codes
+        :return: object array of ids, None for MISSING_CODE
+        """
+        codes = np.asarray(codes)
+        if not len(self):
+            return np.full(len(codes), None, dtype=object)
+        ids = self._sorted[self._positions[np.where(codes < 0, 0, codes)]]
+        return np.where(codes < 0, None, np.char.decode(ids, "utf-8").astype(object))
+
+    def categorical(self, codes):
+        """
+        :return: Categorical of the ids of the codes, e.g. to display a coded column
+        """
+        return pd.Categorical.from_codes(codes, categories=self.ids, validate=False)
+
+    def memory_usage(self):
+        """
+        :return: bytes of the dictionary
+        """
+        return int(self._sorted.nbytes + self._codes.nbytes + self._positions.nbytes)
+
+
+def _float32_allowed(values, rtol=FLOAT32_RTOL):
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return True
+    if np.abs(finite).max() > np.finfo(np.float32).max:
+        return False
+    error = np.abs(finite.astype(np.float32).astype(np.float64) - finite)
+    return bool((error <= rtol * np.abs(finite)).all())
+
+
+def compact_table(table, ids, rtol=FLOAT32_RTOL):
+    """
+    :param table: sOCEL table with its columns, not indexed
+    :param ids: IdDictionary shared by the tables of the log
+    :param rtol: max. relative error of float32 attributes, 0 to keep float64
+    :return: compact copy of the table, see the module comment
+    """
+    columns = {}
+    for column in table.columns:
+        values = table[column]
+        if column in ID_COLUMNS:
+            values = pd.Series(ids.encode(values.to_numpy(dtype=object, na_value=None)), index=table.index)
+        elif column in CATEGORY_COLUMNS:
+            values = values.astype("category")
+        elif pd.api.types.is_float_dtype(values.dtype) and values.dtype != np.float32:
+            if rtol and _float32_allowed(values.to_numpy(), rtol):
+                values = values.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            values = pd.to_numeric(values, downcast="integer")
+        columns[column] = values
+    return pd.DataFrame(columns, index=table.index)
+
+
+def memory_report(tables, ids=None):
+    """
+    :param tables: mapping of table name -> DataFrame, e.g. the loaded tables of get_ocel_df
+    :param ids: IdDictionary of compact tables, reported as table "(ids)"
+    :return: DataFrame with rows, columns and bytes (deep, including the index) per table, largest first, and the
+        total in the last row
+    """
+    rows = [{"table": name, "rows": len(table), "columns": len(table.columns) + table.index.nlevels,
+             "bytes": int(table.memory_usage(index=True, deep=True).sum())} for name, table in tables.items()]
+    if ids is not None:
+        rows.append({"table": "(ids)", "rows": len(ids), "columns": 1, "bytes": ids.memory_usage()})
+    report = pd.DataFrame(rows, columns=["table", "rows", "columns", "bytes"]).sort_values("bytes", ascending=False)
+    total = pd.DataFrame([{"table": "total", "rows": report["rows"].sum(), "columns": report["columns"].sum(),
+                           "bytes": report["bytes"].sum()}])
+    return pd.concat([report, total], ignore_index=True)
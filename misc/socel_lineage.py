@@ -0,0 +1,302 @@
+# Lineage index over object_object and event_object of the sOCEL for carbon footprint roll-ups.
+#
+# Object and event ids are integer coded. Relations are stored as CSR adjacency arrays (indptr, indices) per qualifier,
+# so the neighbours of a batch of nodes are gathered with a few numpy operations instead of pandas joins.
+#
+# The material lineage links an object to the objects it was made from: o2o "created from" relations and, for every
+# event, its "output" objects to its "input" and "on" objects (e.g. SplitSteelSheet: sheet <- coil,
+# AssembleHinge: hinge <- male part, female part, pin).
+#
+# Roll-up: the s_co2e[kg] of an event is allocated equally to its output objects, or to its "on" objects if it has
+# none. Together with the s_co2e[kg] of the object itself this is the direct footprint of an object. The footprint of
+# an object is passed on to the objects made from it, split by their mass (p_mass[kg]), or equally if a mass is
+# missing. Final products (objects nothing was made from) carry the footprint of their whole lineage.
+
+import numpy as np
+import pandas as pd
+
+from misc.loadCSVocel import get_ocel_df
+
+
+CREATED_FROM = "created from"
+OUTPUT = "output"
+ON = "on"
+SOURCE_QUALIFIERS = ("input", ON)
+CO2E = "s_co2e[kg]"
+MASS = "p_mass[kg]"
+
+
+class CSR:
+    """
+    Compressed sparse row adjacency of a directed graph with integer coded nodes.
+    """
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_edges(cls, sources, targets, n_nodes):
+        """
+        :param sources: int array of edge sources
+        :param targets: int array of edge targets
+        :param n_nodes: number of source nodes
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        order = np.argsort(sources, kind="stable")
+        counts = np.bincount(sources, minlength=n_nodes)
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(indptr, np.asarray(targets, dtype=np.int64)[order])
+
+    def transpose(self, n_nodes):
+        """
+        :param n_nodes: number of target nodes
+        :return: CSR of the reversed edges
+        """
+        sources = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        return CSR.from_edges(self.indices, sources, n_nodes)
+
+    def degree(self, nodes=None):
+        degrees = np.diff(self.indptr)
+        return degrees if nodes is None else degrees[nodes]
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def expand(self, nodes):
+        """
+        Gather the neighbours of a batch of nodes.
+        :param nodes: int array of nodes
+        :return: (positions, neighbours), positions[i] is the index in nodes the neighbour neighbours[i] belongs to
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts = self.indptr[nodes]
+        counts = self.indptr[nodes + 1] - starts
+        positions = np.repeat(np.arange(len(nodes)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return positions, self.indices[starts[positions] + offsets]
+
+
+def _traverse(csr, nodes):
+    """
+    All nodes reachable from each of the given nodes, the graph is expected to be acyclic.
+    :return: (origins, reached) int arrays of distinct pairs, origins are indices into nodes
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    origins, reached = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    frontier_origin, frontier = np.arange(len(nodes)), nodes
+    for _ in range(len(csr.indptr)): # bounds the walk if the relations contain a cycle
+        if not len(frontier):
+            break
+        positions, neighbours = csr.expand(frontier)
+        pairs = pd.DataFrame({"o": frontier_origin[positions], "n": neighbours}).drop_duplicates()
+        frontier_origin, frontier = pairs["o"].to_numpy(), pairs["n"].to_numpy()
+        origins.append(frontier_origin)
+        reached.append(frontier)
+    pairs = pd.DataFrame({"o": np.concatenate(origins), "n": np.concatenate(reached)}).drop_duplicates()
+    return pairs["o"].to_numpy(), pairs["n"].to_numpy()
+
+
+def _last_values(tables, names, columns):
+    """
+    :return: DataFrame indexed by ocel_id with the last known value of each column in the given type tables
+    """
+    frames = []
+    for name in names:
+        table = tables[name]
+        present = [column for column in columns if column in table.columns]
+        if present and not table.empty:
+            frame = table[["ocel_id", "ocel_time"] + present].copy()
+            for column in present:
+                frame[column] = pd.to_numeric(frame[column], errors="coerce")
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    frame = pd.concat(frames, ignore_index=True).sort_values("ocel_time", kind="stable")
+    return frame.groupby("ocel_id", sort=False)[[c for c in columns if c in frame.columns]].last()
+
+
+class LineageIndex:
+    """
+    Integer coded CSR index over the o2o and e2o relations of a sOCEL.
+    """
+
+    def __init__(self, objects, events, object_object, event_object, object_values=None, event_values=None):
+        """
+        :param objects: DataFrame with columns ocel_id, ocel_type
+        :param events: DataFrame with columns ocel_id, ocel_type
+        :param object_object: DataFrame with columns ocel_source_id, ocel_target_id, ocel_qualifier
+        :param event_object: DataFrame with columns ocel_event_id, ocel_object_id, ocel_qualifier
+        :param object_values: DataFrame indexed by object id with columns s_co2e[kg] and p_mass[kg]
+        :param event_values: DataFrame indexed by event id with column s_co2e[kg]
+        """
+        self.object_ids = pd.Index(pd.unique(pd.concat([
+            objects["ocel_id"], object_object["ocel_source_id"], object_object["ocel_target_id"],
+            event_object["ocel_object_id"]], ignore_index=True).astype(str)))
+        self.event_ids = pd.Index(pd.unique(pd.concat([
+            events["ocel_id"], event_object["ocel_event_id"]], ignore_index=True).astype(str)))
+        n_objects, n_events = len(self.object_ids), len(self.event_ids)
+
+        self.object_types = pd.Series(objects["ocel_type"].astype(str).to_numpy(),
+                                      index=objects["ocel_id"].astype(str)).reindex(self.object_ids).to_numpy()
+
+        o2o_source = self.object_ids.get_indexer(object_object["ocel_source_id"].astype(str))
+        o2o_target = self.object_ids.get_indexer(object_object["ocel_target_id"].astype(str))
+        o2o_qualifier = object_object["ocel_qualifier"].astype(str).to_numpy()
+        self.o2o = {q: CSR.from_edges(o2o_source[o2o_qualifier == q], o2o_target[o2o_qualifier == q], n_objects)
+                    for q in pd.unique(o2o_qualifier)}
+
+        e2o_event = self.event_ids.get_indexer(event_object["ocel_event_id"].astype(str))
+        e2o_object = self.object_ids.get_indexer(event_object["ocel_object_id"].astype(str))
+        e2o_qualifier = event_object["ocel_qualifier"].astype(str).to_numpy()
+        self.e2o = {q: CSR.from_edges(e2o_event[e2o_qualifier == q], e2o_object[e2o_qualifier == q], n_events)
+                    for q in pd.unique(e2o_qualifier)}
+
+        # material lineage: child -> parents
+        empty = CSR.from_edges([], [], n_events)
+        outputs = self.e2o.get(OUTPUT, empty)
+        children, parents = [o2o_source[o2o_qualifier == CREATED_FROM]], [o2o_target[o2o_qualifier == CREATED_FROM]]
+        for qualifier in SOURCE_QUALIFIERS:
+            sources = self.e2o.get(qualifier, empty)
+            out_positions, out_objects = outputs.expand(np.arange(n_events))
+            degree = sources.degree(out_positions)
+            _, src_objects = sources.expand(out_positions)
+            children.append(np.repeat(out_objects, degree))
+            parents.append(src_objects)
+        edges = pd.DataFrame({"c": np.concatenate(children), "p": np.concatenate(parents)}).drop_duplicates()
+        edges = edges[edges["c"] != edges["p"]]
+        self.parents = CSR.from_edges(edges["c"].to_numpy(), edges["p"].to_numpy(), n_objects)
+        self.children = self.parents.transpose(n_objects)
+
+        object_values = object_values if object_values is not None else pd.DataFrame(columns=[CO2E, MASS])
+        event_values = event_values if event_values is not None else pd.DataFrame(columns=[CO2E])
+        self.object_co2e = self._values(object_values, CO2E, self.object_ids)
+        self.object_mass = self._values(object_values, MASS, self.object_ids)
+        self.event_co2e = self._values(event_values, CO2E, self.event_ids)
+
+    @staticmethod
+    def _values(frame, column, ids):
+        if column not in frame.columns:
+            return np.full(len(ids), np.nan)
+        return pd.to_numeric(frame[column], errors="coerce").reindex(ids).to_numpy(dtype=np.float64)
+
+    @classmethod
+    def from_tables(cls, tables):
+        """
+        :param tables: mapping of table name -> DataFrame as returned by get_ocel_df
+        """
+        def table(name, columns):
+            if name not in tables:
+                return pd.DataFrame(columns=columns)
+            frame = tables[name]
+            return frame.reset_index() if not set(columns) <= set(frame.columns) else frame
+
+        objects = table("object", ["ocel_id", "ocel_type"])
+        events = table("event", ["ocel_id", "ocel_type"])
+        object_object = table("object_object", ["ocel_source_id", "ocel_target_id", "ocel_qualifier"])
+        event_object = table("event_object", ["ocel_event_id", "ocel_object_id", "ocel_qualifier"])
+        object_values = _last_values(tables, tables.object_type_tables, [CO2E, MASS])
+        event_values = _last_values(tables, tables.event_type_tables, [CO2E])
+        return cls(objects, events, object_object, event_object, object_values, event_values)
+
+    @classmethod
+    def from_csv(cls, path_csv, use_cache=True):
+        tables = get_ocel_df(path_csv, use_cache)
+        tables.prefetch()
+        return cls.from_tables(tables)
+
+    def codes(self, object_ids):
+        """
+        :return: int array of object codes, -1 for unknown ids
+        """
+        return self.object_ids.get_indexer(pd.Index(object_ids).astype(str))
+
+    def _pairs(self, csr, object_ids):
+        codes = self.codes(object_ids)
+        origins, reached = _traverse(csr, codes[codes >= 0])
+        known = np.asarray(object_ids)[codes >= 0]
+        return pd.DataFrame({"ocel_id": known[origins], "related_id": self.object_ids[reached],
+                             "related_type": self.object_types[reached]})
+
+    def ancestors(self, object_ids):
+        """
+        Objects the given objects were (transitively) made from.
+        :return: DataFrame of (ocel_id, related_id, related_type) pairs
+        """
+        return self._pairs(self.parents, object_ids)
+
+    def descendants(self, object_ids):
+        """
+        Objects (transitively) made from the given objects.
+        :return: DataFrame of (ocel_id, related_id, related_type) pairs
+        """
+        return self._pairs(self.children, object_ids)
+
+    def direct_footprint(self):
+        """
+        :return: float array per object code: own s_co2e[kg] plus the allocated s_co2e[kg] of its events
+        """
+        footprint = np.nan_to_num(self.object_co2e)
+        event_co2e = np.nan_to_num(self.event_co2e)
+        empty = CSR.from_edges([], [], len(self.event_ids))
+        outputs = self.e2o.get(OUTPUT, empty)
+        on = self.e2o.get(ON, empty)
+        for csr, events in ((outputs, np.arange(len(self.event_ids))),
+                            (on, np.flatnonzero(outputs.degree() == 0))):
+            positions, objects = csr.expand(events)
+            share = event_co2e[events] / np.maximum(csr.degree(events), 1)
+            np.add.at(footprint, objects, share[positions])
+        return footprint
+
+    def _allocation_weights(self, children, parents):
+        """
+        Share of a parent's footprint passed to each child: child mass / mass of all children of the parent,
+        or equal shares if a mass is missing.
+        """
+        mass = pd.Series(self.object_mass[children])
+        by_parent = mass.groupby(parents)
+        total_mass = by_parent.transform("sum").to_numpy()
+        has_mass = ~mass.isna().groupby(parents).transform("any").to_numpy(dtype=bool) & (total_mass > 0)
+        weights = 1.0 / np.bincount(parents, minlength=len(self.object_ids))[parents]
+        weights[has_mass] = mass.to_numpy()[has_mass] / total_mass[has_mass]
+        return weights
+
+    def rollup(self, object_types=None):
+        """
+        Allocate the footprint of all objects and events to the final products in one pass over the lineage.
+        Raises a ValueError if the lineage contains a cycle.
+        :param object_types: return only objects of these types, defaults to all final products
+        :return: DataFrame indexed by object id with columns ocel_type, direct_co2e and total_co2e
+        """
+        n_objects = len(self.object_ids)
+        children = np.repeat(np.arange(n_objects), self.parents.degree())
+        parents = self.parents.indices
+        weights = self._allocation_weights(children, parents)
+
+        # level of each object in the lineage (longest path from a root), parents are settled before their children
+        level = np.zeros(n_objects, dtype=np.int64)
+        for _ in range(n_objects + 1): # a path has at most n_objects - 1 edges, then the levels are settled
+            updated = level.copy()
+            np.maximum.at(updated, children, level[parents] + 1)
+            if np.array_equal(updated, level):
+                break
+            changed = updated != level
+            level = updated
+        else:
+            raise ValueError(f"lineage: the relations contain a cycle through the objects "
+                             f"{', '.join(self.object_ids[changed][:5])}")
+
+        direct = self.direct_footprint()
+        total = direct.copy()
+        edge_level = level[children]
+        for current in range(1, level.max() + 1 if n_objects else 1):
+            mask = edge_level == current
+            np.add.at(total, children[mask], weights[mask] * total[parents[mask]])
+
+        result = pd.DataFrame({"ocel_type": self.object_types, "direct_co2e": direct, "total_co2e": total},
+                              index=self.object_ids)
+        result.index.name = "ocel_id"
+        if object_types is None:
+            return result[(self.children.degree() == 0) & (self.parents.degree() > 0)]
+        return result[np.isin(self.object_types, list(object_types))]
@@ -0,0 +1,288 @@
+# pm4py OCEL of the sOCEL csv tables without the detour over OCEL 2.0 XML.
+#
+# read_socel_ocel builds the dataframes of a pm4py OCEL (events, objects, relations, object_changes, o2o) with
+# vectorized merges from the tables of get_ocel_df, i.e. from the columnar cache of misc/socel_cache.py. The result
+# has the rows of pm4py.read_ocel2_xml of the xml written by generate_socel_xml in the same order (checked on a small
+# log with e2o relations in tests/test_socel_ocel.py), except that unknown values ("?") are NA instead of the string
+# "?" and attributes keep the dtypes of the cache. A log without event_object.csv, e.g. data/socel-csv, keeps its
+# events and objects without relations, pm4py.read_ocel2_xml fails on its xml.
+#
+# The OCEL is stored in a snapshot keyed by a hash of the content of the csv tables (<csv dir>/.cache/ocel-*.snapshot).
+# A snapshot is one file: a pickle (protocol 5) whose array buffers are stored out-of-band behind it and mapped into
+# memory on load, so loading an unchanged log is a single memory-mapped read instead of parsing and merging.
+#
+# Usage: python -m misc.socel_ocel [csv dir] [--no-snapshot]
+
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import time
+
+import pandas as pd
+import pm4py
+from pm4py.objects.ocel.obj import OCEL
+from pm4py.objects.ocel.util import filtering_utils, ocel_consistency
+
+from misc.loadCSVocel import get_ocel_df
+from misc.socel_cache import CACHE_DIRNAME
+
+
+logger = logging.getLogger(__name__)
+
+PATH_CSV = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'socel-csv')
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PREFIX = "ocel-"
+SNAPSHOT_SUFFIX = ".snapshot"
+HEADER = struct.Struct("<8sQQ") # magic, length of the buffer table, length of the pickle
+MAGIC = b"SOCELOCL"
+ALIGNMENT = 64
+
+EVENT_ID = "ocel:eid"
+ACTIVITY = "ocel:activity"
+TIMESTAMP = "ocel:timestamp"
+OBJECT_ID = "ocel:oid"
+OBJECT_TYPE = "ocel:type"
+QUALIFIER = "ocel:qualifier"
+FIELD = "ocel:field"
+
+
+def content_hash(path_csv):
+    """
+    :param path_csv: directory of the csv tables
+    :return: hex digest of the names and contents of the csv tables, the snapshot format and the library versions
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{SNAPSHOT_VERSION};{pd.__version__};{pm4py.__version__}".encode())
+    for fn in sorted(fn for fn in os.listdir(path_csv) if fn.endswith(".csv")):
+        digest.update(fn.encode() + b"\0")
+        with open(os.path.join(path_csv, fn), "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _utc(times):
+    times = pd.to_datetime(times) # plain strings if the tables are read without the cache
+    return times.dt.tz_localize("UTC") if times.dt.tz is None else times
+
+
+def _type_map(tables, name):
+    return tables[name]["ocel_type_map"].astype(str).to_dict()
+
+
+def _build_events(tables):
+    events = tables["event"].reset_index().rename(columns={"ocel_id": EVENT_ID, "ocel_type": ACTIVITY})
+    events[ACTIVITY] = events[ACTIVITY].astype(str)
+    events["_position"] = range(len(events))
+    parts = []
+    for event_type, suffix in _type_map(tables, "event_map_type").items():
+        of_type = events.loc[events[ACTIVITY] == event_type, [EVENT_ID, ACTIVITY, "_position"]]
+        if of_type.empty:
+            continue
+        type_table = tables["event_" + suffix].rename(columns={"ocel_id": EVENT_ID, "ocel_time": TIMESTAMP})
+        parts.append(of_type.merge(type_table.drop_duplicates(EVENT_ID), on=EVENT_ID, how="inner"))
+    events = pd.concat(parts, ignore_index=True)
+    events[TIMESTAMP] = _utc(events[TIMESTAMP])
+    return events.sort_values([TIMESTAMP, "_position"], kind="stable").reset_index(drop=True)
+
+
+def _sort_changes(changes):
+    """
+    Order the attribute changes like pm4py.read_ocel2_xml: by object in the order of object.csv, then by attribute in
+    the order of their first value in the xml (attributes with an initial value in column order, the others by their
+    first change) and then in the order of the type table.
+    """
+    first_change = changes.groupby([OBJECT_ID, FIELD], observed=True, sort=False)["_row"].transform("min")
+    changes["_attribute"] = changes["_column"].where(changes["_initial"], len(changes) + first_change)
+    changes = changes.sort_values(["_position", "_attribute", "_row"], kind="stable").reset_index(drop=True)
+    return changes.drop(columns=["_position", "_row", "_column", "_initial", "_attribute"])
+
+
+def _build_objects(tables):
+    objects = tables["object"].reset_index().rename(columns={"ocel_id": OBJECT_ID, "ocel_type": OBJECT_TYPE})
+    objects[OBJECT_TYPE] = objects[OBJECT_TYPE].astype(str)
+    objects["_position"] = range(len(objects))
+    initial_parts = []
+    change_parts = []
+    for object_type, suffix in _type_map(tables, "object_map_type").items():
+        of_type = objects.loc[objects[OBJECT_TYPE] == object_type, [OBJECT_ID, OBJECT_TYPE, "_position"]]
+        if of_type.empty:
+            continue
+        type_table = tables["object_" + suffix].rename(columns={"ocel_id": OBJECT_ID, "ocel_time": TIMESTAMP})
+        type_table = type_table.assign(_row=range(len(type_table)))
+        changed = type_table["ocel_changed_field"].notna()
+        initial = type_table.loc[~changed].drop(columns=[TIMESTAMP, "ocel_changed_field", "_row"])
+        initial = of_type.merge(initial.drop_duplicates(OBJECT_ID), on=OBJECT_ID, how="left")
+        initial_parts.append(initial)
+
+        indexed = initial.set_index(OBJECT_ID)
+        changes = type_table.loc[changed & type_table[OBJECT_ID].isin(of_type[OBJECT_ID])]
+        for field, rows in changes.groupby("ocel_changed_field", observed=True, sort=False):
+            if field not in rows.columns:
+                continue
+            rows = rows.loc[rows[field].notna()]
+            change_parts.append(pd.DataFrame({
+                OBJECT_ID: rows[OBJECT_ID].to_numpy(),
+                OBJECT_TYPE: object_type,
+                field: rows[field].to_numpy(),
+                FIELD: field,
+                TIMESTAMP: _utc(rows[TIMESTAMP]).to_numpy(),
+                "_position": indexed["_position"].reindex(rows[OBJECT_ID]).to_numpy(),
+                "_row": rows["_row"].to_numpy(),
+                "_column": type_table.columns.get_loc(field),
+                "_initial": indexed[field].notna().reindex(rows[OBJECT_ID], fill_value=False).to_numpy(),
+            }))
+    objects = pd.concat(initial_parts, ignore_index=True).sort_values("_position").reset_index(drop=True)
+    object_changes = _sort_changes(pd.concat(change_parts, ignore_index=True)) if change_parts else None
+    return objects.drop(columns="_position"), object_changes
+
+
+def _build_relations(tables, events, objects):
+    columns = [EVENT_ID, ACTIVITY, TIMESTAMP, OBJECT_ID, OBJECT_TYPE, QUALIFIER]
+    if "event_object" not in tables:
+        return pd.DataFrame({column: pd.Series(dtype=events[column].dtype if column in events else object)
+                             for column in columns})
+    relations = tables["event_object"].reset_index().rename(columns={
+        "ocel_event_id": EVENT_ID, "ocel_object_id": OBJECT_ID, "ocel_qualifier": QUALIFIER})
+    relations = relations.merge(events[[EVENT_ID, ACTIVITY, TIMESTAMP, "_position"]], on=EVENT_ID, how="inner")
+    relations = relations.merge(objects[[OBJECT_ID, OBJECT_TYPE]], on=OBJECT_ID, how="inner")
+    relations = relations.sort_values([TIMESTAMP, "_position"], kind="stable").reset_index(drop=True)
+    return relations[columns]
+
+
+def _build_o2o(tables, objects):
+    if "object_object" not in tables:
+        return None
+    o2o = tables["object_object"].reset_index().rename(columns={
+        "ocel_source_id": OBJECT_ID, "ocel_target_id": OBJECT_ID + "_2", "ocel_qualifier": QUALIFIER})
+    o2o = o2o.loc[o2o[OBJECT_ID].isin(objects[OBJECT_ID])].reset_index(drop=True)
+    return o2o if len(o2o) else None
+
+
+def build_ocel(tables):
+    """
+    Build a pm4py OCEL from the sOCEL tables, see the module comment.
+    :param tables: mapping of table name -> DataFrame as returned by get_ocel_df
+    :return: OCEL
+    """
+    events = _build_events(tables)
+    objects, object_changes = _build_objects(tables)
+    relations = _build_relations(tables, events, objects)
+    o2o = _build_o2o(tables, objects)
+    ocel = OCEL(events=events.drop(columns="_position"), objects=objects, relations=relations, globals={},
+                o2o=o2o, object_changes=object_changes)
+    # the same clean-up as pm4py.read_ocel2_xml: string ids, only events and objects with relations. A log without
+    # event_object.csv (e.g. data/socel-csv) would lose all events and objects, it keeps them without relations.
+    ocel = ocel_consistency.apply(ocel)
+    if relations.empty:
+        logger.warning("socel-ocel: no event-object relations, events and objects are kept unfiltered")
+        return ocel
+    return filtering_utils.propagate_relations_filtering(ocel)
+
+
+def save_snapshot(ocel, path):
+    """
+    Write an OCEL to a snapshot file, see the module comment. The file is replaced at the end.
+    :param ocel: OCEL
+    :param path: path of the snapshot
+    :return: size of the file in bytes
+    """
+    buffers = []
+    data = pickle.dumps(ocel, protocol=5, buffer_callback=buffers.append)
+    raws = [buffer.raw() for buffer in buffers]
+    offsets = []
+    offset = 0
+    for raw in raws:
+        offsets.append((offset, raw.nbytes))
+        offset += -(-raw.nbytes // ALIGNMENT) * ALIGNMENT
+    table = pickle.dumps(offsets)
+    start = -(-(HEADER.size + len(table) + len(data)) // ALIGNMENT) * ALIGNMENT
+
+    path_tmp = path + ".tmp"
+    with open(path_tmp, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(table), len(data)))
+        file.write(table)
+        file.write(data)
+        for raw, (buffer_offset, _) in zip(raws, offsets):
+            file.seek(start + buffer_offset)
+            file.write(raw)
+        size = file.tell()
+    os.replace(path_tmp, path)
+    return size
+
+
+def load_snapshot(path):
+    """
+    Map a snapshot file into memory. The arrays of the dataframes are copy-on-write views of the file.
+    :param path: path of the snapshot
+    :return: OCEL
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    magic, table_length, data_length = HEADER.unpack_from(mapped)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not an OCEL snapshot")
+    view = memoryview(mapped)
+    offsets = pickle.loads(view[HEADER.size:HEADER.size + table_length])
+    data = view[HEADER.size + table_length:HEADER.size + table_length + data_length]
+    start = -(-(HEADER.size + table_length + data_length) // ALIGNMENT) * ALIGNMENT
+    return pickle.loads(data, buffers=[view[start + offset:start + offset + length] for offset, length in offsets])
+
+
+def _snapshot_path(path_csv, key):
+    return os.path.join(path_csv, CACHE_DIRNAME, f"{SNAPSHOT_PREFIX}{key}{SNAPSHOT_SUFFIX}")
+
+
+def _remove_stale_snapshots(path_csv, keep):
+    cache_dir = os.path.join(path_csv, CACHE_DIRNAME)
+    for fn in os.listdir(cache_dir):
+        if fn.startswith(SNAPSHOT_PREFIX) and fn.endswith(SNAPSHOT_SUFFIX) and fn != os.path.basename(keep):
+            os.remove(os.path.join(cache_dir, fn))
+
+
+def read_socel_ocel(path_csv=PATH_CSV, use_cache=True, snapshot=True):
+    """
+    Load the sOCEL csv tables as pm4py OCEL, like pm4py.read_ocel2_xml of the exported xml but without the xml.
+    :param path_csv: directory of the csv tables
+    :param use_cache: read the tables from the columnar cache (see misc/socel_cache.py)
+    :param snapshot: load from and store to a snapshot keyed by the content of the csv tables
+    :return: OCEL
+    """
+    path_snapshot = _snapshot_path(path_csv, content_hash(path_csv)) if snapshot else None
+    if path_snapshot and os.path.exists(path_snapshot):
+        try:
+            return load_snapshot(path_snapshot)
+        except Exception as e:
+            logger.warning(f"socel-ocel: failed to read {path_snapshot}, rebuilding: {e}")
+
+    start = time.perf_counter()
+    ocel = build_ocel(get_ocel_df(path_csv, use_cache).prefetch())
+    logger.info(f"socel-ocel: built OCEL of {len(ocel.events)} events and {len(ocel.objects)} objects "
+                f"in {time.perf_counter() - start:.2f}s")
+    if path_snapshot:
+        os.makedirs(os.path.dirname(path_snapshot), exist_ok=True)
+        size = save_snapshot(ocel, path_snapshot)
+        _remove_stale_snapshots(path_csv, path_snapshot)
+        logger.debug(f"socel-ocel: wrote {path_snapshot} ({size} bytes)")
+    return ocel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the pm4py OCEL of the sOCEL csv tables and its snapshot.")
+    parser.add_argument("path_csv", nargs="?", default=PATH_CSV)
+    parser.add_argument("--no-snapshot", action="store_true", help="neither read nor write a snapshot")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ocel = read_socel_ocel(args.path_csv, snapshot=not args.no_snapshot)
+    print(ocel)
+    print(f"Loaded in {time.perf_counter() - start:.2f}s.")
+
+
+if __name__ == "__main__":
+    main()
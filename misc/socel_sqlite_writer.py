@@ -0,0 +1,167 @@
+# Bulk export of the sOCEL csv tables (as written by cpn-log-writer.sml) to an OCEL 2.0 SQLite database.
+#
+# The tables follow the OCEL 2.0 relational schema read by pm4py.read_ocel2_sqlite. Attribute columns are declared
+# REAL or TEXT from a type inference pass over the csv, ocel_time as TIMESTAMP. Unknown values ("?") and empty cells
+# are stored as NULL. All rows are inserted with executemany in a single transaction, indexes are created after the
+# load.
+
+import logging
+import os
+import sqlite3
+
+from misc.socel_xml_writer import MISSING, TypeTable, check_row_length, read_rows, read_type_map
+
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = "?"
+NULL_VALUES = (MISSING, UNKNOWN)
+SQL_TYPES = {"integer": "REAL", "float": "REAL", "string": "TEXT"}
+
+PRAGMAS = [
+    "PRAGMA page_size = 8192",
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA locking_mode = EXCLUSIVE",
+]
+
+# (table, columns) of the fixed OCEL 2.0 tables
+BASE_TABLES = [
+    ("event", [("ocel_id", "TEXT"), ("ocel_type", "TEXT")]),
+    ("object", [("ocel_id", "TEXT"), ("ocel_type", "TEXT")]),
+    ("event_object", [("ocel_event_id", "TEXT"), ("ocel_object_id", "TEXT"), ("ocel_qualifier", "TEXT")]),
+    ("object_object", [("ocel_source_id", "TEXT"), ("ocel_target_id", "TEXT"), ("ocel_qualifier", "TEXT")]),
+    ("event_map_type", [("ocel_type", "TEXT"), ("ocel_type_map", "TEXT")]),
+    ("object_map_type", [("ocel_type", "TEXT"), ("ocel_type_map", "TEXT")]),
+]
+
+# (table, columns) indexed after the load, type tables get an index on ocel_id
+INDEXES = [
+    ("event", ["ocel_id"]),
+    ("event", ["ocel_type"]),
+    ("object", ["ocel_id"]),
+    ("object", ["ocel_type"]),
+    ("event_object", ["ocel_event_id"]),
+    ("event_object", ["ocel_object_id"]),
+    ("object_object", ["ocel_source_id"]),
+    ("object_object", ["ocel_target_id"]),
+]
+
+
+def quote_identifier(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def create_index(conn, table, columns):
+    name = quote_identifier(f"idx_{table}_{'_'.join(columns)}")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {quote_identifier(table)} "
+                 f"({', '.join(map(quote_identifier, columns))})")
+
+
+def declared_type(column):
+    """
+    Column type for tables that are created before their rows are known: ocel_time as TIMESTAMP, other ocel_* columns
+    as TEXT and attributes as REAL, so SQLite stores numbers as REAL and keeps other values as text.
+    """
+    if column == "ocel_time":
+        return "TIMESTAMP"
+    if column.startswith("ocel_"):
+        return "TEXT"
+    return "REAL"
+
+
+def _converters(sql_types):
+    """
+    :return: list of functions converting the csv strings of a row to the values of the declared column types
+    """
+    def to_text(value):
+        return None if value in NULL_VALUES else value
+
+    def to_real(value):
+        return None if value in NULL_VALUES else float(value)
+
+    return [to_real if sql_type == "REAL" else to_text for sql_type in sql_types]
+
+
+def _typed_rows(path, sql_types):
+    """
+    :return: generator of the converted rows of a csv file, raises ValueError for a row with another number of values
+        than sql_types
+    """
+    converters = _converters(sql_types)
+    rows = read_rows(path)
+    next(rows, None) # header
+    for line, row in enumerate(rows, start=2):
+        if not row:
+            continue
+        check_row_length(path, line, row, len(converters))
+        yield [convert(value) for convert, value in zip(converters, row)]
+
+
+def _load_table(conn, path, table, columns):
+    """
+    Create a table with the declared (name, sql type) columns and insert all rows of the csv file.
+    :return: number of inserted rows
+    """
+    names = ", ".join(f"{quote_identifier(name)} {sql_type}" for name, sql_type in columns)
+    conn.execute(f"CREATE TABLE {quote_identifier(table)} ({names})")
+    placeholders = ", ".join("?" * len(columns))
+    cursor = conn.executemany(f"INSERT INTO {quote_identifier(table)} VALUES ({placeholders})",
+                              _typed_rows(path, [sql_type for _, sql_type in columns]))
+    return cursor.rowcount
+
+
+def _type_table_columns(table, fixed_columns):
+    return fixed_columns + [(attribute, SQL_TYPES[table.types[attribute]]) for attribute in table.attributes]
+
+
+def write_socel_sqlite(path_csv, path_sqlite):
+    """
+    Export the sOCEL csv tables to an OCEL 2.0 SQLite database. The database is written to a temporary file first and
+    replaced at the end.
+    :param path_csv: directory of the csv tables
+    :param path_sqlite: path of the sqlite file
+    :return: dict of table -> number of rows
+    """
+    event_types = read_type_map(os.path.join(path_csv, "event_map_type.csv"))
+    object_types = read_type_map(os.path.join(path_csv, "object_map_type.csv"))
+
+    tables = [(table, os.path.join(path_csv, f"{table}.csv"), columns) for table, columns in BASE_TABLES]
+    for event_type, suffix in event_types.items():
+        type_table = TypeTable(os.path.join(path_csv, f"event_{suffix}.csv"), 2, False, NULL_VALUES)
+        columns = _type_table_columns(type_table, [("ocel_id", "TEXT"), ("ocel_time", "TIMESTAMP")])
+        tables.append((f"event_{suffix}", type_table.path, columns))
+    for object_type, suffix in object_types.items():
+        type_table = TypeTable(os.path.join(path_csv, f"object_{suffix}.csv"), 3, False, NULL_VALUES)
+        columns = _type_table_columns(type_table, [("ocel_id", "TEXT"), ("ocel_time", "TIMESTAMP"),
+                                                   ("ocel_changed_field", "TEXT")])
+        tables.append((f"object_{suffix}", type_table.path, columns))
+
+    path_tmp = path_sqlite + ".tmp"
+    if os.path.exists(path_tmp):
+        os.remove(path_tmp)
+    conn = sqlite3.connect(path_tmp, isolation_level=None)
+    try:
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+
+        counts = {}
+        conn.execute("BEGIN")
+        for table, path, columns in tables:
+            counts[table] = _load_table(conn, path, table, columns)
+        conn.execute("COMMIT")
+
+        conn.execute("BEGIN")
+        indexes = INDEXES + [(table, ["ocel_id"]) for table, _, _ in tables[len(BASE_TABLES):]]
+        for table, columns in indexes:
+            create_index(conn, table, columns)
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    os.replace(path_tmp, path_sqlite)
+    logger.info(f"socel-sqlite: wrote {sum(counts.values())} rows in {len(counts)} tables to {path_sqlite}")
+    return counts
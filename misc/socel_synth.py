@@ -0,0 +1,236 @@
+# Synthetic sOCEL csv corpora at a multiple of the size of a recorded run, for load tests and benchmarks.
+#
+# SocelModel learns from the csv tables of a run: the header of every table, the id patterns (prefix, number,
+# suffix, e.g. e_formmale_81 or e_checkMale_12>true) with the range of numbers per prefix, the time gaps between
+# consecutive events and the relation fan-outs. A corpus at scale factor k is written as k tiles of the run. Tile i
+# shifts all ids by i times the size of the number range of their prefix (largest - smallest + 1, so a prefix
+# numbered from 0 does not collide with the previous tile) and all times by i times the span of the run plus
+# learned gaps, so ids stay unique, every file stays sorted by time and all relation fan-outs and object lifecycles
+# are kept. Tiles after the first draw the attribute rows of every type table from the rows of the run (object
+# tables per changed field) with a random generator seeded per (seed, table, tile), so a corpus is reproducible and
+# independent of the order the tables are written in. The meta objects of initialize_meta_objects
+# (STATIC_OBJECT_TYPES) and relations among them are written once.
+#
+# Only one table of the run and one tile are held in memory at a time, independent of the scale factor.
+#
+# Usage: python -m misc.socel_synth <out_dir> <scale> [--seed 0] [--source data/socel-csv]
+
+import argparse
+import logging
+import os
+import re
+import shutil
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from misc.loadCSVocel import BASE_TABLES, get_eo_tables
+from misc.socel_xml_writer import SEP
+
+
+logger = logging.getLogger(__name__)
+
+ID_PATTERN = re.compile(r"^(?P<prefix>.*?)(?P<number>\d+)(?P<suffix>\D*)$")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+STATIC_OBJECT_TYPES = ("Facility", "Workstation", "Machine", "Worker")
+COPY_TABLES = ("event_map_type", "object_map_type")
+
+# id columns of the base tables, type tables have ocel_id
+ID_COLUMNS = {
+    "event": ["ocel_id"],
+    "object": ["ocel_id"],
+    "event_object": ["ocel_event_id", "ocel_object_id"],
+    "object_object": ["ocel_source_id", "ocel_target_id"],
+}
+
+
+def _read_table(path):
+    return pd.read_csv(path, sep=SEP, dtype=str, keep_default_na=False)
+
+
+def _split_ids(ids):
+    """
+    :param ids: Series of ids
+    :return: DataFrame with prefix, number (nullable int64) and suffix, number is NA for ids without a number
+    """
+    parts = ids.str.extract(ID_PATTERN)
+    parts["prefix"] = parts["prefix"].fillna(ids)
+    parts["suffix"] = parts["suffix"].fillna("")
+    parts["number"] = pd.to_numeric(parts["number"]).astype("Int64")
+    return parts
+
+
+class SocelModel:
+    """
+    Structure of a recorded run learned from its csv tables, see the module comment.
+    """
+
+    def __init__(self, path_csv, static_object_types=STATIC_OBJECT_TYPES):
+        """
+        :param path_csv: directory of the csv tables of the run
+        :param static_object_types: object types that exist once per corpus instead of once per tile
+        """
+        self.path_csv = path_csv
+        eventTypeTableFilenames, objectTypeTableFilenames = get_eo_tables(path_csv)
+        self.type_tables = [os.path.basename(fn) for fn in eventTypeTableFilenames + objectTypeTableFilenames]
+        self.base_tables = [name + ".csv" for name in BASE_TABLES if os.path.exists(os.path.join(path_csv, name + ".csv"))]
+        self.schemas = {}
+        for fn in self.base_tables + self.type_tables:
+            with open(os.path.join(path_csv, fn)) as file:
+                self.schemas[fn] = file.readline().rstrip("\n").split(SEP)
+
+        objects = _read_table(os.path.join(path_csv, "object.csv"))
+        self.static_ids = set(objects.loc[objects["ocel_type"].isin(static_object_types), "ocel_id"])
+
+        events = _read_table(os.path.join(path_csv, "event.csv"))
+        ids = _split_ids(pd.concat([events["ocel_id"], objects["ocel_id"]], ignore_index=True))
+        numbers = ids.dropna(subset=["number"]).groupby("prefix")["number"]
+        self.id_offsets = (numbers.max() - numbers.min() + 1).astype(np.int64).to_dict()
+
+        event_times = pd.concat([pd.to_datetime(_read_table(fn)["ocel_time"], format=TIME_FORMAT)
+                                 for fn in eventTypeTableFilenames], ignore_index=True).sort_values()
+        object_times = pd.concat([pd.to_datetime(_read_table(fn)["ocel_time"], format=TIME_FORMAT)
+                                  for fn in objectTypeTableFilenames], ignore_index=True)
+        self.start = min(event_times.min(), object_times.min())
+        self.span = max(event_times.max(), object_times.max()) - self.start
+        gaps = event_times.diff().dropna()
+        self.gaps = gaps.to_numpy(dtype="timedelta64[ns]")
+
+        self.fan_outs = {}
+        for fn in ("event_object.csv", "object_object.csv"):
+            if fn in self.base_tables:
+                table = _read_table(os.path.join(path_csv, fn))
+                self.fan_outs[fn[:-4]] = table.groupby(table.columns[0]).size().describe().to_dict()
+
+    def summary(self):
+        return {
+            "tables": len(self.schemas),
+            "id_prefixes": len(self.id_offsets),
+            "static_objects": len(self.static_ids),
+            "span": str(self.span),
+            "median_gap": str(pd.Timedelta(np.median(self.gaps))) if len(self.gaps) else None,
+            "fan_outs": self.fan_outs,
+        }
+
+    def tile_offsets(self, scale, seed):
+        """
+        :return: time offset of each tile: i * span plus the sum of i learned gaps drawn with the seed
+        """
+        rng = np.random.default_rng([seed, 0])
+        gaps = rng.choice(self.gaps, size=scale - 1) if len(self.gaps) and scale > 1 else np.zeros(scale - 1,
+                                                                                                     "timedelta64[ns]")
+        offsets = np.arange(scale) * self.span.to_timedelta64()
+        offsets[1:] += np.cumsum(gaps)
+        return offsets
+
+
+class _TableTiler:
+    """
+    One table of the run, prepared to be written as tiles.
+    """
+
+    def __init__(self, model, fn):
+        self.table = _read_table(os.path.join(model.path_csv, fn))
+        self.name = fn[:-4]
+        id_columns = ID_COLUMNS.get(self.name, ["ocel_id"])
+        self.ids = {}
+        static = np.ones(len(self.table), dtype=bool)
+        for column in id_columns:
+            parts = _split_ids(self.table[column])
+            is_static = parts["number"].isna().to_numpy() | self.table[column].isin(model.static_ids).to_numpy()
+            offsets = parts["prefix"].map(model.id_offsets).fillna(0).astype(np.int64).to_numpy()
+            self.ids[column] = (parts["prefix"].to_numpy(dtype=object), parts["number"].fillna(0).to_numpy(np.int64),
+                                parts["suffix"].to_numpy(dtype=object), offsets, is_static)
+            static &= is_static
+        # rows among static objects only are written with the first tile
+        self.tiled = ~static
+        self.times = None
+        if "ocel_time" in self.table.columns:
+            self.times = pd.to_datetime(self.table["ocel_time"], format=TIME_FORMAT).to_numpy()
+        self.attributes = [column for column in self.table.columns
+                           if column not in id_columns and not column.startswith("ocel_")]
+        self.groups = None
+        if self.attributes:
+            key = self.table["ocel_changed_field"] if "ocel_changed_field" in self.table.columns else pd.Series(
+                "", index=self.table.index)
+            self.groups = [np.flatnonzero((key == value).to_numpy()) for value in key.unique()]
+
+    def tile(self, i, offset, seed):
+        """
+        :return: DataFrame of tile i
+        """
+        if i == 0:
+            return self.table
+        rows = np.flatnonzero(self.tiled)
+        tile = self.table.iloc[rows].copy()
+        for column, (prefix, number, suffix, offsets, is_static) in self.ids.items():
+            shifted = (number + i * offsets).astype(str).astype(object)
+            values = np.where(is_static, self.table[column].to_numpy(dtype=object), prefix + shifted + suffix)
+            tile[column] = values[rows]
+        if self.times is not None:
+            tile["ocel_time"] = pd.DatetimeIndex(self.times[rows] + offset).strftime(TIME_FORMAT)
+        if self.groups is not None:
+            rng = np.random.default_rng([seed, zlib.crc32(self.name.encode()), i])
+            source = np.arange(len(self.table))
+            for group in self.groups:
+                source[group] = rng.choice(group, size=len(group))
+            attributes = self.table[self.attributes].to_numpy(dtype=object)[source[rows]]
+            tile[self.attributes] = attributes
+        return tile
+
+
+def write_synthetic_socel(path_csv, path_out, scale, seed=0, model=None):
+    """
+    Write a synthetic corpus of scale tiles of the run in path_csv.
+    :param path_csv: directory of the csv tables of the run
+    :param path_out: output directory, created if missing
+    :param scale: number of tiles (int >= 1)
+    :param seed: seed of the gaps between tiles and of the attribute draws
+    :param model: SocelModel of path_csv, learned if None
+    :return: dict of file name -> number of rows
+    """
+    if scale < 1:
+        raise ValueError(f"scale must be >= 1, got {scale}")
+    model = model if model is not None else SocelModel(path_csv)
+    offsets = model.tile_offsets(scale, seed)
+    os.makedirs(path_out, exist_ok=True)
+
+    start = time.perf_counter()
+    counts = {}
+    for fn in model.base_tables + model.type_tables:
+        if fn[:-4] in COPY_TABLES:
+            shutil.copyfile(os.path.join(path_csv, fn), os.path.join(path_out, fn))
+            continue
+        tiler = _TableTiler(model, fn)
+        counts[fn] = 0
+        path_tmp = os.path.join(path_out, fn + ".tmp")
+        with open(path_tmp, "w", newline="") as file:
+            file.write(SEP.join(model.schemas[fn]) + "\n")
+            for i in range(scale):
+                tile = tiler.tile(i, offsets[i], seed)
+                tile.to_csv(file, sep=SEP, header=False, index=False, lineterminator="\n")
+                counts[fn] += len(tile)
+        os.replace(path_tmp, os.path.join(path_out, fn))
+    logger.info(f"socel-synth: wrote {sum(counts.values())} rows at scale {scale} to {path_out} "
+                f"in {time.perf_counter() - start:.1f}s")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic sOCEL csv corpus at a multiple of a recorded run.")
+    parser.add_argument("out_dir")
+    parser.add_argument("scale", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", default=os.path.join(os.path.dirname(__file__), os.pardir, "data", "socel-csv"))
+    args = parser.parse_args()
+
+    model = SocelModel(args.source)
+    print(model.summary())
+    counts = write_synthetic_socel(args.source, args.out_dir, args.scale, args.seed, model)
+    print(f"Wrote {sum(counts.values())} rows in {len(counts)} tables to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# Incremental export of the sOCEL csv tables of a running simulation to an OCEL 2.0 SQLite database.
+#
+# cpn-log-writer.sml only appends to the csv files. SocelTailExporter remembers a byte offset per csv file and, at a
+# fixed interval, appends the newly written complete lines to the database in one transaction. The database is
+# opened in WAL mode, so it can be read (e.g. with pm4py.read_ocel2_sqlite) while the simulation is running.
+#
+# Attribute columns are declared REAL: SQLite stores numeric values as REAL and keeps other values as text, so no
+# type inference pass over the whole file is needed. Unknown values ("?") and empty cells are stored as NULL.
+# A csv file that is rewritten (e.g. by create_logs at the start of the next run) is detected by comparing the bytes
+# before the stored offset, and its table is loaded again from the start. Lines with the wrong number of values are
+# skipped with a warning.
+
+import csv
+import logging
+import os
+import sqlite3
+import threading
+
+from misc.enrich_co2e import DEFERRED_CALL_TABLE
+from misc.socel_sqlite_writer import INDEXES, NULL_VALUES, create_index, declared_type, quote_identifier
+from misc.socel_xml_writer import SEP, check_row_length
+import config
+
+
+logger = logging.getLogger(__name__)
+
+CHECK_BYTES = 64 # bytes before the offset compared to detect a rewritten file
+
+
+class _TailState:
+    def __init__(self, table, columns, offset, check, lines):
+        self.table = table
+        self.columns = columns
+        self.offset = offset
+        self.check = check
+        self.lines = lines # lines before offset
+
+
+class SocelTailExporter:
+    """
+    Follow the csv tables in path_csv and append new complete lines to the OCEL 2.0 SQLite database path_sqlite.
+    """
+
+    def __init__(self, path_csv, path_sqlite, interval=None):
+        """
+        :param path_csv: directory of the csv tables
+        :param path_sqlite: path of the sqlite file, an existing file is replaced
+        :param interval: seconds between two polls of the background thread, defaults to config.SOCEL_TAIL_INTERVAL
+        """
+        self.path_csv = path_csv
+        self.path_sqlite = path_sqlite
+        self.interval = interval if interval is not None else getattr(config, "SOCEL_TAIL_INTERVAL", 5.0)
+        self.rows = 0
+        self._states = {}
+        self._conn = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path_sqlite + suffix):
+                os.remove(self.path_sqlite + suffix)
+        conn = sqlite3.connect(self.path_sqlite, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _create_table(self, table, columns):
+        names = ", ".join(f"{quote_identifier(column)} {declared_type(column)}" for column in columns)
+        self._conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table)}")
+        self._conn.execute(f"CREATE TABLE {quote_identifier(table)} ({names})")
+        indexes = [index_columns for index_table, index_columns in INDEXES if index_table == table]
+        if not indexes and "ocel_id" in columns:
+            indexes = [["ocel_id"]]
+        for index_columns in indexes:
+            create_index(self._conn, table, index_columns)
+
+    def _is_unchanged(self, file, state, size):
+        if size < state.offset:
+            return False
+        start = max(0, state.offset - CHECK_BYTES)
+        file.seek(start)
+        return file.read(state.offset - start) == state.check
+
+    def _poll_file(self, fn):
+        """
+        Append the new complete lines of a csv file to its table.
+        :return: number of inserted rows
+        """
+        path = os.path.join(self.path_csv, fn)
+        state = self._states.get(fn)
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if state is not None and not self._is_unchanged(file, state, size):
+                logger.info(f"socel-tail: {fn} was rewritten, loading it again")
+                state = None
+            offset = state.offset if state is not None else 0
+            if size <= offset:
+                return 0
+            file.seek(offset)
+            data = file.read(size - offset)
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return 0
+
+        lines = data[:end].decode("utf-8").splitlines()
+        rows = csv.reader(lines, delimiter=SEP)
+        first_line = state.lines + 1 if state is not None else 2
+        if state is None:
+            columns = next(rows)
+            state = _TailState(os.path.splitext(fn)[0], columns, 0, b"", 0)
+            self._create_table(state.table, columns)
+            self._states[fn] = state
+
+        values = []
+        for line, row in enumerate(rows, start=first_line):
+            if not row:
+                continue
+            try:
+                check_row_length(path, line, row, len(state.columns))
+            except ValueError as e:
+                # skipped, the offset moves past it so later polls are not stuck on it
+                logger.warning(f"socel-tail: skipped {e}")
+                continue
+            values.append([None if value in NULL_VALUES else value for value in row])
+        placeholders = ", ".join("?" * len(state.columns))
+        self._conn.executemany(f"INSERT INTO {quote_identifier(state.table)} VALUES ({placeholders})", values)
+        state.offset = offset + end
+        state.check = (state.check + data[max(0, end - CHECK_BYTES):end])[-CHECK_BYTES:]
+        state.lines += len(lines)
+        return len(values)
+
+    def poll(self):
+        """
+        Append the new complete lines of all csv files in one transaction.
+        :return: number of inserted rows
+        """
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            file_names = sorted(fn for fn in os.listdir(self.path_csv)
+                                if fn.endswith(".csv") and fn != DEFERRED_CALL_TABLE)
+            count = 0
+            saved = {fn: (state, state.offset, state.check, state.lines) for fn, state in self._states.items()}
+            self._conn.execute("BEGIN")
+            try:
+                for fn in file_names:
+                    count += self._poll_file(fn)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._states = {fn: state for fn, (state, *_) in saved.items()}
+                for state, offset, check, lines in saved.values():
+                    state.offset, state.check, state.lines = offset, check, lines
+                raise
+            self.rows += count
+        if count:
+            logger.debug(f"socel-tail: appended {count} rows to {self.path_sqlite}")
+        return count
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"socel-tail: poll failed: {e}")
+
+    def start(self):
+        """
+        Poll in a background thread every interval seconds.
+        """
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name="socel-tail", daemon=True)
+        self._thread.start()
+        logger.info(f"socel-tail: following {self.path_csv} every {self.interval}s")
+
+    def stop(self):
+        """
+        Stop the background thread, append the remaining lines and close the database.
+        :return: total number of inserted rows
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.poll()
+        with self._lock:
+            self._conn.close()
+            self._conn = None
+        logger.info(f"socel-tail: stopped after {self.rows} rows")
+        return self.rows
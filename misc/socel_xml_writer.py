@@ -0,0 +1,308 @@
+# Streaming export of the sOCEL csv tables (as written by cpn-log-writer.sml) to OCEL 2.0 XML.
+#
+# The csv files are read row by row and the XML is written incrementally, without pandas, SQLite, pm4py or lxml.
+# Events and objects are written in the order of event.csv and object.csv. Their type table rows, e2o relations
+# (event_object.csv) and o2o relations (object_object.csv) are merged in by a single sequential read, as the log
+# writer appends them in the same order. Only object attribute changes (rows with ocel_changed_field) are kept in
+# memory until their object is written. If the relation tables are not in log order, the export is repeated with an
+# in-memory index of the relations.
+
+import csv
+import logging
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+
+logger = logging.getLogger(__name__)
+
+SEP = ";"
+MISSING = ""
+INITIAL_TIME = "1970-01-01T00:00:00Z" # time of initial object attribute values, as written by pm4py
+
+
+def read_rows(path):
+    """
+    :return: generator of csv rows as lists of strings, including the header row. Empty if the file does not exist.
+    """
+    if not os.path.exists(path):
+        logger.warning(f"socel-xml: {path} not found, using an empty table")
+        return
+    with open(path, newline='', encoding='utf-8') as file:
+        yield from csv.reader(file, delimiter=SEP)
+
+
+def check_row_length(path, line, row, length):
+    """
+    Raise ValueError with the file name and line number if a csv row does not have length values.
+    """
+    if len(row) != length:
+        raise ValueError(f"{os.path.basename(path)}, line {line}: {len(row)} values instead of {length}")
+
+
+def _iso_time(value):
+    """
+    Convert a csv time (e.g. 2023-04-03 07:38:46) to ISO 8601 with UTC offset.
+    """
+    value = value.replace(" ", "T", 1)
+    if value.endswith("Z") or "+" in value[10:]:
+        return value
+    return value + "+00:00"
+
+
+def _value_type(value):
+    try:
+        int(value)
+        return "integer"
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return "float"
+    except ValueError:
+        return "string"
+
+
+_TYPE_RANK = {"integer": 0, "float": 1, "string": 2}
+
+
+class TypeTable:
+    """
+    Header, attribute types and attribute changes of an event or object type table, read in one streaming pass.
+    """
+
+    def __init__(self, path, first_attribute, collect_changes, missing=(MISSING,)):
+        """
+        :param path: path of the csv table
+        :param first_attribute: index of the first attribute column
+        :param collect_changes: keep the rows with an ocel_changed_field in self.changes
+        :param missing: values ignored by the type inference
+        """
+        self.path = path
+        self.columns = []
+        self.attributes = []
+        self.types = {}
+        self.changes = {}
+
+        rows = read_rows(path)
+        header = next(rows, None)
+        if header is None:
+            return
+        self.columns = header
+        self.attributes = header[first_attribute:]
+        ranks = [0] * len(self.attributes)
+        changed_field = header.index("ocel_changed_field") if collect_changes else None
+        for line, row in enumerate(rows, start=2):
+            if not row:
+                continue
+            check_row_length(path, line, row, len(header))
+            if changed_field is not None and row[changed_field] != MISSING:
+                self.changes.setdefault(row[0], []).append(row)
+            for i, value in enumerate(row[first_attribute:]):
+                if ranks[i] < 2 and value not in missing:
+                    ranks[i] = max(ranks[i], _TYPE_RANK[_value_type(value)])
+        names = {rank: name for name, rank in _TYPE_RANK.items()}
+        self.types = {attribute: names[rank] for attribute, rank in zip(self.attributes, ranks)}
+
+
+class _OrderError(Exception):
+    pass
+
+
+class _GroupedRows:
+    """
+    Rows of a csv table grouped by the key in column key_index, requested in log order by take(key).
+
+    In streaming mode the table is read sequentially and has to be in the same order as the requests. In indexed mode
+    the whole table is loaded into a dict first.
+    """
+
+    def __init__(self, path, key_index, indexed=False):
+        self.path = path
+        self.key_index = key_index
+        self.indexed = indexed
+        rows = read_rows(path)
+        next(rows, None) # header
+        if indexed:
+            self._index = {}
+            for row in rows:
+                self._index.setdefault(row[key_index], []).append(row)
+        else:
+            self._rows = rows
+            self._lookahead = next(rows, None)
+
+    def take(self, key):
+        if self.indexed:
+            return self._index.pop(key, [])
+        group = []
+        while self._lookahead is not None and self._lookahead[self.key_index] == key:
+            group.append(self._lookahead)
+            self._lookahead = next(self._rows, None)
+        return group
+
+    def check_consumed(self):
+        """
+        Raise _OrderError if rows are left over, i.e. the table was not in log order or has unknown keys.
+        """
+        if self.indexed:
+            left = sum(len(rows) for rows in self._index.values())
+            if left:
+                logger.warning(f"socel-xml: {left} rows of {self.path} reference unknown ids and were skipped")
+        elif self._lookahead is not None:
+            raise _OrderError(self.path)
+
+
+def read_type_map(path):
+    """
+    :return: dict of type -> table name suffix from event_map_type.csv or object_map_type.csv
+    """
+    rows = read_rows(path)
+    next(rows, None)
+    return {row[0]: row[1] for row in rows if row}
+
+
+def _write_type_declarations(out, tag, tables):
+    out.write(f"  <{tag}s>\n")
+    for type_name, table in tables.items():
+        out.write(f"    <{tag} name={quoteattr(type_name)}>\n      <attributes>\n")
+        for attribute in table.attributes:
+            out.write(f"        <attribute name={quoteattr(attribute)} type=\"{table.types[attribute]}\"/>\n")
+        out.write(f"      </attributes>\n    </{tag}>\n")
+    out.write(f"  </{tag}s>\n")
+
+
+def _write_relationships(out, relations, target_index, qualifier_index):
+    if not relations:
+        return
+    out.write("      <objects>\n")
+    for relation in relations:
+        out.write(f"        <relationship object-id={quoteattr(relation[target_index])} "
+                  f"qualifier={quoteattr(relation[qualifier_index])}/>\n")
+    out.write("      </objects>\n")
+
+
+def _write_objects(out, path_csv, object_tables, indexed):
+    type_rows = {ot: _GroupedRows(table.path, 0, indexed=True) if indexed else None
+                 for ot, table in object_tables.items()}
+    streams = {ot: read_rows(table.path) for ot, table in object_tables.items()}
+    for stream in streams.values():
+        next(stream, None)
+    o2o = _GroupedRows(os.path.join(path_csv, "object_object.csv"), 0, indexed)
+
+    count = 0
+    out.write("  <objects>\n")
+    object_rows = read_rows(os.path.join(path_csv, "object.csv"))
+    next(object_rows, None)
+    for object_id, object_type, *_ in object_rows:
+        table = object_tables[object_type]
+        if indexed:
+            initial = [row for row in type_rows[object_type].take(object_id) if row[2] == MISSING][:1]
+        else:
+            initial = []
+            for row in streams[object_type]:
+                if row[2] == MISSING: # skip change rows, they are collected in TypeTable
+                    if row[0] != object_id:
+                        raise _OrderError(table.path)
+                    initial = [row]
+                    break
+
+        out.write(f"    <object id={quoteattr(object_id)} type={quoteattr(object_type)}>\n      <attributes>\n")
+        for row in initial:
+            for attribute, value in zip(table.attributes, row[3:]):
+                if value != MISSING:
+                    out.write(f"        <attribute name={quoteattr(attribute)} time=\"{INITIAL_TIME}\">"
+                              f"{escape(value)}</attribute>\n")
+        for row in table.changes.get(object_id, []):
+            attribute = row[2]
+            value = row[table.columns.index(attribute)] if attribute in table.columns else MISSING
+            if value != MISSING:
+                out.write(f"        <attribute name={quoteattr(attribute)} time=\"{_iso_time(row[1])}\">"
+                          f"{escape(value)}</attribute>\n")
+        out.write("      </attributes>\n")
+        _write_relationships(out, o2o.take(object_id), 1, 2)
+        out.write("    </object>\n")
+        count += 1
+    out.write("  </objects>\n")
+
+    o2o.check_consumed()
+    return count
+
+
+def _write_events(out, path_csv, event_tables, indexed):
+    type_rows = {et: _GroupedRows(table.path, 0, indexed) for et, table in event_tables.items()}
+    e2o = _GroupedRows(os.path.join(path_csv, "event_object.csv"), 0, indexed)
+
+    count = 0
+    out.write("  <events>\n")
+    event_rows = read_rows(os.path.join(path_csv, "event.csv"))
+    next(event_rows, None)
+    for event_id, event_type, *_ in event_rows:
+        table = event_tables[event_type]
+        rows = type_rows[event_type].take(event_id)
+        if not rows:
+            if indexed: # e.g. a crash between the writes of event.csv and the type table
+                raise ValueError(f"{os.path.basename(table.path)}: no row for event {event_id} of event.csv")
+            raise _OrderError(table.path)
+        row = rows[0]
+
+        out.write(f"    <event id={quoteattr(event_id)} type={quoteattr(event_type)} "
+                  f"time=\"{_iso_time(row[1])}\">\n      <attributes>\n")
+        for attribute, value in zip(table.attributes, row[2:]):
+            if value != MISSING:
+                out.write(f"        <attribute name={quoteattr(attribute)}>{escape(value)}</attribute>\n")
+        out.write("      </attributes>\n")
+        _write_relationships(out, e2o.take(event_id), 1, 2)
+        out.write("    </event>\n")
+        count += 1
+    out.write("  </events>\n")
+
+    for rows in type_rows.values():
+        rows.check_consumed()
+    e2o.check_consumed()
+    return count
+
+
+def _write_log(path, path_csv, event_tables, object_tables, indexed):
+    """
+    Write one export pass to path.
+    :return: (number of events, number of objects)
+    """
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n<log>\n')
+        _write_type_declarations(out, "object-type", object_tables)
+        _write_type_declarations(out, "event-type", event_tables)
+        n_objects = _write_objects(out, path_csv, object_tables, indexed)
+        n_events = _write_events(out, path_csv, event_tables, indexed)
+        out.write("</log>\n")
+    return n_events, n_objects
+
+
+def write_socel_xml(path_csv, path_xml):
+    """
+    Export the sOCEL csv tables to an OCEL 2.0 XML file. The file is written to a temporary file first and replaced
+    at the end, so readers never see a partial file. An existing xml file is kept if the export fails.
+    :param path_csv: directory of the csv tables
+    :param path_xml: path of the xml file
+    :return: (number of events, number of objects)
+    """
+    event_types = read_type_map(os.path.join(path_csv, "event_map_type.csv"))
+    object_types = read_type_map(os.path.join(path_csv, "object_map_type.csv"))
+    event_tables = {et: TypeTable(os.path.join(path_csv, f"event_{table}.csv"), 2, False)
+                    for et, table in event_types.items()}
+    object_tables = {ot: TypeTable(os.path.join(path_csv, f"object_{table}.csv"), 3, True)
+                     for ot, table in object_types.items()}
+
+    path_tmp = path_xml + ".tmp"
+    try:
+        try:
+            n_events, n_objects = _write_log(path_tmp, path_csv, event_tables, object_tables, False)
+        except _OrderError as e:
+            logger.warning(f"socel-xml: {e} is not in log order, exporting again with an in-memory index")
+            n_events, n_objects = _write_log(path_tmp, path_csv, event_tables, object_tables, True)
+    except BaseException:
+        if os.path.exists(path_tmp):
+            os.remove(path_tmp)
+        raise
+
+    os.replace(path_tmp, path_xml)
+    logger.info(f"socel-xml: wrote {n_events} events and {n_objects} objects to {path_xml}")
+    return n_events, n_objects
@@ -0,0 +1,79 @@
+# Small sOCEL csv log for the tests of the misc modules, in the format written by cpn-log-writer.sml.
+#
+# Part o1 changes p_mass[kg] and s_co2e[kg] interleaved with a change of o2, so the order of the attribute changes
+# differs between the type table and the objects.
+
+import os
+
+
+TABLES = {
+    "event": [
+        "ocel_id;ocel_type",
+        "e1;Cut",
+        "e2;Pack",
+        "e3;Cut",
+    ],
+    "event_Cut": [
+        "ocel_id;ocel_time;p_duration[s];s_co2e[kg]",
+        "e1;2023-04-03 08:00:00;5.0;1.25",
+        "e3;2023-04-03 08:00:10;6.5;?",
+    ],
+    "event_Pack": [
+        "ocel_id;ocel_time;p_duration[s];s_co2e[kg]",
+        "e2;2023-04-03 08:00:05;2.0;0.5",
+    ],
+    "event_map_type": [
+        "ocel_type;ocel_type_map",
+        "Cut;Cut",
+        "Pack;Pack",
+    ],
+    "object": [
+        "ocel_id;ocel_type",
+        "o1;Part",
+        "o2;Part",
+        "b1;Box",
+    ],
+    "object_Part": [
+        "ocel_id;ocel_time;ocel_changed_field;p_mass[kg];s_co2e[kg]",
+        "o1;2023-04-03 08:00:00;;0.5;0",
+        "o2;2023-04-03 08:00:00;;0.6;0",
+        "o2;2023-04-03 08:00:01;s_co2e[kg];;1.5",
+        "o1;2023-04-03 08:00:02;p_mass[kg];0.4;",
+        "o1;2023-04-03 08:00:03;s_co2e[kg];;2.5",
+        "o1;2023-04-03 08:00:04;p_mass[kg];0.3;",
+    ],
+    "object_Box": [
+        "ocel_id;ocel_time;ocel_changed_field;p_material",
+        "b1;2023-04-03 08:00:00;;cardboard",
+    ],
+    "object_map_type": [
+        "ocel_type;ocel_type_map",
+        "Part;Part",
+        "Box;Box",
+    ],
+    "event_object": [
+        "ocel_event_id;ocel_object_id;ocel_qualifier",
+        "e1;o1;input",
+        "e2;o1;input",
+        "e2;b1;output",
+        "e3;o2;input",
+    ],
+    "object_object": [
+        "ocel_source_id;ocel_target_id;ocel_qualifier",
+        "o1;b1;packed in",
+    ],
+}
+
+
+def write_socel_csv(path_csv, tables=None):
+    """
+    Write the csv tables of the fixture log to path_csv.
+    :param tables: mapping of table name -> lines, replaces tables of TABLES, None leaves a table out
+    """
+    tables = dict(TABLES, **(tables or {}))
+    os.makedirs(path_csv, exist_ok=True)
+    for table, lines in tables.items():
+        if lines is None:
+            continue
+        with open(os.path.join(path_csv, table + ".csv"), "w") as file:
+            file.write("\n".join(lines) + "\n")
@@ -3,8 +3,12 @@ import cpn_api_start # enables logging while testing
 import unittest
 import os
 import logging
+from unittest import mock
 
 import cpn_api.collector as collector
+from cpn_api.snapshot import FactorSnapshot, build_snapshot
+from cpn_api.climatiq_stub import ClimatiqStub
+from cpn_api.session import SessionManager
 import cpn_api.configurator as xml
 import config
 
@@ -44,6 +48,154 @@ class TestCollector(unittest.TestCase):
     def test_get_co2e(self):
         pass
 
+    def test_get_co2e_memo(self):
+        memo = collector.FactorMemo()
+        with mock.patch.object(collector, "factor_memo", memo), \
+                mock.patch.object(collector, "get_co2e_by_climatiq_call", return_value=0.5) as call:
+            self.assertEqual(collector.get_co2e(self.request_id, 4.0), 2.0)
+            self.assertEqual(collector.get_co2e(self.request_id, 2.0), 1.0)
+            self.assertEqual(call.call_count, 1)
+            self.assertEqual(call.call_args.args[1]["parameters"][self.quantity_name], 1)
+
+            # a changed entry invalidates the memoized factor
+            xml.add_request_climatiq(self.request_id, self.param_data, {"id": "changed"}, self.quantity_name)
+            collector.get_co2e(self.request_id, 1.0)
+            self.assertEqual(call.call_count, 2)
+        self.assertEqual(memo.stats()["hits"], 1)
+        self.assertEqual(memo.stats()["invalidations"], 1)
+
+    def test_factor_memo_eviction(self):
+        memo = collector.FactorMemo(maxsize=2)
+        for request_id in ["a", "b", "a", "c"]:
+            if memo.get(request_id, None) is None:
+                memo.put(request_id, None, 1.0)
+        self.assertIsNone(memo.get("b", None))
+        self.assertEqual(memo.get("a", None), 1.0)
+        self.assertEqual(memo.stats()["evictions"], 1)
+
+
+class TestSessionManager(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = ClimatiqStub(factors={"factor_a": 2.0}).start()
+        self.session_manager = SessionManager(backend='memory', retries=2, backoff_factor=0)
+        self.patch = mock.patch.object(collector, "session_manager", self.session_manager)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.session_manager.close()
+        self.stub.stop()
+
+    def json_body(self, quantity):
+        return {"emission_factor": {"id": "factor_a"}, "parameters": {"weight": quantity, "weight_unit": "kg"}}
+
+    def test_connection_reuse(self):
+        for quantity in range(1, 6):
+            co2e = collector.get_co2e_by_climatiq_call(self.stub.url + "/estimate", self.json_body(quantity))
+            self.assertEqual(co2e, 2.0 * quantity)
+        self.assertEqual(self.stub.requests, 5)
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_retry_on_rate_limit(self):
+        self.stub.fail_next(2, status=429)
+        co2e = collector.get_co2e_by_climatiq_call(self.stub.url + "/estimate", self.json_body(1))
+        self.assertEqual(co2e, 2.0)
+        self.assertEqual(self.stub.requests, 3)
+
+    def test_error_after_retries(self):
+        self.stub.fail_next(3, status=503)
+        with self.assertRaises(ValueError):
+            collector.get_co2e_by_climatiq_call(self.stub.url + "/estimate", self.json_body(1))
+
+    def test_get_co2e_batch(self):
+        xml.add_request_climatiq("id_stub_a", {"weight": 1, "weight_unit": "kg"}, {"id": "factor_a"}, "weight",
+                                 endpoint=self.stub.url + "/estimate")
+        xml.add_request_climatiq("id_stub_b", {"weight": 1, "weight_unit": "kg"}, {"id": "factor_b"}, "weight",
+                                 endpoint=self.stub.url + "/estimate")
+        xml.add_default_entry("id_default", 0.5)
+        calls = [("id_stub_a", 2.0), ("id_stub_b", 3.0), ("id_stub_a", 1.0), ("id_default", 4.0)]
+        with mock.patch.object(collector, "factor_memo", collector.FactorMemo()):
+            self.assertEqual(collector.get_co2e_batch(calls), [4.0, 3.0, 2.0, 2.0])
+            self.assertEqual(self.stub.requests, 1)
+            self.assertEqual(collector.get_co2e_batch(calls), [4.0, 3.0, 2.0, 2.0])
+            self.assertEqual(self.stub.requests, 1)
+
+    def test_get_co2e_batch_missing_results(self):
+        for request_id in ("id_stub_a", "id_stub_b"):
+            xml.add_request_climatiq(request_id, {"weight": 1, "weight_unit": "kg"}, {"id": "factor_a"}, "weight",
+                                     endpoint=self.stub.url + "/estimate")
+        response = {"results": [{"co2e": 2.0, "co2e_unit": "kg"}]}
+        with mock.patch.object(collector, "factor_memo", collector.FactorMemo()), \
+                mock.patch.object(collector, "_post_counted", return_value=response):
+            with self.assertRaisesRegex(ValueError, "request ids id_stub_b$"):
+                collector.get_co2e_batch([("id_stub_a", 1.0), ("id_stub_b", 1.0)])
+
+    def test_get_co2e_factors(self):
+        xml.add_request_climatiq("id_stub_a", {"weight": 1, "weight_unit": "kg"}, {"id": "factor_a"}, "weight",
+                                 endpoint=self.stub.url + "/estimate")
+        xml.add_default_entry("id_default", 0.5)
+        with mock.patch.object(collector, "factor_memo", collector.FactorMemo()):
+            factors = collector.get_co2e_factors(["id_stub_a", "id_default", "id_stub_a"])
+            self.assertEqual(factors, {"id_stub_a": 2.0, "id_default": 0.5})
+            self.assertEqual(self.stub.requests, 1)
+            with self.assertRaises(ValueError):
+                collector.get_co2e_factors(["id_missing"])
+
+    def test_factor_snapshot(self):
+        xml.add_request_climatiq("id_stub_a", {"weight": 1, "weight_unit": "kg"},
+                                 {"id": "factor_a", "data_version": "^3"}, "weight",
+                                 endpoint=self.stub.url + "/estimate")
+        xml.add_default_entry("id_default", 0.5)
+        snapshot, failures = build_snapshot(["id_stub_a", "id_default", "id_missing"])
+        self.assertEqual(set(failures), {"id_missing"})
+        path = os.path.join(os.path.dirname(config.FILEPATH_REQUESTS_XML), "test-factor-snapshot.json")
+        try:
+            snapshot.save(path)
+            loaded = FactorSnapshot.load(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(loaded.entries["id_stub_a"]["data_version"], "^3")
+        self.assertEqual(loaded.entries["id_stub_a"]["unit"], "kg")
+
+        xml.clear_requests()
+        requests = self.stub.requests
+        with mock.patch.object(collector, "factor_snapshot", loaded):
+            self.assertEqual(collector.get_co2e("id_stub_a", 3.0), 6.0)
+            self.assertEqual(collector.get_co2e_batch([("id_default", 4.0), ("id_stub_a", 1.0)]), [2.0, 2.0])
+            self.assertEqual(collector.prefetch_factors(["id_stub_a"]), {})
+        self.assertEqual(self.stub.requests, requests)
+
+    def test_prefetch_factors(self):
+        for request_id, factor_id in [("id_stub_a", "factor_a"), ("id_stub_b", "factor_b")]:
+            xml.add_request_climatiq(request_id, {"weight": 1, "weight_unit": "kg"}, {"id": factor_id}, "weight",
+                                     endpoint=self.stub.url + "/estimate")
+        xml.add_request_climatiq("id_stub_broken", {"weight": 1, "weight_unit": "kg"}, {"id": "factor_a"}, "weight",
+                                 endpoint=self.stub.url + "/unknown")
+        with mock.patch.object(collector, "factor_memo", collector.FactorMemo()) as memo:
+            failures = collector.prefetch_factors(["id_stub_a", "id_stub_b", "id_stub_broken", "id_missing"])
+            self.assertEqual(set(failures), {"id_stub_broken", "id_missing"})
+            self.assertEqual(memo.stats()["size"], 2)
+
+            requests = self.stub.requests
+            self.assertEqual(collector.get_co2e("id_stub_a", 3.0), 6.0)
+            self.assertEqual(self.stub.requests, requests)
+
+    def test_offline_mode(self):
+        xml.add_request_climatiq("id_stub_a", {"weight": 1, "weight_unit": "kg"}, {"id": "factor_a"}, "weight",
+                                 endpoint=self.stub.url + "/estimate")
+        xml.add_default_entry("id_default", 0.5)
+        requests = self.stub.requests
+        with mock.patch.object(collector, "OFFLINE_MODE", True), \
+                mock.patch.object(collector, "factor_memo", collector.FactorMemo()):
+            single = collector.get_co2e("id_stub_a", 3.0)
+            batch = collector.get_co2e_batch([("id_stub_a", 3.0), ("id_default", 4.0)])
+            self.assertEqual(collector.prefetch_factors(["id_stub_a"]), {})
+        # the same value and type on both paths, e.g. "0.0" in the responses of call_v1 and call_batch_v1
+        self.assertEqual(repr(single), "0.0")
+        self.assertEqual([repr(value) for value in batch], ["0.0", "2.0"])
+        self.assertEqual(self.stub.requests, requests)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,6 +3,7 @@ import cpn_api_start # enables logging while testing
 import unittest
 import os
 import logging
+from unittest import mock
 
 import cpn_api.configurator as xml
 import config
@@ -42,6 +43,60 @@ class TestConfigurator(unittest.TestCase):
         with self.assertRaises(ValueError):
             xml.get_request_entry(self.not_exisiting_id)
 
+    def test_registry_reload_on_change(self):
+        xml.add_default_entry("id_default", 2.0)
+        self.assertEqual(xml.read_default_entry("id_default"), 2.0)
+        xml.add_default_entry("id_default", 3.5)
+        self.assertEqual(xml.read_default_entry("id_default"), 3.5)
+        self.assertEqual(xml.get_list_of_request_ids(), ["id_default"])
+
+    def test_registry_parses_once(self):
+        xml.add_request_climatiq(self.exisiting_id, self.param_data, self.factor_data, self.quantity_name)
+        xml.registry.refresh()
+        with mock.patch.object(xml.ET, "parse", wraps=xml.ET.parse) as parse:
+            for _ in range(100):
+                self.assertTrue(xml.check_request_entry(self.exisiting_id))
+                xml.get_request_entry(self.exisiting_id)
+            self.assertEqual(parse.call_count, 0)
+
+    def test_transaction_writes_once(self):
+        with mock.patch.object(xml, "_write_tree", wraps=xml._write_tree) as write_tree:
+            with xml.transaction():
+                for i in range(10):
+                    xml.add_default_entry(f"id_default_{i}", float(i))
+                xml.add_request_climatiq(self.exisiting_id, self.param_data, self.factor_data, self.quantity_name)
+                xml.remove_default_entry("id_default_0")
+                self.assertFalse(xml.check_default_entry("id_default_1"))
+            self.assertEqual(write_tree.call_count, 1)
+        self.assertEqual(len(xml.get_list_of_request_ids()), 10)
+        self.assertEqual(xml.read_default_entry("id_default_9"), 9.0)
+        self.assertFalse(os.path.exists(config.FILEPATH_REQUESTS_XML + ".tmp"))
+
+    def test_transaction_rollback(self):
+        xml.add_default_entry("id_default", 2.0)
+        with self.assertRaises(RuntimeError):
+            with xml.transaction():
+                xml.add_default_entry("id_default", 3.0)
+                raise RuntimeError()
+        self.assertEqual(xml.read_default_entry("id_default"), 2.0)
+
+    def test_import_entries(self):
+        xml.add_default_entry("id_removed", 1.0)
+        path = os.path.join(os.path.dirname(config.FILEPATH_REQUESTS_XML), "test_entries.csv")
+        with open(path, "w") as file:
+            file.write("id,default,remove,quantity_name,parameters,emission_factor\n"
+                       "id_default,0.5,,,,\n"
+                       "id_removed,,true,,,\n"
+                       f"{self.exisiting_id},,,weight,\"{{\"\"weight\"\": 1}}\",\"{{\"\"id\"\": \"\"f\"\"}}\"\n")
+        try:
+            self.assertEqual(xml.import_entries(path), 3)
+        finally:
+            os.remove(path)
+        self.assertEqual(xml.read_default_entry("id_default"), 0.5)
+        self.assertFalse(xml.check_default_entry("id_removed"))
+        endpoint, json_body, quantity_name = xml.get_request_entry(self.exisiting_id)
+        self.assertEqual(json_body["emission_factor"], {"id": "f"})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,36 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+from unittest import mock
+
+import cpn_api.connector as connector
+import cpn_api.configurator as xml
+
+
+class TestConnector(unittest.TestCase):
+
+    def setUp(self):
+        xml.add_default_entry("id_default_a", 2.0)
+        xml.add_default_entry("id_default_b", 0.5)
+
+    def test_handle_call(self):
+        self.assertEqual(connector.handle_call("call_v1%id_default_a%3.0"), "6.0")
+        self.assertEqual(connector.handle_call("call_v1%id_default_a%?"), "")
+
+    def test_handle_call_batch(self):
+        response = connector.handle_call_batch("call_batch_v1%id_default_a%3.0%id_default_b%?%id_default_b%4")
+        self.assertEqual(response.split('%'), ["6.0", "", "2.0"])
+
+    def test_handle_call_batch_missing_quantity(self):
+        with self.assertLogs("cpn_api.connector", "WARNING"):
+            response = connector.handle_call_batch("call_batch_v1%id_default_a%3.0%id_default_b")
+        self.assertEqual(response.split('%'), ["6.0", ""])
+
+    def test_handle_call_batch_single_round_trip(self):
+        with mock.patch.object(connector, "get_co2e_batch", return_value=[1.0, 2.0]) as get_co2e_batch:
+            self.assertEqual(connector.handle_call_batch("call_batch_v1%a%1%b%2"), "1.0%2.0")
+            get_co2e_batch.assert_called_once_with([("a", 1.0), ("b", 2.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
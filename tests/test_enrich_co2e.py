@@ -0,0 +1,61 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+from unittest import mock
+
+import cpn_api.collector as collector
+from misc.enrich_co2e import enrich_co2e
+from tests.socel_fixture import TABLES, write_socel_csv
+
+
+class TestEnrichCo2e(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_csv = self.tmpdir.name
+        write_socel_csv(self.path_csv, {"deferred_call": [
+            "ocel_id;ocel_request_id;ocel_quantity",
+            "e1;r1;2.0",
+            "e1;r1;1.0",
+            "o2;r2;3",
+            "e2;r2;?",
+        ]})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_lines(self, table):
+        with open(os.path.join(self.path_csv, table + ".csv")) as file:
+            return file.read().splitlines()
+
+    def test_enrich(self):
+        with mock.patch.object(collector, "get_co2e_factors", return_value={"r1": 0.5, "r2": 2.0}) as factors:
+            self.assertEqual(enrich_co2e(self.path_csv), 3)
+        self.assertEqual(sorted(factors.call_args[0][0]), ["r1", "r2"])
+        self.assertEqual(self.read_lines("event_Cut"), [
+            "ocel_id;ocel_time;p_duration[s];s_co2e[kg]",
+            "e1;2023-04-03 08:00:00;5.0;1.5",
+            "e3;2023-04-03 08:00:10;6.5;?",
+        ])
+        # a call with unknown quantity counts as 0
+        self.assertEqual(self.read_lines("event_Pack")[1], "e2;2023-04-03 08:00:05;2.0;0.0")
+        # only the initial row of o2 is enriched, change rows and objects without calls are untouched
+        part = self.read_lines("object_Part")
+        self.assertEqual(part[2], "o2;2023-04-03 08:00:00;;0.6;6.0")
+        self.assertEqual(part[3], "o2;2023-04-03 08:00:01;s_co2e[kg];;1.5")
+        self.assertEqual([line for i, line in enumerate(part) if i != 2],
+                         [line for i, line in enumerate(TABLES["object_Part"]) if i != 2])
+        self.assertEqual(self.read_lines("object_Box"), TABLES["object_Box"])
+
+    def test_not_deferred(self):
+        os.remove(os.path.join(self.path_csv, "deferred_call.csv"))
+        with mock.patch.object(collector, "get_co2e_factors") as factors:
+            self.assertEqual(enrich_co2e(self.path_csv), 0)
+        factors.assert_not_called()
+        self.assertEqual(self.read_lines("event_Cut"), TABLES["event_Cut"])
+
+
+if __name__ == '__main__':
+    unittest.main()
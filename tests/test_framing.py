@@ -0,0 +1,51 @@
+import unittest
+import socket
+import threading
+
+from cpn_api.pycpn.pyCPN import PyCPN
+from cpn_api.pycpn.pyCPNFraming import encode_frames, FrameReader
+
+
+def reference_frames(data):
+    # segmentation of PyCPN 0.1 / JavaCPN
+    frames = b''
+    while len(data) > 127:
+        frames += bytes([255]) + data[:127]
+        data = data[127:]
+    return frames + bytes([len(data)]) + data
+
+
+class TestFraming(unittest.TestCase):
+
+    sizes = [0, 1, 126, 127, 128, 253, 254, 255, 1000, 70000]
+
+    def test_encode_wire_compatible(self):
+        for size in self.sizes:
+            data = bytes(i % 251 for i in range(size))
+            self.assertEqual(bytes(encode_frames(data)), reference_frames(data), size)
+
+    def test_roundtrip(self):
+        a, b = socket.socketpair()
+        sender, receiver = PyCPN(), PyCPN()
+        sender.socket = a
+        receiver.socket = b
+        receiver.reader = FrameReader(b, buffer_size=256)
+        messages = [bytes(i % 251 for i in range(size)) for size in self.sizes]
+
+        def send_all():
+            for data in messages:
+                sender.send(data)
+        thread = threading.Thread(target=send_all)
+        thread.start()
+        for data in messages:
+            self.assertEqual(receiver.receive(), data)
+        thread.join()
+
+        sender.disconnect()
+        with self.assertRaises(RuntimeError):
+            receiver.receive()
+        receiver.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
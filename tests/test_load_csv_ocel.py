@@ -0,0 +1,51 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+
+import pandas as pd
+
+from misc.loadCSVocel import get_ocel_df
+from tests.socel_fixture import write_socel_csv
+
+
+class TestLoadCsvOcel(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_csv = os.path.join(self.tmpdir.name, "socel-csv")
+        write_socel_csv(self.path_csv)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lazy(self):
+        tables = get_ocel_df(self.path_csv)
+        self.assertEqual(tables.event_type_tables, ["event_Cut", "event_Pack"])
+        self.assertEqual(tables.object_type_tables, ["object_Box", "object_Part"])
+        self.assertEqual(tables.loaded(), [])
+        self.assertEqual(tables["event_object"].index.names, ["ocel_event_id", "ocel_object_id", "ocel_qualifier"])
+        self.assertEqual(tables.loaded(), ["event_object"])
+
+    def test_prefetch(self):
+        for use_cache in (False, True):
+            for compact in (False, True) if use_cache else (False,):
+                for processes in (False, True):
+                    with self.subTest(use_cache=use_cache, compact=compact, processes=processes):
+                        lazy = get_ocel_df(self.path_csv, use_cache, compact)
+                        prefetched = get_ocel_df(self.path_csv, use_cache, compact)
+                        prefetched.prefetch(max_workers=2, processes=processes)
+                        self.assertEqual(sorted(prefetched.loaded()), sorted(lazy))
+                        for name in lazy:
+                            pd.testing.assert_frame_equal(prefetched[name], lazy[name])
+                        if compact:
+                            self.assertEqual(prefetched.ids.ids.tolist(), lazy.ids.ids.tolist())
+
+    def test_prefetch_names(self):
+        tables = get_ocel_df(self.path_csv).prefetch(["event", "object"])
+        self.assertEqual(sorted(tables.loaded()), ["event", "object"])
+
+
+if __name__ == '__main__':
+    unittest.main()
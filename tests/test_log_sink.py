@@ -0,0 +1,137 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import cpn_api.connector as connector
+from cpn_api.log_sink import CsvLogSink, SqliteLogSink
+
+
+class TestLogSink(unittest.TestCase):
+
+    def setUp(self):
+        self.path_csv = tempfile.mkdtemp()
+        self.tables = {
+            "event": "ocel_id;ocel_type",
+            "event_Assemble": "ocel_id;ocel_time;s_co2e[kg]",
+            "event_map_type": "ocel_type;ocel_type_map",
+        }
+        for table, header in self.tables.items():
+            with open(os.path.join(self.path_csv, table + ".csv"), "w") as file:
+                file.write(header + "\n")
+        with open(os.path.join(self.path_csv, "event_map_type.csv"), "a") as file:
+            file.write("Assemble;Assemble\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.path_csv)
+
+    def read_lines(self, table):
+        with open(os.path.join(self.path_csv, table + ".csv")) as file:
+            return file.read().splitlines()[1:]
+
+    def test_csv_batches(self):
+        sink = CsvLogSink(self.path_csv, interval=60, max_rows=3)
+        sink.add("event", "e1;Assemble")
+        sink.add("event_Assemble", "e1;2024-01-01 00:00:00;?")
+        self.assertEqual(self.read_lines("event"), [])
+        sink.add("event", "e2;Assemble")
+        self.assertEqual(self.read_lines("event"), ["e1;Assemble", "e2;Assemble"])
+        sink.add("event", "e3;Assemble")
+        self.assertEqual(sink.close(), 4)
+        self.assertEqual(self.read_lines("event"), ["e1;Assemble", "e2;Assemble", "e3;Assemble"])
+        self.assertEqual(sink.flushes, 2)
+
+    def test_interval_flush(self):
+        sink = CsvLogSink(self.path_csv, interval=0.05, max_rows=100).start()
+        sink.add("event", "e1;Assemble")
+        deadline = time.time() + 5
+        while not self.read_lines("event") and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.read_lines("event"), ["e1;Assemble"])
+        sink.close()
+
+    def test_size_flush_in_background(self):
+        sink = CsvLogSink(self.path_csv, interval=60, max_rows=2).start()
+        threads = []
+        write = sink._write
+        with mock.patch.object(sink, "_write", side_effect=lambda buffers: (threads.append(
+                threading.current_thread().name), write(buffers))):
+            sink.add("event", "e1;Assemble")
+            sink.add("event", "e2;Assemble")
+            deadline = time.time() + 5
+            while not self.read_lines("event") and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.read_lines("event"), ["e1;Assemble", "e2;Assemble"])
+            self.assertEqual(threads, ["log-sink"])
+        sink.close()
+
+    def test_failed_flush_keeps_rows(self):
+        sink = CsvLogSink(self.path_csv, interval=60, max_rows=100)
+        sink.add("event", "e1;Assemble")
+        with mock.patch.object(CsvLogSink, "_write", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                sink.flush()
+        sink.add("event", "e2;Assemble")
+        sink.close()
+        self.assertEqual(self.read_lines("event"), ["e1;Assemble", "e2;Assemble"])
+
+    def test_failed_sqlite_flush_keeps_rows(self):
+        path_sqlite = os.path.join(self.path_csv, "log.sqlite")
+        sink = SqliteLogSink(self.path_csv, path_sqlite, interval=60, max_rows=100)
+        sink.add("event", "e1;Assemble")
+        sink.add("event_Assemble", "e1;2024-01-01 00:00:00;?")
+        header = sink._header
+        with mock.patch.object(sink, "_header", side_effect=[header("event"), OSError("disk full")]):
+            with self.assertRaises(OSError):
+                sink.flush()
+        # the rollback dropped the table created by the failed flush, the next flush creates it again
+        self.assertEqual(sink._columns, {})
+        sink.add("event", "e2;Assemble")
+        sink.add("event", "e3;Assemble;extra")
+        self.assertEqual(sink.close(), 4)
+        conn = sqlite3.connect(path_sqlite)
+        try:
+            self.assertEqual(conn.execute("SELECT ocel_id FROM event").fetchall(), [("e1",), ("e2",)])
+            self.assertEqual(conn.execute("SELECT ocel_id FROM event_Assemble").fetchall(), [("e1",)])
+        finally:
+            conn.close()
+
+    def test_invalid_table(self):
+        sink = CsvLogSink(self.path_csv, interval=60, max_rows=100)
+        with self.assertRaises(ValueError):
+            sink.add("../event", "e1;Assemble")
+
+    def test_sqlite(self):
+        path_sqlite = os.path.join(self.path_csv, "log.sqlite")
+        sink = SqliteLogSink(self.path_csv, path_sqlite, interval=60, max_rows=2)
+        sink.add("event", "e1;Assemble")
+        sink.add("event_Assemble", "e1;2024-01-01 00:00:00;?")
+        sink.add("event_Assemble", "e2;2024-01-01 00:00:01;1.5")
+        sink.close()
+        conn = sqlite3.connect(path_sqlite)
+        try:
+            self.assertEqual(conn.execute("SELECT * FROM event").fetchall(), [("e1", "Assemble")])
+            self.assertEqual(conn.execute('SELECT "s_co2e[kg]" FROM event_Assemble ORDER BY ocel_id').fetchall(),
+                             [(None,), (1.5,)])
+            self.assertEqual(conn.execute("SELECT * FROM event_map_type").fetchall(), [("Assemble", "Assemble")])
+        finally:
+            conn.close()
+
+    def test_handle_log(self):
+        sink = CsvLogSink(self.path_csv, interval=60, max_rows=100)
+        with mock.patch.object(connector, "log_sink", sink), mock.patch.object(connector, "logged_rows", 0):
+            connector.handle_log("log_v1%event%e1;Assemble%1")
+            self.assertEqual(connector.logged_rows, 1)
+            connector.close_log_sink()
+            self.assertIsNone(connector.log_sink)
+        self.assertEqual(self.read_lines("event"), ["e1;Assemble%1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
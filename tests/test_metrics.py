@@ -0,0 +1,78 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+import cpn_api.collector as collector
+import cpn_api.configurator as xml
+from cpn_api.metrics import Histogram, Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.metrics = Metrics(filepath=os.path.join(self.tmpdir.name, "metrics"), flush_interval=0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_histogram_quantile(self):
+        histogram = Histogram()
+        for _ in range(99):
+            histogram.observe(0.0002)
+        histogram.observe(0.3)
+        self.assertEqual(histogram.quantile(0.5), 0.00025)
+        self.assertEqual(histogram.quantile(0.99), 0.00025)
+        self.assertEqual(histogram.quantile(1.0), 0.3)
+        self.assertEqual(histogram.count, 100)
+
+    def test_get_co2e_instrumented(self):
+        xml.add_default_entry("id_default", 2.0)
+        with mock.patch.object(collector, "metrics", self.metrics):
+            collector.get_co2e("id_default", 1.0)
+            collector.get_co2e("id_default", 2.0)
+        self.assertEqual(self.metrics.tiers["default"], {"hit": 2, "miss": 0})
+        self.assertEqual(self.metrics.histograms[("resolve", "id_default")].count, 2)
+
+    def test_get_co2e_batch_instrumented(self):
+        xml.add_default_entry("id_default", 2.0)
+        xml.add_request_climatiq("id_api", {"weight": 1, "weight_unit": "kg"}, {"id": "factor_a"}, "weight")
+
+        def resolve_request_factors(pending):
+            time.sleep(0.01)
+            return {request_id: 0.5 for request_id in pending}
+
+        with mock.patch.object(collector, "metrics", self.metrics), \
+                mock.patch.object(collector, "factor_memo", collector.FactorMemo()), \
+                mock.patch.object(collector, "_resolve_request_factors", resolve_request_factors):
+            collector.get_co2e_batch([("id_default", 1.0), ("id_api", 1.0), ("id_default", 2.0)])
+        self.assertEqual(sorted(request_id for _, request_id in self.metrics.histograms), ["id_api", "id_default"])
+        self.assertEqual(self.metrics.histograms[("resolve", "id_default")].count, 1)
+        self.assertGreaterEqual(self.metrics.histograms[("resolve", "id_api")].sum, 0.01)
+
+    def test_flush(self):
+        self.metrics.observe("resolve", 'id_"quoted"', 0.001)
+        self.metrics.count_tier("memo", True)
+        self.metrics.count_message()
+        self.metrics.maybe_flush()
+
+        with open(self.metrics.filepath + ".json") as file:
+            snapshot = json.load(file)
+        self.assertEqual(snapshot["messages"], 1)
+        self.assertEqual(snapshot["tiers"]["memo"]["hit"], 1)
+        self.assertEqual(snapshot["latency"]["resolve"]['id_"quoted"']["count"], 1)
+
+        with open(self.metrics.filepath + ".prom") as file:
+            prom = file.read()
+        self.assertIn('cpn_api_latency_seconds_count{stage="resolve",request_id="id_\\"quoted\\""} 1', prom)
+        self.assertIn('cpn_api_latency_seconds_bucket{stage="resolve",request_id="id_\\"quoted\\"",le="+Inf"} 1', prom)
+        self.assertIn('cpn_api_tier_total{tier="memo",result="hit"} 1', prom)
+
+
+if __name__ == '__main__':
+    unittest.main()
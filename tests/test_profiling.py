@@ -0,0 +1,95 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import pstats
+import shutil
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import cpn_api.profiling as profiling
+from cpn_api.profiling import RunProfiler
+
+
+def fibonacci(n):
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+
+def allocate():
+    return [bytearray(1000) for _ in range(1000)]
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.path_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path_dir)
+        # started by the stages with memory=True, it would trace the rest of the test session
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def test_message_sampling(self):
+        profiler = RunProfiler(self.path_dir, sample_every=3, run_id="run")
+        with profiler.stage("mainloop", profile=False):
+            for _ in range(10):
+                with profiler.message():
+                    fibonacci(10)
+        stage = profiler.stages["mainloop"]
+        self.assertEqual((stage.messages, stage.sampled), (10, 3))
+        calls = [entry for func, entry in pstats.Stats(stage.profile).stats.items() if func[2] == "fibonacci"]
+        self.assertEqual(calls[0][1], 3 * 177) # 177 calls of fibonacci per fibonacci(10)
+
+    def test_message_threads(self):
+        profiler = RunProfiler(self.path_dir, sample_every=2, run_id="run")
+
+        def handle(_):
+            with profiler.message("server"):
+                return fibonacci(12)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(handle, range(40)))
+        stage = profiler.stages["server"]
+        self.assertEqual(stage.messages, 40)
+        self.assertGreater(stage.sampled, 0)
+        self.assertLessEqual(stage.sampled, 20) # samples due while another one runs are skipped
+        calls = [entry for func, entry in pstats.Stats(stage.profile).stats.items() if func[2] == "fibonacci"]
+        self.assertEqual(calls[0][1], stage.sampled * 465) # 465 calls of fibonacci per fibonacci(12)
+        self.assertFalse(profiler._profiling)
+
+    def test_write(self):
+        profiler = RunProfiler(self.path_dir, trace_memory=True, run_id="run")
+        with profiler.stage("xml_write", memory=True):
+            data = allocate()
+            with profiler.stage("inner"): # not profiled, cProfile can not nest
+                fibonacci(15)
+        paths = profiler.write()
+        self.assertEqual(sorted(os.path.basename(path) for path in paths),
+                         ["run-stages.txt", "run-xml_write.collapsed", "run-xml_write.prof"])
+        allocated, peak, top = profiler.stages["xml_write"].memory
+        self.assertGreater(allocated, len(data) * 1000)
+        self.assertGreaterEqual(peak, allocated)
+        with open(os.path.join(self.path_dir, "run-xml_write.collapsed")) as file:
+            stacks = dict(line.rsplit(" ", 1) for line in file.read().splitlines())
+        label = f"fibonacci (test_profiling.py:{fibonacci.__code__.co_firstlineno})"
+        self.assertTrue(any(stack.endswith(label) for stack in stacks))
+        self.assertTrue(all(int(value) > 0 for value in stacks.values()))
+        with open(os.path.join(self.path_dir, "run-stages.txt")) as file:
+            summary = file.read()
+        self.assertIn("xml_write", summary)
+        self.assertIn("inner", summary)
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {"CPN_API_PROFILE": "0"}):
+            self.assertFalse(profiling.profiling_enabled())
+        self.assertIsNone(profiling.profiler)
+        with profiling.stage("xml_write"), profiling.message():
+            pass
+        self.assertEqual(profiling.stop_profiling(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+from unittest import mock
+
+import misc.remap_cpn_tools_ids as remap
+from misc.remap_cpn_tools_ids import replace_cpn_ids, replace_ids
+
+
+# ids at the start and end, next to multi-byte characters and words that only look like ids
+MODEL = ('ID17<page id="ID10"><place id="ID2">Größe ID2 µID3</place><trans id="ID100"/>'
+         '<arc id="ID9" orientation="TtoP" IDs="ID10x" name="xID11">ID99</arc></page>\nID3')
+
+
+class TestRemapCpnToolsIds(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "model.cpn")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_model(self):
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(MODEL)
+
+    def read_model(self):
+        with open(self.path, encoding="utf-8") as file:
+            return file.read()
+
+    def test_numeric_order(self):
+        self.assertEqual(replace_ids("ID10 ID2 ID100 ID002"), "ID3 ID2 ID4 ID1")
+        self.assertEqual(remap.id_mapping([b"10", b"2", b"02"]), {b"02": b"ID1", b"2": b"ID2", b"10": b"ID3"})
+
+    def test_chunk_sizes(self):
+        expected = replace_ids(MODEL)
+        self.assertIn('<place id="ID1">Größe ID1 µID2</place>', expected)
+        self.assertIn('IDs="ID10x" name="xID11">ID6</arc>', expected)
+        for chunk_size in list(range(1, 20)) + [64, 1 << 20]:
+            with self.subTest(chunk_size=chunk_size):
+                self.write_model()
+                stats = replace_cpn_ids(self.path, chunk_size)
+                self.assertEqual(self.read_model(), expected)
+                self.assertEqual(stats["ids"], 7)
+                self.assertEqual(stats["bytes"], len(MODEL.encode("utf-8")))
+
+    def test_failed_write(self):
+        self.write_model()
+        with mock.patch.object(remap, "_remap_part", side_effect=KeyError("ID1")):
+            with self.assertRaises(KeyError):
+                replace_cpn_ids(self.path, 16)
+        self.assertEqual(self.read_model(), MODEL)
+        self.assertEqual(os.listdir(self.tmpdir.name), ["model.cpn"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+from unittest import mock
+
+import cpn_api.configurator as xml
+from cpn_api.metrics import metrics
+from cpn_api.replay import local_backend, replay, spawn_server
+from cpn_api.trace import TraceRecorder, read_trace
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.trace_path = os.path.join(self.tmpdir.name, "trace.txt.gz")
+        # the servers flush the global metrics on shutdown, keep them out of data/
+        patcher = mock.patch.object(metrics, "filepath", os.path.join(self.tmpdir.name, "metrics"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        xml.add_request_climatiq("id_replay_api", {"energy": 1, "energy_unit": "kWh"}, {"id": "factor_a"}, "energy")
+        xml.add_default_entry("id_replay_default", 0.5)
+
+        recorder = TraceRecorder(self.trace_path)
+        recorder.record("init")
+        for i in range(20):
+            recorder.record(f"call_v1%id_replay_api%{i}")
+            recorder.record(f"call_batch_v1%id_replay_default%{i}%id_replay_api%1")
+        recorder.record("close")
+        recorder.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_trace(self):
+        messages = [msg for _, _, msg in read_trace(self.trace_path)]
+        self.assertEqual(len(messages), 42)
+        self.assertEqual(messages[1], "call_v1%id_replay_api%0")
+
+    def test_replay(self):
+        for kind in ["mainloop", "async"]:
+            with local_backend(factors={"factor_a": 2.0}) as stub, spawn_server(kind) as port:
+                result = replay(self.trace_path, port=port)
+            self.assertEqual(result["messages"], 42, kind)
+            self.assertEqual(result["responses"], 41, kind)
+            self.assertEqual(stub.requests, 1, kind)
+
+
+if __name__ == '__main__':
+    unittest.main()
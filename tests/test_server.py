@@ -0,0 +1,132 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+import cpn_api.configurator as xml
+from cpn_api.metrics import metrics
+from cpn_api import profiling
+from cpn_api.profiling import RunProfiler
+from cpn_api.server import ConnectorServer
+from cpn_api.pycpn.pyCPN import PyCPN
+from cpn_api.pycpn.pyCPNEncodeDecode import stringEncode, stringDecode
+
+
+class TestConnectorServer(unittest.TestCase):
+
+    def setUp(self):
+        # the server flushes the global metrics on shutdown, keep them out of data/
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        patcher = mock.patch.object(metrics, "filepath", os.path.join(tmpdir.name, "metrics"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        xml.add_default_entry("id_default_a", 2.0)
+        xml.add_default_entry("id_default_b", 0.5)
+
+    def start_server(self, **kwargs):
+        server = ConnectorServer(port=0, prefetch=False, **kwargs)
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        self.assertTrue(server.started.wait(5))
+        return server, thread
+
+    def connect(self, server):
+        conn = PyCPN()
+        conn.connect('127.0.0.1', server.port)
+        conn.send(stringEncode("init"))
+        self.assertEqual(stringDecode(conn.receive()), "confirmed")
+        return conn
+
+    def test_concurrent_clients(self):
+        server, thread = self.start_server(exit_on_close=False)
+        results = {}
+
+        def client(client_no):
+            conn = self.connect(server)
+            responses = []
+            for i in range(50):
+                conn.send(stringEncode(f"call_v1%id_default_a%{client_no + i}"))
+                responses.append(stringDecode(conn.receive()))
+            conn.send(stringEncode(f"call_batch_v1%id_default_a%{client_no}%id_default_b%{client_no}"))
+            responses.append(stringDecode(conn.receive()))
+            conn.send(stringEncode("close"))
+            conn.disconnect()
+            results[client_no] = responses
+
+        clients = [threading.Thread(target=client, args=(client_no,)) for client_no in range(4)]
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join(10)
+
+        for client_no, responses in results.items():
+            self.assertEqual(responses[:50], [str(2.0 * (client_no + i)) for i in range(50)])
+            self.assertEqual(responses[50], f"{2.0 * client_no}%{0.5 * client_no}")
+        self.assertEqual(len(results), 4)
+
+        server.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_exit_on_close(self):
+        server, thread = self.start_server()
+        conn1 = self.connect(server)
+        conn2 = self.connect(server)
+        conn1.send(stringEncode("close"))
+        conn1.disconnect()
+        conn2.send(stringEncode("call_v1%id_default_b%3"))
+        self.assertEqual(stringDecode(conn2.receive()), "1.5")
+        conn2.send(stringEncode("close"))
+        conn2.disconnect()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_profiled_calls(self):
+        profiler = RunProfiler(tempfile.mkdtemp(), sample_every=5, run_id="run")
+        self.addCleanup(shutil.rmtree, profiler.path_dir)
+        with mock.patch.object(profiling, "profiler", profiler):
+            server, thread = self.start_server(exit_on_close=True)
+            conn = self.connect(server)
+            for i in range(10):
+                conn.send(stringEncode(f"call_v1%id_default_a%{i}"))
+                conn.receive()
+            conn.send(stringEncode("close"))
+            conn.disconnect()
+            thread.join(5)
+        stage = profiler.stages["server"]
+        self.assertEqual((stage.messages, stage.sampled), (10, 2))
+        # profiled in the executor thread
+        self.assertIn("handle_call", [func[2] for func in pstats.Stats(stage.profile).stats])
+
+    def test_stop_during_call(self):
+        called = threading.Event()
+        release = threading.Event()
+
+        def slow_call(msg):
+            called.set()
+            release.wait(5)
+            return "1.0"
+
+        server, thread = self.start_server(exit_on_close=False)
+        conn = self.connect(server)
+        with mock.patch("cpn_api.server.handle_call", slow_call), self.assertNoLogs("asyncio", "ERROR"):
+            conn.send(stringEncode("call_v1%id_default_a%1"))
+            self.assertTrue(called.wait(5))
+            server.stop()
+            # the server waits for the running call without blocking its loop
+            thread.join(0.5)
+            self.assertTrue(thread.is_alive())
+            release.set()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        conn.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
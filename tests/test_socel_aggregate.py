@@ -0,0 +1,93 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from misc.socel_aggregate import IndicatorTimeline, build_indicator_frame
+
+
+def random_frame(seed=0, rows=5000):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2023-04-03 07:00:00")
+    return pd.DataFrame({
+        "time": start + pd.to_timedelta(rng.integers(0, 8 * 3600, rows), unit="s"),
+        "event_type": pd.Categorical(rng.choice(["Cut", "Heat", "Pack"], rows)),
+        "indicator": pd.Categorical(rng.choice(["s_co2e[kg]", "i_electric[kWh]"], rows)),
+        # values of very different magnitude, a sum over all groups loses the digits of the small ones
+        "value": np.where(rng.random(rows) < 0.5, rng.random(rows) * 1e6, rng.random(rows) * 1e-3),
+    })
+
+
+class TestIndicatorTimeline(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = random_frame()
+        self.timeline = IndicatorTimeline(self.frame)
+
+    def expected(self, indicator, t0, t1, resolution):
+        rows = self.frame.loc[(self.frame["indicator"] == indicator) & (self.frame["time"] >= t0)
+                              & (self.frame["time"] < t1)]
+        buckets = t0 + ((rows["time"] - t0) // pd.Timedelta(resolution)) * pd.Timedelta(resolution)
+        return rows.groupby([buckets, "event_type"], observed=True)["value"].sum().unstack(fill_value=0.0)
+
+    def test_window_totals(self):
+        t0, t1 = pd.Timestamp("2023-04-03 08:00:00"), pd.Timestamp("2023-04-03 13:30:00")
+        for indicator in ["s_co2e[kg]", "i_electric[kWh]"]:
+            with self.subTest(indicator=indicator):
+                totals = self.timeline.totals(indicator, t0, t1, "1h")
+                expected = self.expected(indicator, t0, t1, "1h").reindex(
+                    index=totals.index, columns=totals.columns, fill_value=0.0)
+                np.testing.assert_allclose(totals.to_numpy(), expected.to_numpy(), rtol=1e-12, atol=1e-12)
+
+    def test_small_group_precision(self):
+        # Heat is sorted after the large values of Cut, its total is not a difference of their running totals
+        rng = np.random.default_rng(1)
+        frame = pd.DataFrame({
+            "time": pd.Timestamp("2023-04-03") + pd.to_timedelta(np.arange(2000), unit="s"),
+            "event_type": pd.Categorical(["Cut"] * 1000 + ["Heat"] * 1000),
+            "indicator": pd.Categorical(["s_co2e[kg]"] * 2000),
+            "value": np.concatenate([rng.random(1000) * 1e7, rng.random(1000) * 1e-3]),
+        })
+        timeline = IndicatorTimeline(frame)
+        expected = frame.loc[frame["event_type"] == "Heat", "value"].sum()
+        self.assertAlmostEqual(timeline.total("s_co2e[kg]", event_types=["Heat"]) / expected, 1.0, places=12)
+
+    def test_event_type_filter(self):
+        total = self.timeline.total("s_co2e[kg]", event_types=["Cut", "Pack"])
+        rows = self.frame.loc[(self.frame["indicator"] == "s_co2e[kg]")
+                              & self.frame["event_type"].isin(["Cut", "Pack"])]
+        self.assertAlmostEqual(total / rows["value"].sum(), 1.0, places=12)
+        totals = self.timeline.totals("s_co2e[kg]", event_types=["Pack", "Unknown"])
+        self.assertEqual(list(totals.columns), ["Pack", "Unknown"])
+        self.assertEqual(totals["Unknown"].iloc[0], 0.0)
+
+    def test_summary(self):
+        summary = self.timeline.summary()
+        expected = self.frame.groupby(["event_type", "indicator"], observed=True)["value"].sum().unstack()
+        expected = expected.reindex(index=summary.index, columns=summary.columns)
+        np.testing.assert_allclose(summary.to_numpy(), expected.to_numpy(), rtol=1e-12)
+
+    def test_inverted_window(self):
+        t0, t1 = pd.Timestamp("2023-04-03 12:00:00"), pd.Timestamp("2023-04-03 09:00:00")
+        for resolution in [None, "1h"]:
+            with self.subTest(resolution=resolution):
+                with self.assertRaisesRegex(ValueError, "before its start"):
+                    self.timeline.totals("s_co2e[kg]", t0, t1, resolution)
+        with self.assertRaises(ValueError):
+            self.timeline.total("s_co2e[kg]", t1=self.timeline.start - pd.Timedelta(1, "s"))
+        self.assertEqual(self.timeline.total("s_co2e[kg]", t0, t0), 0.0)
+
+    def test_empty(self):
+        timeline = IndicatorTimeline(build_indicator_frame({}))
+        self.assertIsNone(timeline.start)
+        self.assertEqual(len(timeline.totals("s_co2e[kg]", event_types=["Cut"])), 0)
+        self.assertEqual(timeline.total("s_co2e[kg]"), 0.0)
+        self.assertTrue(timeline.summary().empty)
+        totals = timeline.totals("s_co2e[kg]", "2023-04-03", "2023-04-04", "6h", event_types=["Cut"])
+        self.assertEqual(totals["Cut"].tolist(), [0.0] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
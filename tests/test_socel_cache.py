@@ -0,0 +1,64 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+
+from misc.socel_cache import CACHE_DIRNAME, CACHE_FORMAT, clear_cache, load_table
+from tests.socel_fixture import TABLES, write_socel_csv
+
+
+class TestSocelCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_csv = os.path.join(self.tmpdir.name, "socel-csv")
+        self.path = os.path.join(self.path_csv, "event_Cut.csv")
+        self.path_data = os.path.join(self.path_csv, CACHE_DIRNAME, f"event_Cut.{CACHE_FORMAT}")
+        write_socel_csv(self.path_csv)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def rewrite(self, lines):
+        stat = os.stat(self.path)
+        write_socel_csv(self.path_csv, {"event_Cut": lines})
+        # a later mtime even if the file system has a coarse timestamp resolution
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def test_rebuild_on_change(self):
+        self.assertEqual(load_table(self.path)["p_duration[s]"].tolist(), [5.0, 6.5])
+        self.assertTrue(os.path.exists(self.path_data))
+        with self.assertNoLogs("misc.socel_cache", "DEBUG"): # served from the cache
+            load_table(self.path)
+
+        self.rewrite(TABLES["event_Cut"] + ["e4;2023-04-03 08:00:20;7.0;?"]) # size changes
+        self.assertEqual(load_table(self.path)["p_duration[s]"].tolist(), [5.0, 6.5, 7.0])
+
+        self.rewrite(TABLES["event_Cut"] + ["e4;2023-04-03 08:00:20;8.0;?"]) # same size, mtime changes
+        self.assertEqual(load_table(self.path)["p_duration[s]"].tolist(), [5.0, 6.5, 8.0])
+
+    def test_corrupt_cache(self):
+        load_table(self.path)
+        with open(self.path_data, "wb") as file:
+            file.write(b"not a cache entry")
+        with self.assertLogs("misc.socel_cache", "WARNING") as logs:
+            table = load_table(self.path)
+        self.assertIn("rebuilding", logs.output[0])
+        self.assertEqual(table["ocel_id"].tolist(), ["e1", "e3"])
+        with self.assertNoLogs("misc.socel_cache", "WARNING"): # the rebuilt entry is readable
+            self.assertEqual(load_table(self.path)["ocel_id"].tolist(), ["e1", "e3"])
+
+    def test_clear_cache(self):
+        self.assertEqual(clear_cache(self.path_csv), 0)
+        load_table(self.path)
+        load_table(os.path.join(self.path_csv, "event.csv"))
+        self.assertEqual(clear_cache(self.path_csv), 4) # data and stamp per table
+        self.assertEqual(os.listdir(os.path.join(self.path_csv, CACHE_DIRNAME)), [])
+        with self.assertLogs("misc.socel_cache", "DEBUG") as logs:
+            load_table(self.path)
+        self.assertIn("rebuilt", logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
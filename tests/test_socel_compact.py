@@ -0,0 +1,76 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from misc.loadCSVocel import get_ocel_df
+from misc.socel_cache import ID_COLUMNS
+from misc.socel_compact import MISSING_CODE, IdDictionary, _float32_allowed
+from tests.socel_fixture import write_socel_csv
+
+
+class TestIdDictionary(unittest.TestCase):
+
+    def test_roundtrip(self):
+        ids = IdDictionary(["e2", "e1", "o1", "e1"])
+        self.assertEqual(ids.ids.tolist(), ["e2", "e1", "o1"])
+        codes = ids.encode(["o1", "x10", "e2", None, "x9", "größe"])
+        self.assertEqual(codes.dtype, np.int32)
+        self.assertEqual(codes.tolist(), [2, 3, 0, MISSING_CODE, 4, 5])
+        self.assertEqual(ids.decode(codes).tolist(), ["o1", "x10", "e2", None, "x9", "größe"])
+        self.assertEqual(ids.encode(["x9", "x10"]).tolist(), [4, 3]) # codes are never reassigned
+        self.assertEqual(len(ids), 6)
+
+    def test_unknown_ids(self):
+        ids = IdDictionary(["e1"])
+        self.assertEqual(ids.encode(["e1", "e2"], add=False).tolist(), [0, MISSING_CODE])
+        self.assertEqual(len(ids), 1)
+        self.assertEqual(ids.decode([MISSING_CODE, 0]).tolist(), [None, "e1"])
+        self.assertEqual(IdDictionary().encode(["e1"], add=False).tolist(), [MISSING_CODE])
+        self.assertEqual(IdDictionary().decode([MISSING_CODE]).tolist(), [None])
+
+
+class TestCompactTables(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_csv = os.path.join(self.tmpdir.name, "socel-csv")
+        write_socel_csv(self.path_csv)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_float32_allowed(self):
+        self.assertTrue(_float32_allowed(np.array([0.1, 1.25, 2.5e6, np.nan])))
+        self.assertTrue(_float32_allowed(np.array([np.nan])))
+        self.assertFalse(_float32_allowed(np.array([0.1, 1e39]))) # beyond the float32 range
+        self.assertFalse(_float32_allowed(np.array([1.0, 1e-46]))) # flushed to 0
+        self.assertFalse(_float32_allowed(np.array([0.1]), rtol=1e-9))
+
+    def test_compact_table(self):
+        tables = get_ocel_df(self.path_csv)
+        compact = get_ocel_df(self.path_csv, compact=True).prefetch()
+        self.assertEqual(sorted(compact), sorted(tables))
+        for name in tables:
+            with self.subTest(table=name):
+                expected, table = tables[name].reset_index(), compact[name].reset_index()
+                self.assertEqual(table.columns.tolist(), expected.columns.tolist())
+                for column in expected.columns:
+                    if column in ID_COLUMNS:
+                        self.assertEqual(table[column].dtype, np.int32)
+                        self.assertEqual(compact.ids.decode(table[column]).tolist(), expected[column].tolist())
+                    elif pd.api.types.is_float_dtype(expected[column].dtype):
+                        self.assertEqual(table[column].dtype, np.float32)
+                        np.testing.assert_allclose(table[column], expected[column], rtol=1e-6)
+                    else:
+                        self.assertEqual(table[column].astype(object).tolist(),
+                                         expected[column].astype(object).tolist())
+        self.assertEqual(compact["event_Cut"]["s_co2e[kg]"].isna().tolist(), [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+
+from misc.socel_lineage import LineageIndex
+from tests.socel_fixture import TABLES, write_socel_csv
+
+
+# e1 cuts o1 into o2 and o3, e2 packs o2 into b1, e3 works on o3 without an output. o2 is also "created from" o1,
+# a duplicate of the e2o edge.
+LINEAGE = {
+    "event_Cut": TABLES["event_Cut"][:2] + ["e3;2023-04-03 08:00:10;6.5;0.3"],
+    "object": TABLES["object"] + ["o3;Part"],
+    "object_Part": TABLES["object_Part"] + ["o3;2023-04-03 08:00:00;;0.2;0.4"],
+    "event_object": [
+        "ocel_event_id;ocel_object_id;ocel_qualifier",
+        "e1;o1;input",
+        "e1;o2;output",
+        "e1;o3;output",
+        "e2;o2;input",
+        "e2;b1;output",
+        "e3;o3;on",
+    ],
+    "object_object": TABLES["object_object"] + ["o2;o1;created from"],
+}
+# s_co2e[kg] of the objects (last values o1 2.5, o2 1.5, o3 0.4) and of the events (1.25, 0.5, 0.3)
+TOTAL_CO2E = 2.5 + 1.5 + 0.4 + 1.25 + 0.5 + 0.3
+
+
+class TestSocelLineage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_csv = os.path.join(self.tmpdir.name, "socel-csv")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def index(self, tables=None):
+        write_socel_csv(self.path_csv, dict(LINEAGE, **(tables or {})))
+        return LineageIndex.from_csv(self.path_csv, use_cache=False)
+
+    @staticmethod
+    def related(pairs):
+        return {(row.ocel_id, row.related_id) for row in pairs.itertuples()}
+
+    def test_ancestors_descendants(self):
+        index = self.index()
+        self.assertEqual(self.related(index.ancestors(["b1", "o3", "unknown"])),
+                         {("b1", "o2"), ("b1", "o1"), ("o3", "o1")})
+        self.assertEqual(self.related(index.descendants(["o1"])), {("o1", "o2"), ("o1", "o3"), ("o1", "b1")})
+        self.assertTrue(index.ancestors(["o1"]).empty)
+        # the duplicate o2 <- o1 edge is stored once
+        self.assertEqual(index.parents.neighbors(index.codes(["o2"])[0]).tolist(), index.codes(["o1"]).tolist())
+
+    def test_direct_footprint(self):
+        index = self.index()
+        direct = dict(zip(index.object_ids, index.direct_footprint()))
+        # e1 is split equally between its outputs, e3 goes to its "on" object
+        self.assertEqual(direct, {"o1": 2.5, "o2": 1.5 + 0.625, "b1": 0.5, "o3": 0.4 + 0.625 + 0.3})
+
+    def test_rollup(self):
+        for o3_mass, o3_share in [("0.2", 0.25), ("", 0.5)]: # by mass next to o2 (0.6), equal if a mass is missing
+            with self.subTest(o3_mass=o3_mass):
+                index = self.index({"object_Part": TABLES["object_Part"] + [f"o3;2023-04-03 08:00:00;;{o3_mass};0.4"]})
+                rollup = index.rollup()
+                self.assertEqual(sorted(rollup.index), ["b1", "o3"])
+                self.assertAlmostEqual(rollup["total_co2e"].sum(), TOTAL_CO2E)
+                self.assertAlmostEqual(rollup.loc["o3", "total_co2e"], 1.325 + o3_share * 2.5)
+                # b1 has no mass, it is the only child of o2 and gets its whole footprint
+                self.assertAlmostEqual(rollup.loc["b1", "total_co2e"], 0.5 + 2.125 + (1 - o3_share) * 2.5)
+        self.assertEqual(index.rollup(["Part"]).index.tolist(), ["o1", "o2", "o3"])
+
+    def test_cycle(self):
+        index = self.index({"object_object": LINEAGE["object_object"] + ["o1;b1;created from"]})
+        with self.assertRaisesRegex(ValueError, "cycle"):
+            index.rollup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pm4py
+
+from misc.socel_ocel import build_ocel, load_snapshot, read_socel_ocel, save_snapshot
+from misc.loadCSVocel import get_ocel_df
+from misc.socel_xml_writer import write_socel_xml
+from tests.socel_fixture import write_socel_csv
+
+
+FRAMES = ["events", "objects", "relations", "object_changes", "o2o"]
+
+
+class TestSocelOcel(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_csv = os.path.join(self.tmpdir.name, "socel-csv")
+        write_socel_csv(self.path_csv)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assertFrameEqual(self, expected, actual):
+        # unknown values ("?") are NA in the built OCEL, column order and dtypes follow the columnar cache
+        expected = expected.replace("?", np.nan).reset_index(drop=True)
+        actual = actual[expected.columns].reset_index(drop=True)
+        for column in actual.columns:
+            if isinstance(actual[column].dtype, pd.CategoricalDtype):
+                actual[column] = actual[column].astype(object)
+            elif pd.api.types.is_numeric_dtype(actual[column]):
+                expected[column] = pd.to_numeric(expected[column])
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+    def test_build_equals_read_ocel2_xml(self):
+        path_xml = os.path.join(self.tmpdir.name, "socel.xml")
+        write_socel_xml(self.path_csv, path_xml)
+        expected = pm4py.read_ocel2_xml(path_xml)
+        ocel = read_socel_ocel(self.path_csv, snapshot=False)
+        for frame in FRAMES:
+            with self.subTest(frame=frame):
+                self.assertFrameEqual(getattr(expected, frame), getattr(ocel, frame))
+        self.assertEqual(ocel.object_changes["ocel:oid"].tolist(), ["o1", "o1", "o1", "o2"])
+        self.assertEqual(ocel.object_changes["ocel:field"].tolist(),
+                         ["p_mass[kg]", "p_mass[kg]", "s_co2e[kg]", "s_co2e[kg]"])
+
+    def test_without_event_object(self):
+        os.remove(os.path.join(self.path_csv, "event_object.csv"))
+        ocel = build_ocel(get_ocel_df(self.path_csv, use_cache=False).prefetch())
+        self.assertEqual(len(ocel.relations), 0)
+        self.assertEqual(len(ocel.events), 3)
+        self.assertEqual(len(ocel.objects), 3)
+
+    def test_snapshot_round_trip(self):
+        ocel = read_socel_ocel(self.path_csv, snapshot=False)
+        path = os.path.join(self.tmpdir.name, "ocel.snapshot")
+        self.assertGreater(save_snapshot(ocel, path), 0)
+        loaded = load_snapshot(path)
+        for frame in FRAMES:
+            with self.subTest(frame=frame):
+                pd.testing.assert_frame_equal(getattr(ocel, frame), getattr(loaded, frame))
+
+    def test_read_from_snapshot(self):
+        ocel = read_socel_ocel(self.path_csv)
+        cache_dir = os.path.join(self.path_csv, ".cache")
+        snapshots = [fn for fn in os.listdir(cache_dir) if fn.endswith(".snapshot")]
+        self.assertEqual(len(snapshots), 1)
+        pd.testing.assert_frame_equal(ocel.events, read_socel_ocel(self.path_csv).events)
+        # a changed table gets a new snapshot, the old one is removed
+        with open(os.path.join(self.path_csv, "event_Cut.csv"), "a") as file:
+            file.write("e4;2023-04-03 08:00:20;1.0;?\n")
+        read_socel_ocel(self.path_csv)
+        self.assertNotEqual([fn for fn in os.listdir(cache_dir) if fn.endswith(".snapshot")], snapshots)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import sqlite3
+import tempfile
+
+from misc.socel_sqlite_writer import write_socel_sqlite
+from tests.socel_fixture import TABLES, write_socel_csv
+
+
+class TestSocelSqliteWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_csv = os.path.join(self.tmpdir.name, "socel-csv")
+        self.path_sqlite = os.path.join(self.tmpdir.name, "socel.sqlite")
+        write_socel_csv(self.path_csv)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write(self):
+        counts = write_socel_sqlite(self.path_csv, self.path_sqlite)
+        self.assertEqual(counts["event_object"], 4)
+        self.assertEqual(counts["object_Part"], 6)
+        conn = sqlite3.connect(self.path_sqlite)
+        try:
+            self.assertEqual(conn.execute('SELECT "s_co2e[kg]" FROM event_Cut ORDER BY ocel_id').fetchall(),
+                             [(1.25,), (None,)])
+        finally:
+            conn.close()
+
+    def test_row_length(self):
+        for row in ["e4;2023-04-03 08:00:20;1.0", "e4;2023-04-03 08:00:20;1.0;?;extra"]:
+            with self.subTest(row=row):
+                write_socel_csv(self.path_csv, {"event_Cut": TABLES["event_Cut"] + [row]})
+                with self.assertRaisesRegex(ValueError, r"event_Cut\.csv, line 4: \d values instead of 4"):
+                    write_socel_sqlite(self.path_csv, self.path_sqlite)
+                self.assertFalse(os.path.exists(self.path_sqlite))
+
+
+if __name__ == '__main__':
+    unittest.main()
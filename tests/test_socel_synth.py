@@ -0,0 +1,52 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+
+import pandas as pd
+
+from misc.socel_synth import SocelModel, write_synthetic_socel
+from tests.socel_fixture import TABLES, write_socel_csv
+
+
+def renumbered(lines):
+    # e1, e2, e3 -> e0, e1, e2
+    return [line.replace("e1", "e0").replace("e2", "e1").replace("e3", "e2") for line in lines]
+
+
+class TestSocelSynth(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_source = os.path.join(self.tmpdir.name, "source")
+        self.path_out = os.path.join(self.tmpdir.name, "out")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_ids(self, table, column="ocel_id"):
+        return pd.read_csv(os.path.join(self.path_out, table + ".csv"), sep=";", dtype=str)[column].tolist()
+
+    def test_ids_from_zero(self):
+        write_socel_csv(self.path_source, {table: renumbered(TABLES[table])
+                                           for table in ["event", "event_Cut", "event_Pack", "event_object"]})
+        model = SocelModel(self.path_source)
+        self.assertEqual(model.id_offsets["e"], 3)
+        write_synthetic_socel(self.path_source, self.path_out, 3, model=model)
+        events = self.read_ids("event")
+        self.assertEqual(len(events), 9)
+        self.assertEqual(len(set(events)), 9)
+        self.assertEqual(sorted(events, key=lambda event_id: int(event_id[1:])), [f"e{n}" for n in range(9)])
+        self.assertEqual(sorted(set(self.read_ids("event_object", "ocel_event_id"))), sorted(events))
+
+    def test_ids_from_one(self):
+        write_socel_csv(self.path_source)
+        write_synthetic_socel(self.path_source, self.path_out, 2)
+        self.assertEqual(self.read_ids("event"), ["e1", "e2", "e3", "e4", "e5", "e6"])
+        objects = self.read_ids("object")
+        self.assertEqual(len(set(objects)), len(objects))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from misc.socel_tail_export import SocelTailExporter
+from tests.socel_fixture import TABLES, write_socel_csv
+
+
+class TestSocelTailExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_csv = os.path.join(self.tmpdir.name, "socel-csv")
+        self.path_sqlite = os.path.join(self.tmpdir.name, "socel.sqlite")
+        write_socel_csv(self.path_csv)
+        self.exporter = SocelTailExporter(self.path_csv, self.path_sqlite, interval=60)
+
+    def tearDown(self):
+        if self.exporter._conn is not None:
+            self.exporter._conn.close()
+        self.tmpdir.cleanup()
+
+    def append(self, table, text):
+        with open(os.path.join(self.path_csv, table + ".csv"), "a") as file:
+            file.write(text)
+
+    def ids(self, table, column="ocel_id"):
+        conn = sqlite3.connect(self.path_sqlite)
+        try:
+            return [row[0] for row in conn.execute(f'SELECT "{column}" FROM {table} ORDER BY rowid')]
+        finally:
+            conn.close()
+
+    def test_append(self):
+        self.assertEqual(self.exporter.poll(), sum(len(lines) - 1 for lines in TABLES.values()))
+        self.assertEqual(self.exporter.poll(), 0)
+        # only complete lines are appended, the rest follows with the next poll
+        self.append("event", "e4;Cut\ne5;Pa")
+        self.assertEqual(self.exporter.poll(), 1)
+        self.assertEqual(self.ids("event"), ["e1", "e2", "e3", "e4"])
+        self.append("event", "ck\n")
+        self.assertEqual(self.exporter.poll(), 1)
+        self.assertEqual(self.ids("event"), ["e1", "e2", "e3", "e4", "e5"])
+
+    def test_malformed_line(self):
+        self.exporter.poll()
+        self.append("event", "e4;Cut;extra\ne5;Pack\n")
+        with self.assertLogs("misc.socel_tail_export", "WARNING") as logs:
+            self.assertEqual(self.exporter.poll(), 1)
+        self.assertIn("event.csv, line 5: 3 values instead of 2", logs.output[0])
+        self.append("event", "e6\ne7;Cut\n")
+        with self.assertLogs("misc.socel_tail_export", "WARNING") as logs:
+            self.assertEqual(self.exporter.poll(), 1)
+        self.assertIn("event.csv, line 7: 1 values instead of 2", logs.output[0])
+        self.assertEqual(self.ids("event"), ["e1", "e2", "e3", "e5", "e7"])
+
+    def test_rewrite(self):
+        self.exporter.poll()
+        # truncated to the header and new rows, as by create_logs at the start of the next run
+        write_socel_csv(self.path_csv, {"event": ["ocel_id;ocel_type", "f1;Cut"]})
+        self.exporter.poll()
+        self.assertEqual(self.ids("event"), ["f1"])
+        # rewritten with the same length: detected by the bytes before the offset
+        write_socel_csv(self.path_csv, {"event": ["ocel_id;ocel_type", "g1;Cut"]})
+        self.assertEqual(self.exporter.poll(), 1)
+        self.assertEqual(self.ids("event"), ["g1"])
+        self.assertEqual(self.ids("event_object", "ocel_event_id"), ["e1", "e2", "e2", "e3"])
+
+    def test_failed_poll(self):
+        self.exporter.poll()
+        self.append("event", "e4;Cut\n")
+        self.append("object", "o3;Part\n")
+        poll_file = SocelTailExporter._poll_file
+
+        def failing_poll_file(exporter, fn):
+            if fn == "object.csv":
+                raise sqlite3.OperationalError("disk I/O error")
+            return poll_file(exporter, fn)
+
+        with mock.patch.object(SocelTailExporter, "_poll_file", failing_poll_file):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.exporter.poll()
+        # the transaction and the offsets are rolled back, the next poll appends the rows exactly once
+        self.assertEqual(self.ids("event"), ["e1", "e2", "e3"])
+        self.assertEqual(self.exporter.poll(), 2)
+        self.assertEqual(self.ids("event"), ["e1", "e2", "e3", "e4"])
+        self.assertEqual(self.ids("object"), ["o1", "o2", "b1", "o3"])
+
+    def test_failed_first_poll(self):
+        with mock.patch.object(SocelTailExporter, "_poll_file", side_effect=sqlite3.OperationalError("locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.exporter.poll()
+        self.assertEqual(self.exporter._states, {})
+        self.assertEqual(self.exporter.stop(), sum(len(lines) - 1 for lines in TABLES.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
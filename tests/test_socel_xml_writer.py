@@ -0,0 +1,74 @@
+import cpn_api_start # enables logging while testing
+
+import unittest
+import os
+import tempfile
+
+import pm4py
+
+from misc.socel_xml_writer import write_socel_xml
+from tests.socel_fixture import TABLES, write_socel_csv
+
+
+class TestSocelXmlWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_csv = os.path.join(self.tmpdir.name, "socel-csv")
+        write_socel_csv(self.path_csv)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name):
+        path_xml = os.path.join(self.tmpdir.name, name)
+        counts = write_socel_xml(self.path_csv, path_xml)
+        with open(path_xml) as file:
+            return counts, file.read()
+
+    def test_read_ocel2_xml(self):
+        counts, _ = self.write("socel.xml")
+        self.assertEqual(counts, (3, 3))
+        ocel = pm4py.read_ocel2_xml(os.path.join(self.tmpdir.name, "socel.xml"))
+        self.assertEqual(ocel.events["ocel:eid"].tolist(), ["e1", "e2", "e3"])
+        self.assertEqual(ocel.events["ocel:activity"].tolist(), ["Cut", "Pack", "Cut"])
+        self.assertEqual(ocel.objects["ocel:oid"].tolist(), ["o1", "o2", "b1"])
+        self.assertEqual(ocel.objects["p_material"].tolist()[2], "cardboard")
+        self.assertEqual(list(zip(ocel.relations["ocel:eid"], ocel.relations["ocel:oid"],
+                                  ocel.relations["ocel:qualifier"])),
+                         [("e1", "o1", "input"), ("e2", "o1", "input"), ("e2", "b1", "output"),
+                          ("e3", "o2", "input")])
+        self.assertEqual(ocel.o2o.values.tolist(), [["o1", "b1", "packed in"]])
+        changes = ocel.object_changes.sort_values(["ocel:oid", "ocel:timestamp"])
+        self.assertEqual(changes["ocel:field"].tolist(), ["p_mass[kg]", "s_co2e[kg]", "p_mass[kg]", "s_co2e[kg]"])
+
+    def test_out_of_order_fallback(self):
+        _, expected = self.write("in-order.xml")
+        event_object = TABLES["event_object"]
+        object_part = TABLES["object_Part"]
+        # e3 and the initial row of o2 before the rows of e1 and o1, the order within an id is kept
+        write_socel_csv(self.path_csv, {
+            "event_object": event_object[:1] + event_object[4:] + event_object[1:4],
+            "object_Part": object_part[:1] + object_part[2:3] + object_part[1:2] + object_part[3:],
+        })
+        with self.assertLogs("misc.socel_xml_writer", "WARNING") as logs:
+            counts, xml = self.write("out-of-order.xml")
+        self.assertIn("not in log order", logs.output[0])
+        self.assertEqual(counts, (3, 3))
+        self.assertEqual(xml, expected)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "out-of-order.xml.tmp")))
+
+    def test_event_without_type_row(self):
+        _, expected = self.write("socel.xml")
+        # event.csv written, the row of event_Cut lost in a crash
+        write_socel_csv(self.path_csv, {"event": TABLES["event"] + ["e4;Cut"]})
+        with self.assertLogs("misc.socel_xml_writer", "WARNING"):
+            with self.assertRaisesRegex(ValueError, "event_Cut.csv: no row for event e4"):
+                write_socel_xml(self.path_csv, os.path.join(self.tmpdir.name, "socel.xml"))
+        with open(os.path.join(self.tmpdir.name, "socel.xml")) as file:
+            self.assertEqual(file.read(), expected)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "socel.xml.tmp")))
+
+
+if __name__ == '__main__':
+    unittest.main()